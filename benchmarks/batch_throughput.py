@@ -0,0 +1,52 @@
+"""Batch throughput of arun_batch vs max_concurrency with a stub LLM.
+
+Answers the same set of questions with max_concurrency from 1 (one question
+at a time, as a loop over /sql would) up to past the llm_concurrency cap, and
+reports questions per second and the speedup over the sequential run. Caches
+and the local responder are disabled so every question pays for both LLM
+calls and a query.
+
+Needs the local Postgres from database/database.ini.
+
+Run from the repository root:
+    python -m benchmarks.batch_throughput [latency_seconds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")  # ChatOpenAI refuses to construct without one
+
+import main
+from benchmarks.stub_llm import StubChatModel
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32]
+QUESTIONS = 64
+
+
+async def run(latency: float):
+    main.llm = StubChatModel(latency=latency)
+    main.sql_cache.enabled = False
+    main.result_cache.enabled = False
+    main.responder.policy = "off"
+    main.get_workflow()
+    questions = [f"How many films are there? ({i})" for i in range(QUESTIONS)]
+    print(f"Stub LLM latency: {latency * 1000:.0f} ms per call, {QUESTIONS} questions, "
+          f"llm_concurrency={main.llm_concurrency}, db_concurrency={main.db_concurrency}")
+    print(f"{'concurrency':>11} {'seconds':>8} {'q/s':>7} {'speedup':>8} {'errors':>7} {'peak LLM':>9}")
+    baseline = None
+    for concurrency in CONCURRENCY_LEVELS:
+        main.llm_limit.stats["peak_active"] = 0
+        start = time.perf_counter()
+        results = await main.arun_batch(questions, max_concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+        throughput = len(results) / elapsed
+        baseline = baseline or throughput
+        errors = sum(1 for r in results if r["error"])
+        print(f"{concurrency:>11} {elapsed:>8.2f} {throughput:>7.2f} {throughput / baseline:>7.1f}x "
+              f"{errors:>7} {main.llm_limit.stats['peak_active']:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.2))
@@ -0,0 +1,221 @@
+"""End-to-end workflow benchmark against the local database with a replayed LLM.
+
+Replays the questions recorded in logs/ through the compiled workflow, with
+ReplayChatModel returning the recorded SQL and answers after a simulated
+latency, so runs are repeatable and need no API key. Caches are disabled so
+every question runs every node.
+
+Reports p50/p95/p99 latency per node (from the durations in
+execution_history) and end to end, throughput, and the peak RSS of the
+process while each node was running, sampled every few milliseconds; with
+concurrency above 1 nodes overlap, so a peak is shared by every node running
+at the time. Results are saved as JSON; --compare prints the change against
+an earlier results file.
+
+Needs the database from database/create_db.py (which loads a vendored dump
+from database/pagila/ when present) and psutil for RSS.
+
+Run from the repository root:
+    python -m benchmarks.end_to_end [--rounds 5] [--concurrency 1] [--latency 0.2]
+        [--jitter 0.1] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")  # ChatOpenAI refuses to construct without one
+
+import main
+from benchmarks.recorded import load_interactions
+from benchmarks.stub_llm import ReplayChatModel
+
+try:
+    import psutil
+    _HAS_PSUTIL = True
+except ImportError:  # Peak RSS is reported as null
+    _HAS_PSUTIL = False
+
+NODES = ["generate_sql", "validate_sql", "execute_sql", "recover_sql", "generate_response"]
+PERCENTILES = [50, 95, 99]
+SAMPLE_INTERVAL = 0.005  # Seconds between RSS samples
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+class RSSSampler:
+    """Samples the process RSS in a background thread as (time.time(), bytes) pairs."""
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        process = psutil.Process()
+        while not self._stop.is_set():
+            self.samples.append((time.time(), process.memory_info().rss))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if _HAS_PSUTIL:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if _HAS_PSUTIL:
+            self._thread.join()
+
+    def peak(self, start: float, end: float) -> Optional[int]:
+        """Highest RSS sampled between start and end (time.time()), or the nearest sample before."""
+        if not self.samples:
+            return None
+        inside = [rss for t, rss in self.samples if start <= t <= end]
+        if inside:
+            return max(inside)
+        before = [rss for t, rss in self.samples if t <= start]
+        return before[-1] if before else self.samples[0][1]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(np.percentile(values, p)), 6) for p in PERCENTILES}
+
+
+def node_intervals(history: List[Dict[str, Any]]):
+    """(node, start, end) in time.time() for each node run; entries are stamped when the node finishes."""
+    for entry in history:
+        if "duration" not in entry:
+            continue
+        end = datetime.fromisoformat(entry["timestamp"]).timestamp()
+        yield entry["step"], end - entry["duration"], end
+
+
+async def run_questions(questions: List[str], concurrency: int) -> List[Dict[str, Any]]:
+    workflow = main.get_workflow()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def answer(question: str) -> Dict[str, Any]:
+        async with gate:
+            start = time.perf_counter()
+            final_state = await workflow.ainvoke(main.initial_state(question))
+            return {"question": question, "elapsed": time.perf_counter() - start,
+                    "error": final_state.get("error"), "history": final_state.get("execution_history", [])}
+
+    return await asyncio.gather(*(answer(q) for q in questions))
+
+
+def summarize(runs: List[Dict[str, Any]], sampler: RSSSampler, seconds: float) -> Dict[str, Any]:
+    durations = {node: [] for node in NODES}
+    peaks = {node: None for node in NODES}
+    llm_tokens = {node: 0 for node in NODES}
+    for run in runs:
+        for entry in run["history"]:
+            llm_tokens[entry["step"]] = llm_tokens.get(entry["step"], 0) + entry.get("llm_prompt_tokens", 0) + entry.get("llm_completion_tokens", 0)
+        for node, start, end in node_intervals(run["history"]):
+            durations.setdefault(node, []).append(end - start)
+            peak = sampler.peak(start, end)
+            if peak is not None:
+                peaks[node] = max(peaks.get(node) or 0, peak)
+    return {
+        "questions": len(runs),
+        "errors": sum(1 for run in runs if run["error"]),
+        "seconds": round(seconds, 3),
+        "throughput": round(len(runs) / seconds, 3),
+        "end_to_end": {**percentiles([run["elapsed"] for run in runs]), "mean": round(float(np.mean([run["elapsed"] for run in runs])), 6)},
+        "nodes": {
+            node: {"runs": len(durations[node]), **percentiles(durations[node]),
+                   "peak_rss_mb": round(peaks[node] / 1024 / 1024, 1) if peaks[node] else None,
+                   "llm_tokens": llm_tokens[node]}
+            for node in NODES + sorted(set(durations) - set(NODES)) if durations.get(node)
+        },
+        "peak_rss_mb": round(max(rss for _, rss in sampler.samples) / 1024 / 1024, 1) if sampler.samples else None
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _change(new: Optional[float], old: Optional[float]) -> str:
+    if new is None or not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def print_report(results: Dict[str, Any], previous: Optional[Dict[str, Any]] = None):
+    old = previous or {}
+    throughput_change = f" ({_change(results['throughput'], old.get('throughput'))})" if previous else ""
+    print(f"{results['questions']} questions, {results['errors']} errors, {results['seconds']:.2f} s, "
+          f"{results['throughput']:.2f} q/s{throughput_change}, peak RSS {results['peak_rss_mb']} MB")
+    header = f"{'node':>18} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12} {'LLM tokens':>11}"
+    print(header + (f" {'p95 change':>11}" if previous else ""))
+    rows = [("end_to_end", results["end_to_end"], old.get("end_to_end", {}))]
+    rows += [(node, stats, old.get("nodes", {}).get(node, {})) for node, stats in results["nodes"].items()]
+    for name, stats, old_stats in rows:
+        cells = " ".join(f"{stats[f'p{p}'] * 1000:>9.1f}" for p in PERCENTILES)
+        line = (f"{name:>18} {stats.get('runs', results['questions']):>5} {cells} "
+                f"{stats.get('peak_rss_mb') or '-':>12} {stats.get('llm_tokens', '-'):>11}")
+        if previous:
+            line += f" {_change(stats['p95'], old_stats.get('p95')):>11}"
+        print(line)
+
+
+def run(args: argparse.Namespace):
+    interactions = load_interactions()
+    if not interactions:
+        raise SystemExit("No recorded interactions found in logs/")
+    main.llm = ReplayChatModel.from_interactions(interactions, latency=args.latency, jitter=args.jitter)
+    main.sql_cache.enabled = False
+    main.result_cache.enabled = False
+    # Load the schema and retrieval index up front so the first question doesn't pay for it
+    main.get_workflow()
+    main.get_schema_retriever()
+
+    questions = [i["question"] for i in interactions] * args.rounds
+    with RSSSampler() as sampler:
+        start = time.perf_counter()
+        runs = asyncio.run(run_questions(questions, args.concurrency))
+        seconds = time.perf_counter() - start
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "config": {"rounds": args.rounds, "concurrency": args.concurrency, "latency": args.latency,
+                   "jitter": args.jitter, "responder_policy": main.responder.policy},
+        **summarize(runs, sampler, seconds)
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"Compared with {args.compare} (commit {previous.get('commit')})")
+    print_report(results, previous)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"end_to_end_{results['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5, help="times each recorded question is asked")
+    parser.add_argument("--concurrency", type=int, default=1, help="questions in flight at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="up to this many extra seconds per call")
+    parser.add_argument("--output", help="results file (default benchmarks/results/end_to_end_<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    run(parser.parse_args())
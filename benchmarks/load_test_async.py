@@ -0,0 +1,51 @@
+"""Concurrent-request throughput of the /sql endpoint with a stub LLM.
+
+Needs the local Postgres from database/database.ini; the LLM is replaced by
+StubChatModel so only the event loop, the pool and the database are exercised.
+
+Run from the repository root:
+    python -m benchmarks.load_test_async [latency_seconds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")  # ChatOpenAI refuses to construct without one
+
+import main
+import sql_endpoint
+from benchmarks.stub_llm import StubChatModel
+
+CONCURRENCY_LEVELS = [1, 5, 10, 25, 50]
+REQUESTS_PER_CLIENT = 4
+
+
+async def run_level(concurrency: int) -> dict:
+    async def client():
+        for _ in range(REQUESTS_PER_CLIENT):
+            await sql_endpoint.sql(sql_endpoint.Question(text="How many films are there?"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    total = concurrency * REQUESTS_PER_CLIENT
+    return {"concurrency": concurrency, "requests": total, "seconds": elapsed, "throughput": total / elapsed}
+
+
+async def run(latency: float):
+    main.llm = StubChatModel(latency=latency)
+    # Every request should pay for the full graph
+    main.sql_cache.enabled = False
+    main.result_cache.enabled = False
+    async with sql_endpoint.lifespan(sql_endpoint.app):
+        print(f"Stub LLM latency: {latency * 1000:.0f} ms per call")
+        print(f"{'concurrency':>11} {'requests':>8} {'seconds':>8} {'req/s':>8}")
+        for concurrency in CONCURRENCY_LEVELS:
+            r = await run_level(concurrency)
+            print(f"{r['concurrency']:>11} {r['requests']:>8} {r['seconds']:>8.2f} {r['throughput']:>8.1f}")
+        print("Async pool:", main.async_db_pool.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.2))
@@ -0,0 +1,75 @@
+"""Literal extraction: the old per-column regex patterns vs the single-pass scanner.
+
+Checks 4, 100 and 500 columns against the same failed query (five literal
+comparisons over film/customer/category). The regex baseline runs three
+patterns plus a context search per column, so its cost grows with the
+column count; the scanner tokenizes the query once.
+
+Run from the repository root:
+    python -m benchmarks.pattern_scanner
+"""
+import re
+import statistics
+import time
+from typing import List, Tuple
+
+from query_patterns import ValuePatternExtractor
+
+COLUMN_COUNTS = [4, 100, 500]
+REPEATS = 200
+BASE_COLUMNS = [("film", "title"), ("customer", "first_name"), ("customer", "last_name"), ("category", "name")]
+QUERY = (
+    "SELECT f.title, c.first_name FROM film f JOIN inventory i ON i.film_id = f.film_id "
+    "JOIN rental r ON r.inventory_id = i.inventory_id JOIN customer c ON c.customer_id = r.customer_id "
+    "JOIN film_category fc ON fc.film_id = f.film_id JOIN category cat ON cat.category_id = fc.category_id "
+    "WHERE f.title = 'ALIEN CENR' AND cat.name LIKE '%Comed%' AND c.last_name = 'Smith' "
+    "AND c.first_name IN ('John', 'Mary') AND r.rental_date > '2005-05-01'"
+)
+
+
+class LegacyPatterns:
+    """ValuePatternExtractor's pattern generation and extraction before the scanner, kept as the baseline."""
+    def __init__(self, columns_to_check: List[Tuple[str, str]]):
+        self.patterns = []
+        for table, column in columns_to_check:
+            for op, value in (("\\s*=\\s*", "'([^']*)'"), ("\\s+LIKE\\s+", "'%([^%]+)%'"), ("\\s+ILIKE\\s+", "'%([^%]+)%'")):
+                pattern = rf"(?:{column}|{table}\.{column}){op}{value}"
+                context = rf"(?i)(?:where|and)\s+(?:\w+\.)?{column}{op}{value.replace('(', '').replace(')', '')}"
+                self.patterns.append((pattern, table, column, context))
+
+    def extract_value_patterns(self, query: str):
+        found_patterns = []
+        for pattern, table, column, context_pattern in self.patterns:
+            for match in re.finditer(pattern, query, re.IGNORECASE):
+                context_match = re.search(context_pattern, query, re.IGNORECASE)
+                if context_match:
+                    found_patterns.append((match.group(1), table, column, context_match.group(0)))
+        return found_patterns
+
+
+def columns(n: int) -> List[Tuple[str, str]]:
+    return BASE_COLUMNS + [(f"table_{i}", f"column_{i}") for i in range(n - len(BASE_COLUMNS))]
+
+
+def timed(fn) -> float:
+    durations = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(QUERY)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1e6
+
+
+def run():
+    print(f"{'columns':>8} {'regex us':>9} {'scanner us':>11} {'regex found':>12} {'scanner found':>14}")
+    for n in COLUMN_COUNTS:
+        legacy = LegacyPatterns(columns(n))
+        # The scanner needs no database; a pool is passed only to satisfy the constructor
+        scanner = ValuePatternExtractor(columns(n), {}, pool=object())
+        legacy_us, scanner_us = timed(legacy.extract_value_patterns), timed(scanner.extract_value_patterns)
+        print(f"{n:>8} {legacy_us:>9.1f} {scanner_us:>11.1f} "
+              f"{len(legacy.extract_value_patterns(QUERY)):>12} {len(scanner.extract_value_patterns(QUERY)):>14}")
+
+
+if __name__ == "__main__":
+    run()
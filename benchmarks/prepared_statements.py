@@ -0,0 +1,118 @@
+"""Async query latency, literal SQL vs templates with cached prepared statements.
+
+Runs query shapes that differ only in their literals, as generated queries
+for different films, customers or dates do, on one asyncpg connection:
+once as literal SQL (a StatementCache with parameterize off, so a query is
+prepared again unless the same literals ran before, as with asyncpg's own
+statement cache) and once as parameterized templates, where a shape seen
+before skips parsing and, after a few runs, planning. The recorded queries
+in logs/ are repeated the same way.
+
+Needs the local Postgres from database/database.ini.
+
+Run from the repository root:
+    python -m benchmarks.prepared_statements [--runs 500]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from benchmarks.recorded import load_interactions
+from db_pool import get_async_pool
+from sql_execution import astream_query
+from sql_templates import StatementCache, parameterize
+
+SHAPES = {
+    "film rentals by title": """
+        SELECT f.title, c.name AS category, count(r.rental_id) AS rentals, sum(p.amount) AS revenue
+        FROM film f
+        JOIN film_category fc ON fc.film_id = f.film_id
+        JOIN category c ON c.category_id = fc.category_id
+        LEFT JOIN inventory i ON i.film_id = f.film_id
+        LEFT JOIN rental r ON r.inventory_id = i.inventory_id
+        LEFT JOIN payment p ON p.rental_id = r.rental_id
+        WHERE f.title = {title}
+        GROUP BY f.title, c.name""",
+    "customer spend by name": """
+        SELECT cu.first_name, cu.last_name, s.store_id, count(*) AS payments, sum(p.amount) AS total
+        FROM customer cu
+        JOIN store s ON s.store_id = cu.store_id
+        JOIN payment p ON p.customer_id = cu.customer_id
+        WHERE cu.last_name = {last_name} AND p.amount > {amount}
+        GROUP BY cu.first_name, cu.last_name, s.store_id""",
+    "films by length and rate": """
+        SELECT f.title, f.length, f.rental_rate FROM film f
+        WHERE f.length BETWEEN {low} AND {high} AND f.rental_rate IN ({rate}, 4.99)
+        ORDER BY f.title LIMIT 10""",
+}
+
+
+async def literal_values(conn):
+    titles = [row[0] for row in await conn.fetch("SELECT title FROM film")]
+    last_names = [row[0] for row in await conn.fetch("SELECT last_name FROM customer")]
+    return titles, last_names
+
+
+def workload(titles, last_names, runs: int, rng: random.Random):
+    """(shape, sql) pairs, the shapes interleaved and the literals drawn at random."""
+    quote = lambda value: "'" + value.replace("'", "''") + "'"
+    for _ in range(runs):
+        shape = rng.choice(list(SHAPES))
+        low = rng.randint(46, 150)
+        sql = SHAPES[shape].format(title=quote(rng.choice(titles)), last_name=quote(rng.choice(last_names)),
+                                   amount=rng.choice(["0.99", "2.99", "4.99"]), low=low, high=low + rng.randint(5, 40),
+                                   rate=rng.choice(["0.99", "2.99"]))
+        yield shape, sql
+
+
+async def measure(conn, queries, statements):
+    latencies = {}
+    for shape, sql in queries:
+        start = time.perf_counter()
+        await astream_query(conn, sql, statements=statements)
+        latencies.setdefault(shape, []).append(time.perf_counter() - start)
+    return latencies
+
+
+def report(base, cached):
+    for shape in base:
+        b, c = np.array(base[shape]) * 1000, np.array(cached[shape]) * 1000
+        print(f"{shape:>34} {len(b):>5} {np.mean(b):>10.3f} {np.mean(c):>10.3f} "
+              f"{np.percentile(b, 95):>10.3f} {np.percentile(c, 95):>10.3f} {(np.mean(b) - np.mean(c)) / np.mean(b) * 100:>7.0f}%")
+
+
+async def run(runs: int):
+    pool = get_async_pool()
+    async with pool.connection() as conn:
+        titles, last_names = await literal_values(conn)
+        queries = list(workload(titles, last_names, runs, random.Random(0)))
+        recorded = [(f"recorded #{i}", interaction["sql"])
+                    for i, interaction in enumerate(load_interactions())] * max(1, runs // 50)
+
+        templates = {parameterize(sql).text for _, sql in queries}
+        print(f"{len(queries)} generated queries, {len({sql for _, sql in queries})} distinct, "
+              f"{len(templates)} templates; {len(recorded)} runs of recorded queries")
+        for shape, sql in queries[:len(SHAPES)] + recorded:  # Warm the buffer cache for both settings
+            await astream_query(conn, sql)
+
+        literal, statements = StatementCache(parameterize=False), StatementCache()
+        base = await measure(conn, queries, literal)
+        cached = await measure(conn, queries, statements)
+        base_recorded = await measure(conn, recorded, literal)
+        cached_recorded = await measure(conn, recorded, statements)
+
+    print(f"{'query':>34} {'runs':>5} {'literal ms':>10} {'cached ms':>10} {'lit p95':>10} {'cached p95':>10} {'saved':>8}")
+    report(base, cached)
+    report(base_recorded, cached_recorded)
+    print("Literal statements:", literal.stats)
+    print("Statement cache:", statements.stats)
+    await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=500, help="generated queries per setting")
+    asyncio.run(run(parser.parse_args().runs))
@@ -0,0 +1,24 @@
+"""Recorded interactions parsed from the chatbot/Gradio logs in logs/."""
+import glob
+import os
+import re
+from typing import Dict, List
+
+_ENTRY = re.compile(
+    r"Timestamp: (?P<timestamp>.*?)\n"
+    r"Question: (?P<question>.*?)\n"
+    r"Generated SQL: (?P<sql>.*?)\n"
+    r"Response: (?P<response>.*?)\n={50}",
+    re.S
+)
+
+
+def load_interactions(log_dir: str = "logs") -> List[Dict[str, str]]:
+    """Every logged question with the SQL and response recorded for it, oldest first."""
+    interactions = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "*_log_*.txt"))):
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        for match in _ENTRY.finditer(content):
+            interactions.append({key: value.strip() for key, value in match.groupdict().items()})
+    return interactions
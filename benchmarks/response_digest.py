@@ -0,0 +1,75 @@
+"""Response prompt size and latency vs result row count: full JSON rows vs the digest.
+
+For synthetic payment-like results of 10 to 10k rows, reports the estimated
+prompt tokens and the time to build the prompt text with the old
+json.dumps(rows, indent=2) and with digest_result. With --live (needs
+OPENAI_API_KEY) it also times the generate_response LLM call on both prompts;
+full-JSON calls that exceed the model's context are reported as errors.
+
+Run from the repository root:
+    python -m benchmarks.response_digest [--live]
+"""
+import json
+import random
+import sys
+import time
+
+from result_digest import digest_result, estimate_tokens, DEFAULT_TOKEN_BUDGET
+from result_set import ResultSet
+
+ROW_COUNTS = [10, 100, 1_000, 10_000]
+COLUMNS = ["customer", "film", "category", "amount", "payment_date"]
+QUESTION = "What did customers pay for rentals, by film and category?"
+CATEGORIES = ["Action", "Animation", "Children", "Classics", "Comedy", "Documentary", "Drama", "Family"]
+
+
+def make_result(n: int, rng: random.Random) -> ResultSet:
+    rows = [(f"CUSTOMER {rng.randint(1, 599)}", f"FILM TITLE {rng.randint(1, 1000)}", rng.choice(CATEGORIES),
+             round(rng.choice([0.99, 2.99, 4.99]) + rng.choice([0, 0, 1, 2]), 2),
+             "2022-%02d-%02dT12:00:00" % (rng.randint(1, 7), rng.randint(1, 28))) for _ in range(n)]
+    return ResultSet(COLUMNS, rows)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+
+def live_latency(llm, results_text: str) -> str:
+    from langchain.schema.messages import SystemMessage, HumanMessage
+    messages = [
+        SystemMessage(content="You are a helpful database analyst. Your task is to summarize SQL query results "
+                              "in natural language. Focus on key insights and patterns in the data. Be concise but informative."),
+        HumanMessage(content=f"Original Question: {QUESTION}\nQuery Results: {results_text}\n"
+                             "Please provide a natural language summary of these results, highlighting key insights.")
+    ]
+    try:
+        _, elapsed = timed(lambda: llm.invoke(messages))
+        return f"{elapsed:.2f}"
+    except Exception as e:
+        return f"error: {type(e).__name__}"
+
+
+def run(live: bool):
+    rng = random.Random(3)
+    llm = None
+    if live:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    print(f"budget: {DEFAULT_TOKEN_BUDGET} tokens")
+    header = f"{'rows':>7} {'full tokens':>12} {'full ms':>8} {'digest tokens':>14} {'digest ms':>10}"
+    print(header + (f" {'full LLM s':>14} {'digest LLM s':>13}" if live else ""))
+    for n in ROW_COUNTS:
+        result = make_result(n, rng)
+        full, full_s = timed(lambda: json.dumps(result.to_dicts(), indent=2))
+        digest, digest_s = timed(lambda: digest_result(result))
+        line = (f"{n:>7} {estimate_tokens(full):>12} {full_s * 1000:>8.1f} "
+                f"{estimate_tokens(digest):>14} {digest_s * 1000:>10.1f}")
+        if live:
+            line += f" {live_latency(llm, full):>14} {live_latency(llm, digest):>13}"
+        print(line)
+
+
+if __name__ == "__main__":
+    run("--live" in sys.argv)
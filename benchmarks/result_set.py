@@ -0,0 +1,54 @@
+"""Query result representation: list of row dicts vs ResultSet.
+
+Builds synthetic results (id, amount, rental count, title, timestamp) of 10k
+to 1M rows from the tuples stream_query returns, and reports peak memory
+(tracemalloc) of holding them and the time to serialize them: the old
+json.dumps(rows, indent=2) against ResultSet.to_json().
+
+Run from the repository root:
+    python -m benchmarks.result_set
+"""
+import json
+import random
+import time
+import tracemalloc
+
+from result_set import ResultSet
+
+SIZES = [10_000, 100_000, 1_000_000]
+COLUMNS = ["payment_id", "amount", "rental_count", "title", "payment_date"]
+
+
+def make_rows(n: int, rng: random.Random):
+    return [(i, round(rng.uniform(0, 12), 2), rng.randint(0, 40), f"FILM TITLE {rng.randint(1, 1000)}",
+             "2022-02-%02dT10:%02d:00" % (rng.randint(1, 28), rng.randint(0, 59))) for i in range(n)]
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / 1024 / 1024
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run():
+    rng = random.Random(7)
+    print(f"{'rows':>9} {'dicts MB':>9} {'columnar MB':>12} {'dumps s':>8} {'to_json s':>10}")
+    for n in SIZES:
+        rows = make_rows(n, rng)
+        dicts, dicts_mb = measure(lambda: [dict(zip(COLUMNS, row)) for row in rows])
+        result, result_mb = measure(lambda: ResultSet(COLUMNS, rows))
+        dumps_s = timed(lambda: json.dumps(dicts, indent=2))
+        to_json_s = timed(result.to_json)
+        print(f"{n:>9} {dicts_mb:>9.1f} {result_mb:>12.1f} {dumps_s:>8.2f} {to_json_s:>10.2f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,61 @@
+"""Query execution memory: fetchall into RealDictCursor dicts vs stream_query.
+
+Runs a generated result of 10k to 1M rows (an integer, a numeric and a
+timestamp column) against the configured database and reports wall time and
+peak Python memory (tracemalloc) for the old execute_sql path and for the
+server-side cursor path capped at max_result_rows.
+
+Run from the repository root:
+    python -m benchmarks.result_streaming
+"""
+import time
+import tracemalloc
+from decimal import Decimal
+
+from psycopg2.extras import RealDictCursor
+
+from db_pool import get_pool
+from sql_execution import stream_query, DEFAULT_MAX_ROWS, DEFAULT_FETCH_SIZE
+
+SIZES = [10_000, 100_000, 1_000_000]
+QUERY = "SELECT g AS id, g::numeric / 3 AS amount, now() AS created FROM generate_series(1, {n}) g"
+
+
+def fetchall_dicts(conn, sql: str):
+    """execute_sql before streaming, kept as the baseline."""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql)
+        results = cur.fetchall()
+    for row in results:
+        for key, value in row.items():
+            if isinstance(value, Decimal):
+                row[key] = float(value)
+    return results
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024, result
+
+
+def run():
+    pool = get_pool()
+    print(f"{'rows':>9} {'fetchall s':>10} {'fetchall MB':>12} {'stream s':>9} {'stream MB':>10} {'kept':>6} {'truncated':>10}")
+    with pool.connection() as conn:
+        for n in SIZES:
+            sql = QUERY.format(n=n)
+            all_s, all_mb, _ = measure(lambda: fetchall_dicts(conn, sql))
+            conn.rollback()
+            stream_s, stream_mb, (_, rows, truncated) = measure(
+                lambda: stream_query(conn, sql, DEFAULT_MAX_ROWS, DEFAULT_FETCH_SIZE))
+            conn.rollback()
+            print(f"{n:>9} {all_s:>10.2f} {all_mb:>12.1f} {stream_s:>9.2f} {stream_mb:>10.1f} {len(rows):>6} {str(truncated):>10}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,73 @@
+"""Prompt size and latency with relevance-pruned schema vs the full schema.
+
+Uses the questions recorded in logs/. Token counts need no API calls; pass
+--latency to also time generate_sql and the end-to-end workflow against the
+real LLM in both modes.
+
+Run from the repository root:
+    python -m benchmarks.schema_pruning [--latency]
+"""
+import statistics
+import sys
+import time
+
+import main
+from benchmarks.recorded import load_interactions
+
+
+def initial_state(question: str) -> dict:
+    return {
+        "messages": [],
+        "question": question,
+        "sql_query": "",
+        "error": None,
+        "context": {},
+        "execution_history": [],
+        "query_result": None,
+        "response": None,
+        "recovery_attempts": 0
+    }
+
+
+def prompt_tokens(question: str, pruned: bool) -> int:
+    main.schema_pruning = pruned
+    schema_text, _ = main.get_prompt_schema(question, main.embeddings.embed_query(question))
+    messages = main._sql_generation_messages(initial_state(question), schema_text)
+    return main.llm.get_num_tokens_from_messages(messages)
+
+
+def latency(fn, question: str, pruned: bool) -> float:
+    main.schema_pruning = pruned
+    start = time.perf_counter()
+    fn(initial_state(question))
+    return time.perf_counter() - start
+
+
+def run(measure_latency: bool):
+    # Caches would hide the LLM calls being compared
+    main.sql_cache.enabled = False
+    main.result_cache.enabled = False
+    questions = [i["question"] for i in load_interactions()]
+    workflow = main.get_workflow()
+
+    print(f"Schema: {len(main.get_schema())} tables")
+    print(f"{'full':>6} {'pruned':>6}  question")
+    full_tokens, pruned_tokens = [], []
+    for question in questions:
+        full_tokens.append(prompt_tokens(question, pruned=False))
+        pruned_tokens.append(prompt_tokens(question, pruned=True))
+        print(f"{full_tokens[-1]:>6} {pruned_tokens[-1]:>6}  {question[:70]}")
+    print(f"Mean generate_sql prompt tokens: full {statistics.mean(full_tokens):.0f}, "
+          f"pruned {statistics.mean(pruned_tokens):.0f}")
+
+    if measure_latency:
+        for label, fn in (("generate_sql", main.generate_sql), ("end-to-end", workflow.invoke)):
+            full = [latency(fn, q, pruned=False) for q in questions]
+            pruned = [latency(fn, q, pruned=True) for q in questions]
+            print(f"Median {label} latency: full {statistics.median(full) * 1000:.0f} ms, "
+                  f"pruned {statistics.median(pruned) * 1000:.0f} ms")
+    main.schema_pruning = True
+
+
+if __name__ == "__main__":
+    run("--latency" in sys.argv[1:])
@@ -0,0 +1,43 @@
+"""Startup schema cost: per-table vs bulk introspection vs loading the on-disk snapshot.
+
+Run from the repository root:
+    python -m benchmarks.schema_startup
+"""
+import os
+import sys
+import tempfile
+import time
+
+from db_inspector import DVDRentalInspector
+
+
+def timed(fn, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def bench(number: int = 5) -> dict:
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "schema_snapshot.json")
+
+    # A fresh inspector per run, so SQLAlchemy's per-inspector cache doesn't help
+    cold_inspector = timed(lambda: DVDRentalInspector(introspection="inspector").get_schema_for_prompt(), number)
+    cold_bulk = timed(lambda: DVDRentalInspector(introspection="bulk").get_schema_for_prompt(), number)
+
+    DVDRentalInspector().load_schema(snapshot_path)  # Prime the snapshot
+    warm = timed(lambda: DVDRentalInspector.format_schema_for_prompt(
+        DVDRentalInspector().load_schema(snapshot_path)), number)
+
+    return {
+        "cold_inspector_ms": cold_inspector * 1000,
+        "cold_bulk_ms": cold_bulk * 1000,
+        "warm_snapshot_ms": warm * 1000
+    }
+
+
+if __name__ == "__main__":
+    results = bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    print(f"Cold per-table introspection: {results['cold_inspector_ms']:.1f} ms")
+    print(f"Cold bulk introspection:      {results['cold_bulk_ms']:.1f} ms")
+    print(f"Warm snapshot load:           {results['warm_snapshot_ms']:.1f} ms")
@@ -0,0 +1,89 @@
+"""LLM calls and database round trips per question with and without local SQL validation.
+
+Generation returns a broken variant of each SQL query recorded in logs/.
+The variants are a markdown fence with a language tag, a table name used
+where the table has an alias, a column on the wrong alias, an unknown
+column and an unbalanced parenthesis. Recovery returns the recorded query.
+For each setting it counts LLM calls and execute_sql runs per question,
+and reports how many questions got an answer.
+
+Needs the local Postgres from database/database.ini.
+
+Run from the repository root:
+    python -m benchmarks.sql_validation
+"""
+import os
+import re
+from typing import List
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")  # ChatOpenAI refuses to construct without one
+
+from langchain_core.messages import BaseMessage
+
+import main
+from benchmarks.recorded import load_interactions
+from benchmarks.stub_llm import StubChatModel
+
+
+class BrokenThenFixedModel(StubChatModel):
+    """Generation gets `sql`, recovery `fixed_sql`, summaries `answer`."""
+    fixed_sql: str = ""
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system_prompt = messages[0].content if messages else ""
+        if "fix SQL queries" in system_prompt:
+            return self.fixed_sql
+        return super()._reply(messages)
+
+
+def variants(sql: str):
+    """(kind, broken sql) pairs for a recorded query; kinds that don't apply are skipped."""
+    yield "fence", f"```postgresql\n{sql}\n```"
+    alias = re.search(r"\bFROM\s+(\w+)\s+(?:AS\s+)?(\w+)\b", sql, re.I)
+    if alias and alias.group(2).lower() not in ("where", "join", "group", "order", "limit"):
+        table, name = alias.group(1), alias.group(2)
+        if re.search(rf"\b{name}\.", sql):
+            yield "table name for alias", re.sub(rf"\b{name}\.", f"{table}.", sql, count=1)
+    qualified = re.search(r"\b(\w+)\.(\w+)\b", sql)
+    if qualified:
+        others = set(re.findall(r"\bJOIN\s+\w+\s+(?:AS\s+)?(\w+)\b", sql, re.I)) - {qualified.group(1)}
+        if others:
+            yield "column on wrong alias", sql[:qualified.start()] + f"{sorted(others)[0]}.{qualified.group(2)}" + sql[qualified.end():]
+    yield "unknown column", re.sub(r"\bSELECT\s+", "SELECT nonexistent_column, ", sql, count=1, flags=re.I)
+    yield "unbalanced parenthesis", sql.rstrip().rstrip(";") + ")"
+
+
+def measure(cases, validation: bool):
+    main.sql_validation = validation
+    workflow = main.get_workflow()
+    llm_calls = executions = answered = 0
+    for broken, fixed in cases:
+        main.llm = BrokenThenFixedModel(sql=broken, fixed_sql=fixed, latency=0)
+        final_state = workflow.invoke(main.initial_state("benchmark question"))
+        history = final_state.get("execution_history", [])
+        llm_calls += sum(entry.get("llm_calls", 0) for entry in history)
+        executions += sum(1 for entry in history if entry["step"] == "execute_sql")
+        answered += bool(final_state.get("query_result")) and not final_state.get("error")
+    return llm_calls, executions, answered
+
+
+def run():
+    main.sql_cache.enabled = False
+    main.result_cache.enabled = False
+    main.responder.policy = "off"  # Count the response call for every answered question
+    cases, kinds = [], {}
+    for interaction in load_interactions():
+        for kind, broken in variants(interaction["sql"]):
+            cases.append((broken, interaction["sql"]))
+            kinds[kind] = kinds.get(kind, 0) + 1
+    print(f"{len(cases)} broken queries: " + ", ".join(f"{n} {kind}" for kind, n in kinds.items()))
+    print(f"{'validation':>10} {'LLM calls/q':>12} {'executions/q':>13} {'answered':>9}")
+    for validation in (False, True):
+        llm_calls, executions, answered = measure(cases, validation)
+        print(f"{'on' if validation else 'off':>10} {llm_calls / len(cases):>12.2f} "
+              f"{executions / len(cases):>13.2f} {answered:>6}/{len(cases)}")
+    print("Validator:", main.get_sql_validator().stats)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,109 @@
+"""Deterministic chat models for benchmarks and load tests.
+
+StubChatModel replies with a fixed SQL query to generation/recovery prompts
+and a fixed answer to summarisation prompts; ReplayChatModel replies with the
+SQL and answer recorded for each question. Both wait a configurable simulated
+latency.
+"""
+import asyncio
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_SQL = "SELECT COUNT(*) AS film_count FROM film"
+DEFAULT_ANSWER = "There are 1000 films in the database."
+
+
+def _is_summary(messages: List[BaseMessage]) -> bool:
+    return bool(messages) and "summarize SQL query results" in messages[0].content
+
+
+class StubChatModel(BaseChatModel):
+    sql: str = DEFAULT_SQL
+    answer: str = DEFAULT_ANSWER
+    latency: float = 0.2  # Seconds per call
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        if _is_summary(messages):
+            return self.answer
+        return self.sql
+
+    def _latency(self, messages: List[BaseMessage]) -> float:
+        return self.latency
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        # Token counts estimated like result_digest does, so instrumentation has something to report
+        reply = self._reply(messages)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4 + 1
+        completion_tokens = len(reply) // 4 + 1
+        return AIMessage(content=reply, usage_metadata={"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                                        "total_tokens": prompt_tokens + completion_tokens})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._latency(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._latency(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Word by word, with the latency spread over the reply like a real token stream
+        words = self._reply(messages).split(" ")
+        latency = self._latency(messages)
+        for i, word in enumerate(words):
+            await asyncio.sleep(latency / len(words))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class ReplayChatModel(StubChatModel):
+    """
+    Replays recorded interactions (see benchmarks.recorded): SQL prompts get
+    the SQL recorded for the question they mention and summary prompts its
+    recorded response; unknown questions fall back to sql/answer.
+
+    jitter adds up to that many seconds to each call, derived from the prompt
+    so a replay takes the same time on every run.
+    """
+    interactions: Dict[str, Dict[str, str]] = {}  # question -> {'sql': ..., 'response': ...}
+    jitter: float = 0.0
+
+    @classmethod
+    def from_interactions(cls, interactions: List[Dict[str, str]], **kwargs: Any) -> "ReplayChatModel":
+        return cls(interactions={i["question"]: i for i in interactions}, **kwargs)
+
+    def _recorded(self, messages: List[BaseMessage]) -> Optional[Dict[str, str]]:
+        prompt = str(messages[-1].content) if messages else ""
+        if prompt in self.interactions:
+            return self.interactions[prompt]
+        # Recovery and summary prompts quote the question; prefer the longest match
+        for question in sorted(self.interactions, key=len, reverse=True):
+            if question in prompt:
+                return self.interactions[question]
+        return None
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        recorded = self._recorded(messages)
+        if recorded is None:
+            return super()._reply(messages)
+        return recorded["response"] if _is_summary(messages) else recorded["sql"]
+
+    def _latency(self, messages: List[BaseMessage]) -> float:
+        if not self.jitter:
+            return self.latency
+        prompt = "".join(str(m.content) for m in messages)
+        return self.latency + self.jitter * (zlib.crc32(prompt.encode("utf-8")) % 1000) / 1000
@@ -0,0 +1,96 @@
+"""Fuzzy value lookup: the old linear fuzzywuzzy scan vs ValueIndex.
+
+Synthetic title-like values at 1k, 100k and 1M distinct values; misspelled
+queries are derived from values in the column. The linear baseline is only
+run up to 100k values unless --full is given (it takes minutes at 1M).
+
+Run from the repository root:
+    python -m benchmarks.value_matching [--full]
+"""
+import random
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+from fuzzywuzzy import fuzz
+
+from value_index import ValueIndex
+
+SIZES = [1_000, 100_000, 1_000_000]
+QUERIES = 20
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "vor", "shi", "del", "an", "ub", "ro", "zen", "qu", "bel", "tor", "ix"]
+
+
+def linear_find_similar_values(value: str, possible_values: List[str], threshold: float = 50) -> List[Tuple[str, int]]:
+    """ValuePatternExtractor.find_similar_values before the index, kept as the baseline."""
+    if not value or not possible_values:
+        return []
+    value = value.upper()
+    possible_values = [str(v).upper() for v in possible_values]
+    value_tokens = set(value.split())
+    exact_matches = []
+    for pv in possible_values:
+        if value_tokens.intersection(set(pv.split())):
+            score = fuzz.token_sort_ratio(value, pv)
+            if score >= threshold:
+                exact_matches.append((pv, score))
+    if exact_matches:
+        return sorted(exact_matches, key=lambda x: x[1], reverse=True)
+    matches = []
+    for pv in possible_values:
+        best_score = max(fuzz.ratio(value, pv), fuzz.partial_ratio(value, pv),
+                         fuzz.token_sort_ratio(value, pv), fuzz.token_set_ratio(value, pv))
+        if best_score >= threshold:
+            matches.append((pv, best_score))
+    return sorted(matches, key=lambda x: x[1], reverse=True)[:5]
+
+
+def make_values(n: int, rng: random.Random) -> List[str]:
+    values = set()
+    while len(values) < n:
+        words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        values.add(" ".join(words).upper())
+    return list(values)
+
+
+def misspell(value: str, rng: random.Random) -> str:
+    chars = list(value.replace(" ", ""))  # Single word, so the shared-word rule doesn't apply
+    for _ in range(2):
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice("AEIOUXZ")
+    return "".join(chars)
+
+
+def timed(fn, queries: List[str]) -> Tuple[float, list]:
+    durations, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(fn(q))
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), results
+
+
+def run(full: bool):
+    rng = random.Random(42)
+    print(f"{'values':>9} {'build s':>8} {'index ms':>9} {'linear ms':>10} {'best agrees':>12}")
+    for n in SIZES:
+        values = make_values(n, rng)
+        queries = [misspell(rng.choice(values), rng) for _ in range(QUERIES)]
+
+        start = time.perf_counter()
+        index = ValueIndex(values)
+        build = time.perf_counter() - start
+        index_time, index_results = timed(index.search, queries)
+
+        linear_time, agree = float("nan"), "-"
+        if full or n <= 100_000:
+            linear_time, linear_results = timed(lambda q: linear_find_similar_values(q, values), queries)
+            # Compare best scores: equally scored values may be listed in a different order
+            same = sum([s for _, s in a[:1]] == [s for _, s in b[:1]] for a, b in zip(index_results, linear_results))
+            agree = f"{same}/{len(queries)}"
+        print(f"{n:>9} {build:>8.2f} {index_time * 1000:>9.2f} {linear_time * 1000:>10.1f} {agree:>12}")
+
+
+if __name__ == "__main__":
+    run("--full" in sys.argv[1:])
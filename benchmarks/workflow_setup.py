@@ -0,0 +1,39 @@
+"""Per-request graph setup cost: compiling the workflow vs reusing the shared one.
+
+Run from the repository root:
+    python -m benchmarks.workflow_setup
+"""
+import sys
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from main import create_workflow, get_workflow
+
+
+def bench(number: int = 200) -> dict:
+    # Before: every request compiled its own StateGraph
+    per_request = timeit.timeit(create_workflow, number=number) / number
+
+    # After: the graph is compiled once and looked up per request
+    get_workflow()
+    shared = timeit.timeit(get_workflow, number=number) / number
+
+    # The shared graph must come back as the same object from every thread
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        instances = set(map(id, pool.map(lambda _: get_workflow(), range(number))))
+
+    return {
+        "create_workflow_ms": per_request * 1000,
+        "get_workflow_ms": shared * 1000,
+        "speedup": per_request / shared if shared else float("inf"),
+        "distinct_instances_across_threads": len(instances),
+    }
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    results = bench(number)
+    print(f"create_workflow() per request: {results['create_workflow_ms']:.3f} ms")
+    print(f"get_workflow() per request:    {results['get_workflow_ms']:.6f} ms")
+    print(f"Speedup:                       {results['speedup']:.0f}x")
+    print(f"Distinct graphs across threads: {results['distinct_instances_across_threads']}")
@@ -1,4 +1,4 @@
-from main import create_workflow
+from main import get_workflow
 from langchain.schema import SystemMessage, HumanMessage
 import json
 from datetime import datetime
@@ -29,7 +29,7 @@ def log_interaction(question, sql_query, response):
 
 def run_chatbot():
     """Run an interactive chatbot interface for SQL queries"""
-    app = create_workflow()
+    app = get_workflow()
     print("Welcome to SQL Assistant! Ask me questions about your database.")
     print("Type 'q' to quit.\n")
     
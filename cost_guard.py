@@ -0,0 +1,162 @@
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+import json
+import threading
+import time
+from sql_execution import is_cursor_statement
+
+DEFAULT_MAX_COST = 100_000  # Planner cost units; the recorded questions plan at 10 to ~1,000
+DEFAULT_MAX_ROWS = 1_000_000
+DEFAULT_STATEMENT_TIMEOUT_MS = 5000
+SUMMARY_NODES = 4  # Most expensive plan nodes listed in a summary
+
+EXPLAIN_PREFIX = "EXPLAIN (FORMAT JSON) "
+# Conditions that tie a node to the other side of a join
+_JOIN_CONDITIONS = ("Join Filter", "Hash Cond", "Merge Cond", "Index Cond", "Recheck Cond")
+
+
+class QueryTooExpensive(Exception):
+    """The planner's estimate for a query is over the configured budget."""
+
+
+class PlanCheck(NamedTuple):
+    cost: float  # Estimated total cost of the query
+    rows: float  # Estimated rows returned
+    over_budget: bool
+    summary: str  # Short description of the plan for the recovery prompt
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Every node of an EXPLAIN (FORMAT JSON) plan, depth first."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def _has_condition(plan: Dict[str, Any]) -> bool:
+    return any(key in node for node in plan_nodes(plan) for key in _JOIN_CONDITIONS)
+
+
+def _is_cartesian(node: Dict[str, Any]) -> bool:
+    # A nested loop whose inner side is read whole for every outer row
+    if node.get("Node Type") != "Nested Loop" or "Join Filter" in node or len(node.get("Plans", [])) < 2:
+        return False
+    return not _has_condition(node["Plans"][1])
+
+
+def _describe(node: Dict[str, Any]) -> str:
+    name = node["Node Type"]
+    if "Relation Name" in node:
+        name += f" on {node['Relation Name']}"
+    return f"{name} (cost={node['Total Cost']:,.0f}, rows={node['Plan Rows']:,.0f})"
+
+
+def summarize_plan(plan: Dict[str, Any], max_nodes: int = SUMMARY_NODES) -> str:
+    """The plan's estimates, likely cartesian joins and its most expensive nodes, in one line."""
+    nodes = list(plan_nodes(plan))
+    parts = [f"estimated cost {plan['Total Cost']:,.0f}, estimated rows {plan['Plan Rows']:,.0f}"]
+    for node in nodes:
+        if _is_cartesian(node):
+            tables = sorted({n["Relation Name"] for n in plan_nodes(node) if "Relation Name" in n})
+            parts.append(f"nested loop without a join condition (cartesian join of {', '.join(tables) or 'subqueries'})")
+    expensive = sorted(nodes, key=lambda n: n["Total Cost"], reverse=True)[:max_nodes]
+    parts.append("most expensive steps: " + "; ".join(_describe(n) for n in expensive))
+    return "; ".join(parts)
+
+
+def explain(conn, sql: str) -> Dict[str, Any]:
+    """The planner's plan for sql on a psycopg2 connection, without running it."""
+    with conn.cursor() as cur:
+        cur.execute(EXPLAIN_PREFIX + sql.strip().rstrip(";"))
+        return cur.fetchone()[0][0]["Plan"]
+
+
+async def aexplain(conn, sql: str) -> Dict[str, Any]:
+    """Async variant of explain for asyncpg connections."""
+    result = await conn.fetchval(EXPLAIN_PREFIX + sql.strip().rstrip(";"))
+    # asyncpg returns json columns as text unless a codec is registered
+    return (json.loads(result) if isinstance(result, str) else result)[0]["Plan"]
+
+
+class CostGuard:
+    """
+    Checks the planner's estimate for generated SQL before it runs, so one
+    bad question (a cartesian join, a scan of rental x payment) can't tie up
+    the shared database.
+
+    Policies:
+        'off'      run every query as is
+        'recover'  reject over-budget queries with QueryTooExpensive; its
+                   message (the plan summary) becomes the error recover_sql sees
+        'timeout'  run over-budget queries with a statement_timeout of
+                   statement_timeout_ms, set for their transaction only
+
+    Only SELECT-like statements are checked. stats counts checks, over-budget
+    plans and the time spent in EXPLAIN.
+    """
+    POLICIES = ("off", "recover", "timeout")
+
+    def __init__(self, policy: str = "recover", max_cost: float = DEFAULT_MAX_COST, max_rows: float = DEFAULT_MAX_ROWS,
+                 statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS):
+        """
+        Parameters:
+            policy (str): One of POLICIES.
+            max_cost (float): Highest estimated total cost allowed, in planner cost units.
+            max_rows (float): Highest estimated number of result rows allowed.
+            statement_timeout_ms (int): Server-side timeout for over-budget queries under 'timeout'.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}, got '{policy}'")
+        self.policy = policy
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.statement_timeout_ms = statement_timeout_ms
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "over_budget": 0, "rejected": 0, "timeout_applied": 0, "explain_time_total": 0.0}
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def check_plan(self, plan: Dict[str, Any]) -> PlanCheck:
+        cost, rows = plan["Total Cost"], plan["Plan Rows"]
+        over_budget = cost > self.max_cost or rows > self.max_rows
+        return PlanCheck(cost, rows, over_budget, summarize_plan(plan))
+
+    def _verdict(self, plan: Dict[str, Any], started: float) -> Optional[int]:
+        self._count("checked")
+        self._count("explain_time_total", time.perf_counter() - started)
+        check = self.check_plan(plan)
+        if not check.over_budget:
+            return None
+        self._count("over_budget")
+        if self.policy == "timeout":
+            self._count("timeout_applied")
+            return self.statement_timeout_ms
+        self._count("rejected")
+        raise QueryTooExpensive(
+            f"Query rejected before execution: the plan is over budget (max cost {self.max_cost:,.0f}, "
+            f"max rows {self.max_rows:,.0f}): {check.summary}. Rewrite it to join on keys and filter or "
+            f"aggregate before joining large tables."
+        )
+
+    def check(self, conn, sql: str) -> Optional[int]:
+        """
+        EXPLAIN sql on a psycopg2 connection and apply the policy.
+
+        Returns:
+            Optional[int]: statement_timeout in milliseconds to run the query with, or None.
+
+        Raises:
+            QueryTooExpensive: The plan is over budget under the 'recover' policy.
+        """
+        if self.policy == "off" or not is_cursor_statement(sql):
+            return None
+        started = time.perf_counter()
+        return self._verdict(explain(conn, sql), started)
+
+    async def acheck(self, conn, sql: str) -> Optional[int]:
+        """Async variant of check for asyncpg connections."""
+        if self.policy == "off" or not is_cursor_statement(sql):
+            return None
+        started = time.perf_counter()
+        return self._verdict(await aexplain(conn, sql), started)
@@ -16,6 +16,23 @@ def get_config(env='local'):
     
     return config[env]
 
+PAGILA_URL = "https://raw.githubusercontent.com/devrimgunduz/pagila/master/"
+# Vendored copies of the dump, used instead of downloading when present (e.g. for offline benchmark runs)
+DUMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pagila")
+
+def read_dump(filename):
+    """Pagila dump file from DUMP_DIR if vendored there, otherwise downloaded from GitHub."""
+    path = os.path.join(DUMP_DIR, filename)
+    if os.path.exists(path):
+        print(f"Using vendored {path}")
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    response = requests.get(PAGILA_URL + filename)
+    if response.status_code != 200:
+        raise Exception(f"Failed to download {filename}. Status code: {response.status_code}")
+    return response.text
+
 def execute_sql_file(cursor, sql_content, user):
     """Execute SQL statements from a file content."""
     current_statement = []
@@ -155,24 +172,14 @@ def create_database(config):
         cursor = conn.cursor()
         
         # Download and execute schema
-        print("\nDownloading and executing schema...")
-        schema_url = "https://raw.githubusercontent.com/devrimgunduz/pagila/master/pagila-schema.sql"
-        schema_response = requests.get(schema_url)
-        if schema_response.status_code != 200:
-            raise Exception(f"Failed to download schema. Status code: {schema_response.status_code}")
-        
-        schema_content = schema_response.text
+        print("\nLoading and executing schema...")
+        schema_content = read_dump("pagila-schema.sql")
         execute_sql_file(cursor, schema_content, config['user'])
         print("Schema created successfully")
         
         # Download and execute data
-        print("\nDownloading and executing data...")
-        data_url = "https://raw.githubusercontent.com/devrimgunduz/pagila/master/pagila-data.sql"
-        data_response = requests.get(data_url)
-        if data_response.status_code != 200:
-            raise Exception(f"Failed to download data. Status code: {data_response.status_code}")
-        
-        data_content = data_response.text
+        print("\nLoading and executing data...")
+        data_content = read_dump("pagila-data.sql")
         execute_sql_file(cursor, data_content, config['user'])
         print("Data imported successfully")
         
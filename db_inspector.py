@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.engine import Engine
+from sqlalchemy import inspect, text
 import configparser
+import hashlib
+import json
 import os
+from datetime import datetime
 from typing import Dict, List, Any, Optional
+from db_pool import get_pool
 
 
 class DVDRentalInspector:
@@ -11,44 +14,263 @@ class DVDRentalInspector:
     The output is designed to be easily consumable by an LLM for SQL generation tasks.
     """
     df_credentials = "database/database.ini"
-    def __init__(self, env: str = 'local', config_file: str = df_credentials):
+    df_snapshot = "database/schema_snapshot.json"
+    INTROSPECTION_MODES = ("bulk", "inspector")
+
+    BULK_COLUMNS_QUERY = text("""
+        SELECT c.relname AS table_name,
+               obj_description(c.oid, 'pg_class') AS table_comment,
+               a.attname AS column_name,
+               format_type(a.atttypid, a.atttypmod) AS data_type,
+               NOT a.attnotnull AS nullable,
+               col_description(c.oid, a.attnum) AS column_comment,
+               array_position(pk.conkey, a.attnum) AS pk_position
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_constraint pk ON pk.conrelid = c.oid AND pk.contype = 'p'
+        WHERE n.nspname = :schema AND c.relkind IN ('r', 'p')
+        ORDER BY c.relname, a.attnum
+    """)
+
+    BULK_FOREIGN_KEYS_QUERY = text("""
+        SELECT src.relname AS table_name,
+               tgt.relname AS referred_table,
+               array_agg(sa.attname ORDER BY k.ord) AS constrained_columns,
+               array_agg(ta.attname ORDER BY k.ord) AS referred_columns
+        FROM pg_constraint con
+        JOIN pg_class src ON src.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = src.relnamespace
+        JOIN pg_class tgt ON tgt.oid = con.confrelid
+        CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(src_attnum, tgt_attnum, ord)
+        JOIN pg_attribute sa ON sa.attrelid = con.conrelid AND sa.attnum = k.src_attnum
+        JOIN pg_attribute ta ON ta.attrelid = con.confrelid AND ta.attnum = k.tgt_attnum
+        WHERE con.contype = 'f' AND n.nspname = :schema
+        GROUP BY con.oid, con.conname, src.relname, tgt.relname
+        ORDER BY src.relname, con.conname
+    """)
+
+    def __init__(self, env: str = 'local', config_file: str = df_credentials, introspection: str = "bulk",
+                 db_schema: str = "public"):
         """
         Initialize the schema inspector with database configuration.
         
         Parameters:
             env (str): The environment section in the configuration file.
             config_file (str): Path to the configuration file containing DB credentials.
+            introspection (str): 'bulk' reads the whole schema in two catalog queries;
+                'inspector' uses SQLAlchemy's per-table inspector calls.
+            db_schema (str): The database schema (namespace) to describe.
         """
+        if introspection not in self.INTROSPECTION_MODES:
+            raise ValueError(f"introspection must be one of {self.INTROSPECTION_MODES}, got '{introspection}'")
+        self.introspection = introspection
+        self.db_schema = db_schema
         self.config = self._get_db_config(env, config_file)
-        db_url = f"postgresql://{self.config['user']}:{self.config['password']}@{self.config['host']}/{self.config['database']}"
-        self.engine = create_engine(db_url)
-        self.inspector = inspect(self.engine)
-        print(db_url)
+        # Share the engine (and its connection pool) with query execution
+        self.engine = get_pool(self.config).engine
+        self._inspector = None
+        print(self.engine.url)
+
+    @property
+    def inspector(self):
+        # Created on first use: constructing a SQLAlchemy inspector opens a connection
+        if self._inspector is None:
+            self._inspector = inspect(self.engine)
+        return self._inspector
 
     def _get_db_config(self, env, config_file):
         config = configparser.ConfigParser()
         config.read(config_file)
         return config[env]
 
-    def get_schema_for_prompt(self) -> str:
+    def get_schema(self, introspection: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
         """
-        Get a concise schema representation focusing on tables, columns, and relationships.
-        Ideal for providing minimal context to an LLM for SQL generation.
+        Get the structured schema: for every table, its comment, columns (name, type,
+        nullability, comment), primary key and the foreign keys pointing to other tables.
+
+        Parameters:
+            introspection (str): Overrides the mode chosen at construction.
         """
+        if (introspection or self.introspection) == "bulk":
+            return self._get_schema_bulk()
+        return self._get_schema_inspector()
+
+    def _get_schema_inspector(self) -> Dict[str, Dict[str, Any]]:
+        """Per-table SQLAlchemy introspection: several catalog round trips per table."""
+        schema = {}
+        for table_name in self.inspector.get_table_names(schema=self.db_schema):
+            schema[table_name] = {
+                "comment": self.inspector.get_table_comment(table_name, schema=self.db_schema).get('text'),
+                "columns": [
+                    {
+                        "name": col['name'],
+                        "type": str(col['type']),
+                        "nullable": col['nullable'],
+                        "comment": col.get('comment')
+                    }
+                    for col in self.inspector.get_columns(table_name, schema=self.db_schema)
+                ],
+                "primary_key": self.inspector.get_pk_constraint(table_name, schema=self.db_schema)['constrained_columns'],
+                "foreign_keys": [
+                    {
+                        "constrained_columns": fk['constrained_columns'],
+                        "referred_table": fk['referred_table'],
+                        "referred_columns": fk['referred_columns']
+                    }
+                    for fk in self.inspector.get_foreign_keys(table_name, schema=self.db_schema)
+                ]
+            }
+        return schema
+
+    def _get_schema_bulk(self) -> Dict[str, Dict[str, Any]]:
+        """Whole-schema introspection in two pg_catalog queries, assembled in memory."""
+        schema = {}
+        pk_positions: Dict[str, List[tuple]] = {}
+        with self.engine.connect() as conn:
+            for row in conn.execute(self.BULK_COLUMNS_QUERY, {"schema": self.db_schema}).mappings():
+                table = schema.setdefault(row['table_name'], {
+                    "comment": row['table_comment'],
+                    "columns": [],
+                    "primary_key": [],
+                    "foreign_keys": []
+                })
+                table['columns'].append({
+                    "name": row['column_name'],
+                    "type": row['data_type'],
+                    "nullable": row['nullable'],
+                    "comment": row['column_comment']
+                })
+                if row['pk_position'] is not None:
+                    pk_positions.setdefault(row['table_name'], []).append((row['pk_position'], row['column_name']))
+
+            for row in conn.execute(self.BULK_FOREIGN_KEYS_QUERY, {"schema": self.db_schema}).mappings():
+                if row['table_name'] in schema:
+                    schema[row['table_name']]['foreign_keys'].append({
+                        "constrained_columns": list(row['constrained_columns']),
+                        "referred_table": row['referred_table'],
+                        "referred_columns": list(row['referred_columns'])
+                    })
+
+        for table_name, positions in pk_positions.items():
+            schema[table_name]['primary_key'] = [name for _, name in sorted(positions)]
+        return schema
+
+    @staticmethod
+    def format_schema_for_prompt(schema: Dict[str, Dict[str, Any]]) -> str:
+        """Render a structured schema as the concise text used in LLM prompts."""
         lines = []
-        tables = self.inspector.get_table_names()
-        for table_name in tables:
-            columns = [col['name'] for col in self.inspector.get_columns(table_name)]
-            fks = self.inspector.get_foreign_keys(table_name)
+        for table_name, table in schema.items():
+            columns = [col['name'] for col in table['columns']]
             line = f"- {table_name} ({', '.join(columns)})"
-            if fks:
-                for fk in fks:
-                    ref_table = fk['referred_table']
-                    local_cols = fk['constrained_columns']
-                    line += f"\n  Related to {ref_table} via {', '.join(local_cols)}"
+            for fk in table['foreign_keys']:
+                ref_table = fk['referred_table']
+                local_cols = fk['constrained_columns']
+                line += f"\n  Related to {ref_table} via {', '.join(local_cols)}"
             lines.append(line)
         return "\n".join(lines)
 
+    def get_schema_for_prompt(self) -> str:
+        """
+        Get a concise schema representation focusing on tables, columns, and relationships.
+        Ideal for providing minimal context to an LLM for SQL generation.
+        """
+        return self.format_schema_for_prompt(self.get_schema())
+
+    def load_schema(self, snapshot_path: str = df_snapshot) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the structured schema from the on-disk snapshot if it still matches the
+        catalog fingerprint; otherwise introspect the database and refresh the snapshot.
+        """
+        fingerprint = self.get_schema_fingerprint()
+        try:
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("fingerprint") == fingerprint:
+                return snapshot["schema"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        schema = self.get_schema()
+        snapshot = {
+            "fingerprint": fingerprint,
+            "created": datetime.now().isoformat(),
+            "schema": schema
+        }
+        try:
+            tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, snapshot_path)  # Atomic, so concurrent workers never read a partial file
+        except OSError as e:
+            print(f"Error writing schema snapshot: {str(e)}")
+        return schema
+
+    def get_schema_fingerprint(self) -> str:
+        """
+        Get a cheap fingerprint of the schema: a hash over table names and
+        their column names/types, read from the catalog in a single query.
+        Changes whenever a table or column is added, dropped, renamed or retyped.
+        """
+        query = text("""
+            SELECT c.relname, a.attname, a.atttypid
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE n.nspname = :schema AND c.relkind IN ('r', 'p', 'v', 'm')
+            ORDER BY c.relname, a.attnum
+        """)
+        digest = hashlib.sha256()
+        with self.engine.connect() as conn:
+            for relname, attname, atttypid in conn.execute(query, {"schema": self.db_schema}):
+                digest.update(f"{relname}.{attname}:{atttypid}\n".encode())
+        return digest.hexdigest()
+
+    def get_view_columns(self) -> Dict[str, List[str]]:
+        """
+        Get the column names of every view and materialized view in the schema,
+        in a single catalog query. load_schema() covers tables only.
+        """
+        query = text("""
+            SELECT c.relname, a.attname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE n.nspname = :schema AND c.relkind IN ('v', 'm')
+            ORDER BY c.relname, a.attnum
+        """)
+        views: Dict[str, List[str]] = {}
+        with self.engine.connect() as conn:
+            for relname, attname in conn.execute(query, {"schema": self.db_schema}):
+                views.setdefault(relname, []).append(attname)
+        return views
+
+    def get_column_stats(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Get planner statistics per column from pg_stats: the estimated number of
+        distinct values (negative n_distinct is resolved against the table's row
+        estimate), the average width in bytes and the fraction of NULLs.
+        Columns of tables that were never analyzed are missing.
+        """
+        query = text("""
+            SELECT s.tablename, s.attname, s.n_distinct, s.avg_width, s.null_frac, c.reltuples
+            FROM pg_stats s
+            JOIN pg_namespace n ON n.nspname = s.schemaname
+            JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+            WHERE s.schemaname = :schema
+        """)
+        stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self.engine.connect() as conn:
+            for table, column, n_distinct, avg_width, null_frac, reltuples in conn.execute(query, {"schema": self.db_schema}):
+                if n_distinct < 0:
+                    n_distinct = -n_distinct * max(reltuples, 0)
+                stats.setdefault(table, {})[column] = {
+                    "n_distinct": float(n_distinct),
+                    "avg_width": int(avg_width),
+                    "null_frac": float(null_frac)
+                }
+        return stats
+
 if __name__ == "__main__":
     inspector = DVDRentalInspector()
     print(inspector.get_schema_for_prompt())
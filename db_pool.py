@@ -0,0 +1,273 @@
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, Mapping
+import asyncio
+import configparser
+import threading
+import time
+import weakref
+import asyncpg
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+config_file = "database/database.ini"
+env = 'local'
+
+DEFAULT_MIN_SIZE = 2
+DEFAULT_MAX_SIZE = 10
+DEFAULT_TIMEOUT = 30.0
+
+
+class ConnectionPool:
+    """
+    A shared PostgreSQL connection pool.
+
+    Built on a single SQLAlchemy engine so that the schema inspector can use the
+    engine directly while raw psycopg2 callers (query execution, value lookups)
+    borrow DBAPI connections from the same pool.
+    """
+    def __init__(self, db_config: Mapping[str, str], min_size: int = DEFAULT_MIN_SIZE,
+                 max_size: int = DEFAULT_MAX_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Parameters:
+            db_config: Connection settings (host, database, user, password).
+            min_size (int): Connections kept open in the pool.
+            max_size (int): Upper bound on simultaneously open connections.
+            timeout (float): Seconds to wait for a free connection before failing.
+        """
+        if max_size < min_size:
+            raise ValueError(f"max_size ({max_size}) must be >= min_size ({min_size})")
+        self.min_size = min_size
+        self.max_size = max_size
+        db_url = f"postgresql+psycopg2://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
+        self.engine: Engine = create_engine(
+            db_url,
+            pool_size=min_size,
+            max_overflow=max_size - min_size,
+            pool_timeout=timeout,
+            pool_pre_ping=True  # Health check on every checkout
+        )
+        self._lock = threading.Lock()
+        self._metrics = {
+            "connections_opened": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "checkout_failures": 0
+        }
+        event.listen(self.engine.pool, "connect", self._on_connect)
+        event.listen(self.engine.pool, "checkout", self._on_checkout)
+        event.listen(self.engine.pool, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self._incr("connections_opened")
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self._incr("checkouts")
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self._incr("checkins")
+
+    def _incr(self, key: str, amount: int = 1):
+        with self._lock:
+            self._metrics[key] += amount
+
+    def _record_wait(self, waited: float):
+        with self._lock:
+            self._metrics["wait_time_total"] += waited
+            self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], waited)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a raw psycopg2 connection; it is returned to the pool on exit."""
+        start = time.perf_counter()
+        try:
+            conn = self.engine.raw_connection()
+        except Exception:
+            self._incr("checkout_failures")
+            raise
+        finally:
+            self._record_wait(time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            # Closing the pooled proxy rolls back and hands the connection back
+            conn.close()
+
+    def warm_up(self):
+        """Open min_size connections up front so the first requests don't pay for them."""
+        conns = [self.engine.raw_connection() for _ in range(self.min_size)]
+        for conn in conns:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage and wait metrics."""
+        pool = self.engine.pool
+        with self._lock:
+            metrics = dict(self._metrics)
+        checkouts = metrics["checkouts"]
+        metrics.update({
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "wait_time_avg": metrics["wait_time_total"] / checkouts if checkouts else 0.0
+        })
+        return metrics
+
+    def dispose(self):
+        self.engine.dispose()
+
+
+class AsyncConnectionPool:
+    """
+    asyncpg-backed pool for the async request path.
+
+    The underlying asyncpg pool is created lazily on first use, because it is
+    bound to the event loop it was created in (uvicorn's loop for the API).
+    One is kept per running loop, so callers that start a loop per call
+    (asyncio.run in run_batch, benchmarks) never get a pool from a closed loop.
+    """
+    def __init__(self, db_config: Mapping[str, str], min_size: int = DEFAULT_MIN_SIZE,
+                 max_size: int = DEFAULT_MAX_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        if max_size < min_size:
+            raise ValueError(f"max_size ({max_size}) must be >= min_size ({min_size})")
+        self.db_config = dict(db_config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncpg.Pool]" = weakref.WeakKeyDictionary()
+        self._create_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        self._metrics = {
+            "checkouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "checkout_failures": 0,
+            "health_check_failures": 0
+        }
+
+    def _loop_pool(self) -> Optional[asyncpg.Pool]:
+        """The pool of the running event loop, if one was created; None outside a loop."""
+        try:
+            return self._pools.get(asyncio.get_running_loop())
+        except RuntimeError:
+            return None
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            create_lock = self._create_locks.setdefault(loop, asyncio.Lock())
+            async with create_lock:
+                pool = self._pools.get(loop)
+                if pool is None:
+                    pool = self._pools[loop] = await asyncpg.create_pool(
+                        host=self.db_config["host"],
+                        database=self.db_config["database"],
+                        user=self.db_config["user"],
+                        password=self.db_config["password"],
+                        min_size=self.min_size,
+                        max_size=self.max_size
+                    )
+        return pool
+
+    async def _acquire(self, pool: asyncpg.Pool) -> asyncpg.Connection:
+        conn = await pool.acquire(timeout=self.timeout)
+        try:
+            await conn.execute("SELECT 1")  # Health check on checkout
+            return conn
+        except Exception:
+            self._metrics["health_check_failures"] += 1
+            conn.terminate()
+            await pool.release(conn)
+            return await pool.acquire(timeout=self.timeout)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow an asyncpg connection; it is released back to the pool on exit."""
+        pool = await self._get_pool()
+        start = time.perf_counter()
+        try:
+            conn = await self._acquire(pool)
+        except Exception:
+            self._metrics["checkout_failures"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self._metrics["wait_time_total"] += waited
+            self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], waited)
+        self._metrics["checkouts"] += 1
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage and wait metrics."""
+        metrics = dict(self._metrics)
+        checkouts = metrics["checkouts"]
+        pool = self._loop_pool()
+        size = pool.get_size() if pool else 0
+        idle = pool.get_idle_size() if pool else 0
+        metrics.update({
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": size - idle,
+            "idle": idle,
+            "wait_time_avg": metrics["wait_time_total"] / checkouts if checkouts else 0.0
+        })
+        return metrics
+
+    async def close(self):
+        """Close the running event loop's pool."""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.close()
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_async_pools: Dict[tuple, AsyncConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool_settings(config_file: str = config_file) -> Dict[str, Any]:
+    """Read optional [pool] settings from the configuration file."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    section = config["pool"] if config.has_section("pool") else {}
+    return {
+        "min_size": int(section.get("min_size", DEFAULT_MIN_SIZE)),
+        "max_size": int(section.get("max_size", DEFAULT_MAX_SIZE)),
+        "timeout": float(section.get("timeout", DEFAULT_TIMEOUT))
+    }
+
+
+def _get_shared(registry: Dict[tuple, Any], pool_class, db_config: Optional[Mapping[str, str]], settings: Dict[str, Any]):
+    if db_config is None:
+        config = configparser.ConfigParser()
+        config.read(config_file)
+        db_config = config[env]
+    key = (db_config["host"], db_config["database"], db_config["user"])
+    pool = registry.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = registry.get(key)
+            if pool is None:
+                pool = pool_class(db_config, **{**_get_pool_settings(), **settings})
+                registry[key] = pool
+    return pool
+
+
+def get_pool(db_config: Optional[Mapping[str, str]] = None, **settings) -> ConnectionPool:
+    """
+    Return the process-wide pool for a database, creating it on first use.
+
+    Callers passing the same host/database/user share one pool. Pool sizing comes
+    from the [pool] section of database.ini unless overridden by keyword.
+    """
+    return _get_shared(_pools, ConnectionPool, db_config, settings)
+
+
+def get_async_pool(db_config: Optional[Mapping[str, str]] = None, **settings) -> AsyncConnectionPool:
+    """Async counterpart of get_pool, sized from the same [pool] settings."""
+    return _get_shared(_async_pools, AsyncConnectionPool, db_config, settings)
@@ -1,5 +1,5 @@
 import gradio as gr
-from main import create_workflow
+from main import get_workflow
 from langchain.schema import SystemMessage, HumanMessage
 import json
 from datetime import datetime
@@ -54,7 +54,7 @@ class ChatHistory:
 
 def process_query(question: str, chat_history: ChatHistory) -> tuple:
     """Process a single query and return the response"""
-    app = create_workflow()
+    app = get_workflow()
     
     # Build context from history
     context = chat_history.get_context_string()
@@ -0,0 +1,234 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import asyncio
+import bisect
+import functools
+import threading
+import time
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("text_sql")
+    _HAS_OTEL = True
+except ImportError:  # Spans are only kept in execution_history
+    _HAS_OTEL = False
+
+METRIC_PREFIX = "text_sql"
+# Seconds, from a cache hit to a slow LLM call
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text
+    exposition format by render(); no client library needed.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, list]] = {}  # labels -> [bucket counts..., sum, count]
+
+    def _declare(self, name: str, kind: str, help: str):
+        if name not in self._help:
+            self._help[name] = (kind, help)
+
+    def inc(self, name: str, value: float = 1.0, help: str = "", **labels: str):
+        """Add value to a counter."""
+        with self._lock:
+            self._declare(name, "counter", help)
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, help: str = "", **labels: str):
+        """Record one observation in a histogram."""
+        with self._lock:
+            self._declare(name, "histogram", help)
+            series = self._histograms.setdefault(name, {})
+            state = series.setdefault(_labels(labels), [0] * len(self.buckets) + [0.0, 0])
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):  # Larger values only count towards +Inf
+                state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._help.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """All metrics as Prometheus text (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._help.items()):
+                if help:
+                    lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                    continue
+                for labels, state in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, state):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(state[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class NodeRun:
+    """Measurements of one workflow node execution; one span."""
+    def __init__(self, node: str):
+        self.node = node
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.measures: Dict[str, float] = {}
+
+    def add(self, key: str, value: float):
+        self.measures[key] = self.measures.get(key, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"duration": round(self.duration or 0.0, 6),
+                **{k: round(v, 6) if isinstance(v, float) else v for k, v in self.measures.items()}}
+
+
+_current_run: ContextVar[Optional[NodeRun]] = ContextVar("text_sql_node_run", default=None)
+
+
+def record(key: str, value: float):
+    """
+    Add to a measurement of the running node; outside a node this does nothing.
+
+    Keys ending in '_seconds' are exported as histograms, others as counters,
+    both as text_sql_<key> labelled with the node.
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.add(key, value)
+
+
+@contextmanager
+def timed(key: str):
+    """Add the seconds spent in the block to the running node's key measurement."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(key, time.perf_counter() - start)
+
+
+def _message_tokens(message: Any) -> Tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def record_llm(message: Any, seconds: float):
+    """Record an LLM reply: its latency and the prompt and completion tokens the provider reported."""
+    prompt_tokens, completion_tokens = _message_tokens(message)
+    record("llm_seconds", seconds)
+    record("llm_calls", 1)
+    record("llm_prompt_tokens", prompt_tokens)
+    record("llm_completion_tokens", completion_tokens)
+
+
+def _finish(run: NodeRun, error: bool, span: Any):
+    status = "error" if error else "ok"
+    metrics.observe(f"{METRIC_PREFIX}_node_duration_seconds", run.duration,
+                    help="Workflow node execution time", node=run.node)
+    metrics.inc(f"{METRIC_PREFIX}_node_runs_total", help="Workflow node executions", node=run.node, status=status)
+    for key, value in run.measures.items():
+        if key.endswith("_seconds"):
+            metrics.observe(f"{METRIC_PREFIX}_{key}", value, node=run.node)
+        else:
+            metrics.inc(f"{METRIC_PREFIX}_{key}_total", value, node=run.node)
+    if span is not None:
+        span.set_attribute("text_sql.status", status)
+        for key, value in run.to_dict().items():
+            span.set_attribute(f"text_sql.{key}", value)
+
+
+def _with_measurements(state: Any, run: NodeRun) -> Tuple[Any, bool]:
+    """The node's output with its measurements added to its own execution_history entry."""
+    history = state.get("execution_history") if isinstance(state, dict) else None
+    if not history:
+        return state, False
+    for i in range(len(history) - 1, -1, -1):
+        if history[i].get("step") == run.node:
+            entry = {**history[i], **run.to_dict()}
+            return {**state, "execution_history": history[:i] + [entry] + history[i + 1:]}, "error" in entry
+    return state, False
+
+
+def _span(node: str):
+    return _tracer.start_as_current_span(f"{METRIC_PREFIX}.{node}") if _HAS_OTEL else nullcontext()
+
+
+def instrument_node(node: str, func: Callable) -> Callable:
+    """
+    Wrap a workflow node (sync or async) so each execution is timed and gets
+    a span: the duration and measurements recorded with record()/timed()/record_llm()
+    during the node go to the metrics, the OpenTelemetry span (when
+    opentelemetry is installed) and the node's execution_history entry.
+    """
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def awrapper(state):
+            run = NodeRun(node)
+            token = _current_run.set(run)
+            with _span(node) as span:
+                try:
+                    output = await func(state)
+                finally:
+                    _current_run.reset(token)
+                run.duration = time.perf_counter() - run.start
+                output, error = _with_measurements(output, run)
+                _finish(run, error, span)
+            return output
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(state):
+        run = NodeRun(node)
+        token = _current_run.set(run)
+        with _span(node) as span:
+            try:
+                output = func(state)
+            finally:
+                _current_run.reset(token)
+            run.duration = time.perf_counter() - run.start
+            output, error = _with_measurements(output, run)
+            _finish(run, error, span)
+        return output
+    return wrapper
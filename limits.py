@@ -0,0 +1,69 @@
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+from typing import Optional
+import asyncio
+import threading
+import time
+import weakref
+
+
+class ConcurrencyLimit:
+    """
+    Caps how many calls of one kind (LLM requests, database queries) run at once,
+    across both the sync (thread) and async (event loop) paths of the workflow.
+
+    asyncio semaphores belong to an event loop, so one is kept per running loop;
+    the thread semaphore and the per-loop semaphores are independent.
+    """
+    def __init__(self, limit: Optional[int] = None):
+        """
+        Parameters:
+            limit (int): Most concurrent calls; None for no limit.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be >= 1 or None, got {limit}")
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit) if limit else None
+        self._loop_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._active = 0
+        self.stats = {"calls": 0, "peak_active": 0, "wait_time_total": 0.0}
+
+    def _enter(self, waited: float):
+        with self._lock:
+            self._active += 1
+            self.stats["calls"] += 1
+            self.stats["peak_active"] = max(self.stats["peak_active"], self._active)
+            self.stats["wait_time_total"] += waited
+
+    def _exit(self):
+        with self._lock:
+            self._active -= 1
+
+    @contextmanager
+    def hold(self):
+        """Hold a slot for the duration of a blocking call."""
+        start = time.perf_counter()
+        with self._semaphore if self._semaphore else nullcontext():
+            self._enter(time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                self._exit()
+
+    @asynccontextmanager
+    async def ahold(self):
+        """Hold a slot for the duration of an awaited call."""
+        start = time.perf_counter()
+        semaphore = None
+        if self.limit:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                semaphore = self._loop_semaphores.get(loop)
+                if semaphore is None:
+                    semaphore = self._loop_semaphores[loop] = asyncio.Semaphore(self.limit)
+        async with semaphore if semaphore else nullcontext():
+            self._enter(time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                self._exit()
@@ -0,0 +1,110 @@
+from typing import Any, List, Optional
+import re
+import threading
+from result_set import ResultSet
+
+DEFAULT_MAX_ROWS = 5
+DEFAULT_MAX_COLUMNS = 3
+
+# Questions asking for interpretation rather than values always go to the LLM
+ANALYTICAL_WORDS = ("why", "explain", "compare", "comparison", "trend", "insight", "analy", "summar", "describe",
+                    "recommend", "should", "pattern", "difference", "correlat")
+# Column names that say nothing about the value, e.g. SELECT count(*)
+GENERIC_COLUMNS = {"count", "sum", "avg", "min", "max", "?column?", "coalesce", "round", "total", "result", "value"}
+
+
+def _format_value(value: Any, column: str = "") -> str:
+    if value is None:
+        return "no value"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, int):
+        # No thousands separators in years, ids and codes
+        plain = abs(value) < 10000 or re.search(r"(id|year|code|number)$", column.lower())
+        return str(value) if plain else f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+    return str(value)
+
+
+def _label(column: str) -> str:
+    """'rental_count' -> 'rental count'"""
+    return column.replace("_", " ").strip()
+
+
+def _join(items: List[str]) -> str:
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + f" and {items[-1]}"
+
+
+class LocalResponder:
+    """
+    Answers questions whose result is a single value or a small table from
+    templates, without an LLM call.
+
+    Policies:
+        'off'    always use the LLM
+        'scalar' answer single-value results (one row, one column) locally
+        'small'  also answer results of up to max_rows rows and max_columns columns
+
+    Truncated results and questions asking for analysis (why, compare, trend...)
+    always go to the LLM. stats counts how often each path was taken.
+    """
+    POLICIES = ("off", "scalar", "small")
+
+    def __init__(self, policy: str = "small", max_rows: int = DEFAULT_MAX_ROWS, max_columns: int = DEFAULT_MAX_COLUMNS):
+        """
+        Parameters:
+            policy (str): One of POLICIES.
+            max_rows (int): Most rows answered locally under the 'small' policy.
+            max_columns (int): Most columns answered locally under the 'small' policy.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}, got '{policy}'")
+        self.policy = policy
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+        self._lock = threading.Lock()
+        self.stats = {"local_scalar": 0, "local_table": 0, "llm": 0}
+
+    def _count(self, path: str):
+        with self._lock:
+            self.stats[path] += 1
+
+    def _is_local(self, question: str, result: ResultSet, truncated: bool) -> bool:
+        if self.policy == "off" or truncated or not result or not result.columns:
+            return False
+        words = question.lower()
+        if any(re.search(rf"\b{word}", words) for word in ANALYTICAL_WORDS):
+            return False
+        if len(result) == 1 and len(result.columns) == 1:
+            return True
+        return self.policy == "small" and len(result) <= self.max_rows and len(result.columns) <= self.max_columns
+
+    @staticmethod
+    def format_scalar(question: str, column: str, value: Any) -> str:
+        formatted = _format_value(value, column)
+        if column.lower() in GENERIC_COLUMNS:
+            return f"The answer to \"{question.strip()}\" is {formatted}."
+        return f"The {_label(column)} is {formatted}."
+
+    @staticmethod
+    def format_table(result: ResultSet) -> str:
+        rows = result.rows()
+        if len(result.columns) == 1:
+            values = [_format_value(row[0], result.columns[0]) for row in rows]
+            return f"The results are {_join(values)}."
+        lines = ["; ".join(f"{_label(c)}: {_format_value(v, c)}" for c, v in zip(result.columns, row)) for row in rows]
+        if len(lines) == 1:
+            return f"Found one result: {lines[0]}."
+        return f"Found {len(lines)} results:\n" + "\n".join(f"- {line}" for line in lines)
+
+    def respond(self, question: str, result: ResultSet, truncated: bool = False) -> Optional[str]:
+        """A templated answer for the result, or None when the LLM should answer."""
+        if not self._is_local(question, result, truncated):
+            self._count("llm")
+            return None
+        if len(result) == 1 and len(result.columns) == 1:
+            self._count("local_scalar")
+            return self.format_scalar(question, result.columns[0], result.rows()[0][0])
+        self._count("local_table")
+        return self.format_table(result)
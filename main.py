@@ -1,17 +1,31 @@
-from typing import Annotated, TypedDict, Literal, Optional, List, Dict, Any
+from typing import Annotated, TypedDict, Optional, List, Dict, Any, Tuple, Iterable
 from operator import add
 from datetime import datetime
+import threading
+import asyncio
+import time
 from dotenv import load_dotenv
 import json
 import configparser
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from decimal import Decimal
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.schema.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from db_inspector import DVDRentalInspector
-from query_patterns import ValuePatternExtractor
+from query_patterns import ValuePatternExtractor, discover_columns_to_check
+from db_pool import get_pool, get_async_pool
+from semantic_cache import SemanticSQLCache, CacheLookup
+from result_cache import ResultCache, canonicalize_sql, referenced_tables, table_names, fetch_change_counters, afetch_change_counters
+from schema_retriever import SchemaRetriever
+from sql_execution import stream_query, astream_query
+from sql_templates import StatementCache
+from result_set import ResultSet
+from result_digest import digest_result
+from local_responder import LocalResponder
+from limits import ConcurrencyLimit
+from cost_guard import CostGuard
+from sql_validator import SQLValidator
+from instrumentation import instrument_node, record, timed, record_llm
 
 load_dotenv()
 
@@ -29,12 +43,141 @@ columns_to_check = [
     ("category", "name")
 ]
 
-extractor = ValuePatternExtractor(columns_to_check,db_config)
+db_pool = get_pool(db_config)
+async_db_pool = get_async_pool(db_config)
+
+# 'python' matches misspelled values in-process; 'pg_trgm' lets Postgres do it
+# (run extractor.create_trigram_indexes() once to index columns_to_check)
+value_backend = "python"
+
+# Column values kept for recovery: memory budget, TTL and optional per-column TTLs ('table.column')
+value_cache_settings = {
+    "max_bytes": 256 * 1024 * 1024,
+    "ttl": 3600.0,
+    "column_ttls": {}
+}
+# Load columns_to_check in the background at API startup
+value_cache_warm_up = True
+# Columns of one failed query looked up concurrently
+value_lookup_workers = 4
+# Choose columns_to_check from pg_stats within the value cache budget instead of the list above
+discover_value_columns = False
 
 inspector = DVDRentalInspector()
-schema_info = inspector.get_schema_for_prompt()
+
+if discover_value_columns:
+    try:
+        columns_to_check = discover_columns_to_check(inspector, value_cache_settings["max_bytes"]) or columns_to_check
+    except Exception as e:
+        print(f"Error discovering columns for value recovery, using the configured list: {str(e)}")
+
+extractor = ValuePatternExtractor(columns_to_check,db_config,pool=db_pool,backend=value_backend,
+                                  cache_settings=value_cache_settings,max_workers=value_lookup_workers)
+
+# Send only the tables relevant to each question instead of the whole schema
+schema_pruning = True
+schema_top_k = 5
+# Check generated SQL against the schema before running it; fix trivial mistakes without the LLM
+sql_validation = True
+
+_schema = None
+_schema_info = None
+_schema_retriever = None
+_sql_validator = None
+_schema_lock = threading.RLock()
+
+def get_schema() -> Dict[str, Dict[str, Any]]:
+    """Structured schema, loaded on first use from the on-disk snapshot when it is current"""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                _schema = inspector.load_schema()
+    return _schema
+
+def get_schema_info() -> str:
+    """Full schema text for prompts"""
+    global _schema_info
+    if _schema_info is None:
+        with _schema_lock:
+            if _schema_info is None:
+                _schema_info = inspector.format_schema_for_prompt(get_schema())
+    return _schema_info
+
+def get_schema_retriever() -> SchemaRetriever:
+    """Table retrieval index, loaded from disk or built from the schema on first use"""
+    global _schema_retriever
+    if _schema_retriever is None:
+        with _schema_lock:
+            if _schema_retriever is None:
+                _schema_retriever = SchemaRetriever.load_or_build(
+                    get_schema(),
+                    inspector.get_schema_fingerprint(),
+                    embeddings.embed_documents,
+                    top_k=schema_top_k
+                )
+    return _schema_retriever
+
+def get_sql_validator() -> SQLValidator:
+    """Validator for generated SQL, built from the schema on first use"""
+    global _sql_validator
+    if _sql_validator is None:
+        with _schema_lock:
+            if _sql_validator is None:
+                try:
+                    views = inspector.get_view_columns()
+                except Exception as e:
+                    print(f"Error loading views, validating against tables only: {str(e)}")
+                    views = {}
+                _sql_validator = SQLValidator(get_schema(), views)
+    return _sql_validator
+
+def get_prompt_schema(question: str, question_embedding: Optional[List[float]] = None,
+                      extra_tables: Iterable[str] = ()) -> Tuple[str, List[str]]:
+    """Schema text for a prompt and the tables it covers: the relevant subset when pruning is on"""
+    if schema_pruning:
+        try:
+            retriever = get_schema_retriever()
+            tables = retriever.retrieve(question, question_embedding, extra_tables)
+            return inspector.format_schema_for_prompt(retriever.subset(tables)), tables
+        except Exception as e:
+            print(f"Error retrieving relevant schema, using the full schema: {str(e)}")
+    return get_schema_info(), list(get_schema())
 
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+
+# Validated SQL for previously answered questions, served without an LLM call
+sql_cache = SemanticSQLCache(
+    embed_fn=embeddings.embed_query,
+    aembed_fn=embeddings.aembed_query,
+    schema_fingerprint_fn=inspector.get_schema_fingerprint
+)
+
+# Results of read-only queries, invalidated by per-table change counters
+result_cache = ResultCache()
+
+# Rows fetched per query (None for no cap) and per round trip to the server-side cursor
+max_result_rows = 10000
+fetch_batch_size = 1000
+# Async execution runs queries as templates with their compared literals as parameters, so a query
+# shape seen before on a connection skips parsing and planning; templates kept per connection
+prepared_statement_cache_size = 100  # asyncpg keeps as many prepared statements per connection by default
+statement_cache = StatementCache(prepared_statement_cache_size)
+# Estimated tokens of query results sent to the response prompt
+response_token_budget = 2000
+# EXPLAIN generated SQL before running it: plans over max_cost/max_rows go back to recover_sql
+# ('recover') or run under statement_timeout_ms ('timeout'); 'off' runs everything as is
+cost_guard = CostGuard(policy="recover", max_cost=100_000, max_rows=1_000_000, statement_timeout_ms=5000)
+
+# Most LLM calls and query executions in flight at once, across requests and batch runs (None: unlimited)
+llm_concurrency = 16
+db_concurrency = 10
+llm_limit = ConcurrencyLimit(llm_concurrency)
+db_limit = ConcurrencyLimit(db_concurrency)
+
+# Answer single values ('scalar') or also small tables ('small') without the LLM; 'off' always asks it
+responder = LocalResponder(policy="small", max_rows=5, max_columns=3)
 
 
 class QueryState(TypedDict):
@@ -45,255 +188,505 @@ class QueryState(TypedDict):
     error: Optional[str]
     context: Dict
     execution_history: Annotated[List[Dict], add]  # Accumulates history
-    query_result: Optional[List[Dict]]
+    query_result: Optional[ResultSet]  # Column-wise; call to_dicts() for rows
+    result_truncated: bool  # More rows than max_result_rows were available
     response: Optional[str]  # Add the new field in QueryState
     recovery_attempts: int  # Add the new field in QueryState
 
+def _invoke_llm(messages: List[Any]) -> Any:
+    """LLM call within llm_limit, recorded in the running node's measurements"""
+    start = time.perf_counter()
+    with llm_limit.hold():
+        called = time.perf_counter()
+        reply = llm.invoke(messages)
+    record("llm_wait_seconds", called - start)
+    record_llm(reply, time.perf_counter() - called)
+    return reply
+
+async def _ainvoke_llm(messages: List[Any]) -> Any:
+    """Async variant of _invoke_llm"""
+    start = time.perf_counter()
+    async with llm_limit.ahold():
+        called = time.perf_counter()
+        reply = await llm.ainvoke(messages)
+    record("llm_wait_seconds", called - start)
+    record_llm(reply, time.perf_counter() - called)
+    return reply
+
+def _clean_sql(content: str) -> str:
+    """Strip markdown code fences from an LLM reply"""
+    return content.replace('```sql', '').replace('```', '').strip()
+
+
+def _sql_generation_messages(state: QueryState, schema_text: str) -> List[Any]:
+    #Generate SQL prompt
+    system_prompt = f"""you are a database expert in PostgreSQL. Generate a SQL query for the DVD rental database.
+    Your task is to convert natural language questions into SQL queries.
+    Do not make any assumptions about the data in the database. Always refer to the schema.
+    Schema: {schema_text}
+    Return only the SQL query without any explanations or markdown."""
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=state["question"])
+    ]
+
+def _sql_generated(state: QueryState, sql_query: str, lookup: CacheLookup,
+                   schema_tables: Optional[List[str]] = None) -> QueryState:
+    return {
+        **state,
+        "sql_query": sql_query,
+        # Keep the question embedding so execute_sql can cache the validated SQL,
+        # and the tables shown to the LLM so recover_sql starts from the same context
+        "context": {
+            **state.get("context", {}),
+            "question_embedding": lookup.embedding,
+            "schema_tables": schema_tables
+        },
+        "messages": [SystemMessage(content=f"Generated SQL Query:\n{sql_query}")],
+        "execution_history": [{
+            "step": "generate_sql",
+            "output": sql_query,
+            "cache_hit": lookup.match,
+            "timestamp": datetime.now().isoformat()
+        }]
+    }
+
+def _sql_generation_failed(state: QueryState, e: Exception) -> QueryState:
+    error_msg = f"Failed to generate SQL: {str(e)}"
+    return {
+        **state,
+        "error": error_msg,
+        "messages": [SystemMessage(content=f"Error: {error_msg}")],
+        "execution_history": [{
+            "step": "generate_sql",
+            "error": error_msg,
+            "timestamp": datetime.now().isoformat()
+        }]
+    }
+
 def generate_sql(state: QueryState) -> QueryState:
     """Generate PostgreSQL query from natural language"""
     try:
-        #Generate SQL prompt
-        system_prompt = f"""you are a database expert in PostgreSQL. Generate a SQL query for the DVD rental database.
-        Your task is to convert natural language questions into SQL queries.
-        Do not make any assumptions about the data in the database. Always refer to the schema.
-        Schema: {schema_info}
-        Return only the SQL query without any explanations or markdown."""
-
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=state["question"])
-        ]
-    
-        sql_query = llm.invoke(messages)
-        sql_query = sql_query.content.replace('```sql', '').replace('```', '').strip()
-        
-        return {
-            **state,
-            "sql_query": sql_query,
-            "messages": [SystemMessage(content=f"Generated SQL Query:\n{sql_query}")],
-            "execution_history": [{
-                "step": "generate_sql",
-                "output": sql_query,
-                "timestamp": datetime.now().isoformat()
-            }]
-        }
+        with timed("sql_cache_seconds"):
+            lookup = sql_cache.lookup(state["question"])
+        if lookup.sql is not None:
+            return _sql_generated(state, lookup.sql, lookup)
+
+        with timed("schema_seconds"):
+            schema_text, schema_tables = get_prompt_schema(state["question"], lookup.embedding)
+        sql_query = _invoke_llm(_sql_generation_messages(state, schema_text))
+        return _sql_generated(state, _clean_sql(sql_query.content), lookup, schema_tables)
+    except Exception as e:
+        return _sql_generation_failed(state, e)
 
+async def agenerate_sql(state: QueryState) -> QueryState:
+    """Async variant of generate_sql"""
+    try:
+        with timed("sql_cache_seconds"):
+            lookup = await sql_cache.alookup(state["question"])
+        if lookup.sql is not None:
+            return _sql_generated(state, lookup.sql, lookup)
+
+        with timed("schema_seconds"):
+            schema_text, schema_tables = get_prompt_schema(state["question"], lookup.embedding)
+        sql_query = await _ainvoke_llm(_sql_generation_messages(state, schema_text))
+        return _sql_generated(state, _clean_sql(sql_query.content), lookup, schema_tables)
     except Exception as e:
-        error_msg = f"Failed to generate SQL: {str(e)}"
-        return {
-            **state,
+        return _sql_generation_failed(state, e)
+
+
+def _sql_validated(state: QueryState, sql_query: str, repairs: List[str]) -> QueryState:
+    repaired = sql_query != state["sql_query"]
+    return {
+        **state,
+        "sql_query": sql_query,
+        "execution_history": [{
+            "step": "validate_sql",
+            "output": f"SQL repaired: {'; '.join(repairs)}" if repairs else "SQL validated",
+            "repairs": repairs,
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"SQL Query repaired:\n{sql_query}")] if repaired else []
+    }
+
+def _sql_validation_failed(state: QueryState, errors: List[str]) -> QueryState:
+    error_msg = f"SQL validation failed: {'; '.join(errors)}"
+    return {
+        **state,
+        "error": error_msg,
+        "execution_history": [{
+            "step": "validate_sql",
             "error": error_msg,
-            "messages": [SystemMessage(content=f"Error: {error_msg}")],
-            "execution_history": [{
-                "step": "generate_sql",
-                "error": error_msg,
-                "timestamp": datetime.now().isoformat()
-            }]
-        }
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"Error: {error_msg}")]
+    }
+
+def validate_sql(state: QueryState) -> QueryState:
+    """Check the SQL against the schema without a database round trip; errors go straight to recover_sql"""
+    if not sql_validation or state.get("error") is not None:
+        return {}
+    try:
+        result = get_sql_validator().validate(state["sql_query"])
+    except Exception as e:
+        # Never block a query on a validator bug; the database will judge it
+        print(f"Error validating SQL, executing it unchecked: {str(e)}")
+        return {}
+    if not result.valid:
+        return _sql_validation_failed(state, result.errors)
+    return _sql_validated(state, result.sql, result.repairs)
+
+async def avalidate_sql(state: QueryState) -> QueryState:
+    """Async variant of validate_sql; validation is local and fast, so it runs inline"""
+    return validate_sql(state)
+
+
+def _query_executed(state: QueryState, results: ResultSet, recovered_query: Optional[str],
+                    result_cache_hit: bool = False, truncated: bool = False) -> QueryState:
+    record("rows", len(results))
+    if results:
+        # Only SQL that actually answered the question is worth serving again
+        sql_cache.store(
+            state["question"],
+            recovered_query or state.get("sql_query", "").strip(),
+            state.get("context", {}).get("question_embedding")
+        )
+    return {
+        **state,
+        "query_result": results,
+        "result_truncated": truncated,
+        "execution_history": [{
+            "step": "execute_sql",
+            "output": f"Query executed successfully. {len(results)} rows returned.",
+            "recovered_query": recovered_query,
+            "result_cache_hit": result_cache_hit,
+            "truncated": truncated,
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"Query executed successfully. Found {len(results)} results.")]
+    }
+
+def _query_failed(state: QueryState, e: Exception) -> QueryState:
+    error_msg = f"Error executing query: {str(e)}"
+    return {
+        **state,
+        "error": error_msg,
+        "query_result": ResultSet.empty(),  # Initialize with an empty result instead of None
+        "execution_history": [{
+            "step": "execute_sql",
+            "error": error_msg,
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"Error: {error_msg}")]
+    }
+
+def _record_db_timings(timings: Dict[str, float]):
+    for phase, seconds in timings.items():
+        record(f"db_{phase}_seconds", seconds)
+
+def _record_value_lookup(suggestions: Dict[str, Any]):
+    # Split of the extractor's time between loading column values and fuzzy matching
+    for suggestion in suggestions.values():
+        for phase, seconds in suggestion.get("timing", {}).items():
+            record(f"value_{phase}_seconds", seconds)
 
 def execute_sql(state: QueryState) -> QueryState:
     """Execute the SQL query and return results"""
-    recovery = 0
     try:
         sql_query = state.get("sql_query", "").strip()
-        conn = psycopg2.connect(
-            host=db_config["host"],
-            database=db_config["database"],
-            user=db_config["user"],
-            password=db_config["password"]
-        )
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql_query)
-            results = cur.fetchall()
-
-            if len(results) == 0:
-                recovery += 1
+        recovered_query = None
+        canonical = canonicalize_sql(sql_query)
+        tables = referenced_tables(canonical)
+        timings = {}
+        start = time.perf_counter()
+        with db_limit.hold(), db_pool.connection() as conn:
+            record("db_wait_seconds", time.perf_counter() - start)
+            if tables:
+                counters = fetch_change_counters(conn, tables)
+                cached = result_cache.get(canonical, tables, counters)
+                if cached is not None:
+                    return _query_executed(state, cached, None, result_cache_hit=True)
+
+            # Over-budget plans raise QueryTooExpensive, which recover_sql gets as the error
+            with timed("explain_seconds"):
+                statement_timeout = cost_guard.check(conn, sql_query)
+
+            # Server-side cursor: at most max_result_rows rows leave the database
+            columns, rows, truncated = stream_query(conn, sql_query, max_result_rows, fetch_batch_size, timings,
+                                                    statement_timeout)
+
+        if len(rows) == 0:
+            # Value recovery checks out connections of its own from db_pool, so this
+            # request gives its connection and db_limit slot back while it runs
+            with timed("value_lookup_seconds"):
                 recovered_query, suggestions = extractor.recover_query(sql_query)
-                cur.execute(recovered_query)
-                results = cur.fetchall()
-                print(suggestions)
-
-             # Convert Decimal to float for JSON serialization
-            for row in results:
-                for key, value in row.items():
-                    if isinstance(value, Decimal):
-                        row[key] = float(value)
-            
-            return {
-                **state,
-                "query_result": results,
-                "execution_history": [{
-                    "step": "execute_sql",
-                    "output": f"Query executed successfully. {len(results)} rows returned.",
-                    "recovered_query": recovered_query if recovery else None,
-                    "timestamp": datetime.now().isoformat()
-                }],
-                "messages": [SystemMessage(content=f"Query executed successfully. Found {len(results)} results.")]
-            }
+            _record_value_lookup(suggestions)
+            with db_limit.hold(), db_pool.connection() as conn:
+                columns, rows, truncated = stream_query(conn, recovered_query, max_result_rows, fetch_batch_size,
+                                                        timings, statement_timeout)
+            print(suggestions)
+
+        _record_db_timings(timings)
+
+        results = ResultSet(columns, rows)
+        if tables and recovered_query is None and not truncated:
+            result_cache.put(canonical, tables, counters, results)
+        return _query_executed(state, results, recovered_query, truncated=truncated)
     except Exception as e:
-        error_msg = f"Error executing query: {str(e)}"
-        return {
-            **state,
-            "error": error_msg,
-            "query_result": [],  # Initialize with empty list instead of None
-            "execution_history": [{
-                "step": "execute_sql",
-                "error": error_msg,
-                "timestamp": datetime.now().isoformat()
-            }],
-            "messages": [SystemMessage(content=f"Error: {error_msg}")]
-        }
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        return _query_failed(state, e)
 
+async def aexecute_sql(state: QueryState) -> QueryState:
+    """Async variant of execute_sql using the asyncpg pool"""
+    try:
+        sql_query = state.get("sql_query", "").strip()
+        recovered_query = None
+        canonical = canonicalize_sql(sql_query)
+        tables = referenced_tables(canonical)
+        timings = {}
+        start = time.perf_counter()
+        async with db_limit.ahold(), async_db_pool.connection() as conn:
+            record("db_wait_seconds", time.perf_counter() - start)
+            if tables:
+                counters = await afetch_change_counters(conn, tables)
+                cached = result_cache.get(canonical, tables, counters)
+                if cached is not None:
+                    return _query_executed(state, cached, None, result_cache_hit=True)
+
+            with timed("explain_seconds"):
+                statement_timeout = await cost_guard.acheck(conn, sql_query)
+
+            columns, rows, truncated = await astream_query(conn, sql_query, max_result_rows, fetch_batch_size, timings,
+                                                           statement_timeout, statement_cache)
+
+        if len(rows) == 0:
+            # Value recovery is CPU-bound fuzzy matching; keep it off the event loop,
+            # and don't hold a connection or db_limit slot while it runs
+            with timed("value_lookup_seconds"):
+                recovered_query, suggestions = await asyncio.to_thread(extractor.recover_query, sql_query)
+            _record_value_lookup(suggestions)
+            # Same template as the failed query, so a connection that ran it reuses its prepared statement
+            async with db_limit.ahold(), async_db_pool.connection() as conn:
+                columns, rows, truncated = await astream_query(conn, recovered_query, max_result_rows,
+                                                               fetch_batch_size, timings, statement_timeout,
+                                                               statement_cache)
+            print(suggestions)
+
+        _record_db_timings(timings)
+
+        results = ResultSet(columns, rows)
+        if tables and recovered_query is None and not truncated:
+            result_cache.put(canonical, tables, counters, results)
+        return _query_executed(state, results, recovered_query, truncated=truncated)
+    except Exception as e:
+        return _query_failed(state, e)
+
+
+def _recovery_schema(state: QueryState) -> str:
+    # The tables generate_sql saw plus whatever the failed query touches
+    context = state.get("context", {})
+    extra_tables = list(context.get("schema_tables") or []) + list(table_names(canonicalize_sql(state["sql_query"])))
+    schema_text, _ = get_prompt_schema(state["question"], context.get("question_embedding"), extra_tables)
+    return schema_text
+
+def _recovery_messages(state: QueryState, schema_text: str) -> List[Any]:
+    # Create prompt for SQL recovery
+    system_prompt = f"""You are a database expert in PostgreSQL. Your task is to fix SQL queries 
+    that have errors. Analyze the error message and the original query, then provide a corrected 
+    version. 
+
+    When fixing queries:
+    1. Analyze the error message carefully
+    2. Do not make any assumptions about the data in the database. Always consider the schema and data types of columns
+    3. For "top N per group" queries, use window functions like ROW_NUMBER()
+    4. film.rating is an MPAA rating (text values like 'PG', 'R') and CANNOT be averaged
+    5. Ensure aggregation functions match column data types
+    
+    Database Schema:
+    {schema_text}
+    
+    Return only the corrected SQL query without any explanations or markdown."""
+
+     # Format execution history into a readable string
+    history = ""
+    if state.get("execution_history"):
+        history = "\nPrevious attempts:\n"
+        for entry in state["execution_history"]:
+            if "output" in entry:  # SQL correction attempt
+                history += f"- Recovery: {entry.get('output', '')}\n"
+            elif "error" in entry:  # Execution error
+                history += f"- Error: {entry.get('error', '')}\n"
+
+
+    context = {
+        "original_query": state["sql_query"],
+        "error_message": state["error"],
+        "original_question": state["question"] 
+    }
+
+    prompt = f"""
+    original question: {context['original_question']}
+    Original Query: {context['original_query']}
+    Error Message: {context['error_message']}
+    {history}
+ 
+    Please provide a corrected SQL query that resolves this error."""
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=prompt)
+    ]
+
+def _sql_recovered(state: QueryState, sql_query: str) -> QueryState:
+    return {
+        **state,  
+        "sql_query": sql_query,
+        "error": None,  
+        "execution_history": [{
+            "step": "recover_sql",
+            "output": f"SQL Query corrected based on error: {state['error']}",
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"SQL Query corrected:\n{sql_query}")],
+        "recovery_attempts": state.get("recovery_attempts", 0) + 1
+    }
+
+def _sql_recovery_failed(state: QueryState, e: Exception) -> QueryState:
+    error_msg = f"Failed to recover SQL: {str(e)}"
+    return {
+        **state,  
+        "error": error_msg,
+        "execution_history": [{
+            "step": "recover_sql",
+            "error": error_msg,
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"Error: {error_msg}")],
+        "recovery_attempts": state.get("recovery_attempts", 0) + 1 
+    }
 
 def recover_sql(state: QueryState) -> QueryState:
     """Attempt to fix SQL errors by analyzing the error message"""
     try:
-        # Create prompt for SQL recovery
-        system_prompt = f"""You are a database expert in PostgreSQL. Your task is to fix SQL queries 
-        that have errors. Analyze the error message and the original query, then provide a corrected 
-        version. 
-
-        When fixing queries:
-        1. Analyze the error message carefully
-        2. Do not make any assumptions about the data in the database. Always consider the schema and data types of columns
-        3. For "top N per group" queries, use window functions like ROW_NUMBER()
-        4. film.rating is an MPAA rating (text values like 'PG', 'R') and CANNOT be averaged
-        5. Ensure aggregation functions match column data types
-        
-        Database Schema:
-        {schema_info}
-        
-        Return only the corrected SQL query without any explanations or markdown."""
-
-         # Format execution history into a readable string
-        history = ""
-        if state.get("execution_history"):
-            history = "\nPrevious attempts:\n"
-            for entry in state["execution_history"]:
-                if "output" in entry:  # SQL correction attempt
-                    history += f"- Recovery: {entry.get('output', '')}\n"
-                elif "error" in entry:  # Execution error
-                    history += f"- Error: {entry.get('error', '')}\n"
-
-
-        context = {
-            "original_query": state["sql_query"],
-            "error_message": state["error"],
-            "original_question": state["question"] 
-        }
+        sql_query = _invoke_llm(_recovery_messages(state, _recovery_schema(state)))
+        return _sql_recovered(state, _clean_sql(sql_query.content))
+    except Exception as e:
+        return _sql_recovery_failed(state, e)
 
-        prompt = f"""
-        original question: {context['original_question']}
-        Original Query: {context['original_query']}
-        Error Message: {context['error_message']}
-        {history}
- 
-        Please provide a corrected SQL query that resolves this error."""
+async def arecover_sql(state: QueryState) -> QueryState:
+    """Async variant of recover_sql"""
+    try:
+        sql_query = await _ainvoke_llm(_recovery_messages(state, _recovery_schema(state)))
+        return _sql_recovered(state, _clean_sql(sql_query.content))
+    except Exception as e:
+        return _sql_recovery_failed(state, e)
+
+
+def _no_results_response(state: QueryState) -> QueryState:
+    return {
+        **state,
+        "response": "No results found for your query.",
+        "execution_history": [{
+            "step": "generate_response",
+            "output": "No results to summarize",
+            "timestamp": datetime.now().isoformat()
+        }]
+    }
 
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=prompt)
-        ]
+def _response_messages(state: QueryState) -> List[Any]:
+    system_prompt = """You are a helpful database analyst. Your task is to summarize SQL query results 
+    in natural language. Focus on key insights and patterns in the data. Be concise but informative."""
+
+    # Large results are summarized (statistics plus sampled rows) to stay within the budget
+    with timed("serialize_seconds"):
+        results_text = digest_result(state["query_result"], response_token_budget, state.get("result_truncated", False))
+    record("serialized_bytes", len(results_text.encode("utf-8")))
+    context = {
+        "question": state["question"],
+        "results": results_text
+    }
 
-        sql_query = llm.invoke(messages)
-        sql_query = sql_query.content.replace('```sql', '').replace('```', '').strip()
-        
-        return {
-            **state,  
-            "sql_query": sql_query,
-            "error": None,  
-            "execution_history": [{
-                "step": "recover_sql",
-                "output": f"SQL Query corrected based on error: {state['error']}",
-                "timestamp": datetime.now().isoformat()
-            }],
-            "messages": [SystemMessage(content=f"SQL Query corrected:\n{sql_query}")],
-            "recovery_attempts": state.get("recovery_attempts", 0) + 1
-        }
+    prompt = f"""
+    Original Question: {context['question']}
+    Query Results: {context['results']}
+    
+    Please provide a natural language summary of these results, highlighting key insights."""
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=prompt)
+    ]
+
+def _local_response(state: QueryState) -> Optional[str]:
+    # Single values and small tables are answered from templates without an LLM call
+    return responder.respond(state["question"], state["query_result"], state.get("result_truncated", False))
+
+def _response_generated(state: QueryState, response: str, local: bool = False) -> QueryState:
+    return {
+        **state,
+        "response": response,
+        "execution_history": [{
+            "step": "generate_response",
+            "output": "Generated natural language response",
+            "local_response": local,
+            "timestamp": datetime.now().isoformat()
+        }]
+    }
 
-    except Exception as e:
-        error_msg = f"Failed to recover SQL: {str(e)}"
-        return {
-            **state,  
+def _response_failed(state: QueryState, e: Exception) -> QueryState:
+    error_msg = f"Failed to generate response: {str(e)}"
+    return {
+        **state,
+        "error": error_msg,
+        "execution_history": [{
+            "step": "generate_response",
             "error": error_msg,
-            "execution_history": [{
-                "step": "recover_sql",
-                "error": error_msg,
-                "timestamp": datetime.now().isoformat()
-            }],
-            "messages": [SystemMessage(content=f"Error: {error_msg}")],
-            "recovery_attempts": state.get("recovery_attempts", 0) + 1 
-        }
-
+            "timestamp": datetime.now().isoformat()
+        }],
+        "messages": [SystemMessage(content=f"Error: {error_msg}")]
+    }
 
 def generate_response(state: QueryState) -> QueryState:
     """Generate a natural language response from SQL results"""
     try:
         if not state.get("query_result"):
-            return {
-                **state,
-                "response": "No results found for your query.",
-                "execution_history": state.get("execution_history", []) + [{
-                    "step": "generate_response",
-                    "output": "No results to summarize",
-                    "timestamp": datetime.now().isoformat()
-                }]
-            }
-
-        system_prompt = """You are a helpful database analyst. Your task is to summarize SQL query results 
-        in natural language. Focus on key insights and patterns in the data. Be concise but informative."""
-
-        context = {
-            "question": state["question"],
-            "results": json.dumps(state["query_result"], indent=2)
-        }
+            return _no_results_response(state)
 
-        prompt = f"""
-        Original Question: {context['question']}
-        Query Results: {context['results']}
-        
-        Please provide a natural language summary of these results, highlighting key insights."""
+        local = _local_response(state)
+        if local is not None:
+            return _response_generated(state, local, local=True)
 
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=prompt)
-        ]
+        response = _invoke_llm(_response_messages(state))
+        return _response_generated(state, response.content)
+    except Exception as e:
+        return _response_failed(state, e)
 
-        response = llm.invoke(messages)
-        
-        return {
-            **state,
-            "response": response.content,
-            "execution_history": state.get("execution_history", []) + [{
-                "step": "generate_response",
-                "output": "Generated natural language response",
-                "timestamp": datetime.now().isoformat()
-            }]
-        }
+async def agenerate_response(state: QueryState) -> QueryState:
+    """Async variant of generate_response"""
+    try:
+        if not state.get("query_result"):
+            return _no_results_response(state)
 
+        local = _local_response(state)
+        if local is not None:
+            return _response_generated(state, local, local=True)
+
+        response = await _ainvoke_llm(_response_messages(state))
+        return _response_generated(state, response.content)
     except Exception as e:
-        error_msg = f"Failed to generate response: {str(e)}"
-        return {
-            **state,
-            "error": error_msg,
-            "execution_history": state.get("execution_history", []) + [{
-                "step": "generate_response",
-                "error": error_msg,
-                "timestamp": datetime.now().isoformat()
-            }],
-            "messages": state.get("messages", []) + [
-                SystemMessage(content=f"Error: {error_msg}")
-            ]
-        }
+        return _response_failed(state, e)
 
 
 def route_after_recovery(state: QueryState):
     """Route after recovery based on attempt count"""
     if state.get("recovery_attempts", 0) >= 3:
         return END
+    return "validate_sql"
+
+def route_after_validation(state: QueryState):
+    """Invalid SQL goes back to recover_sql without touching the database"""
+    if state.get("error") is not None:
+        return "recover_sql" if state.get("recovery_attempts", 0) < 3 else END
     return "execute_sql"
 
 def route_by_error(state: QueryState):
@@ -307,14 +700,28 @@ def route_by_error(state: QueryState):
 def create_workflow() -> StateGraph:
     workflow = StateGraph(QueryState)
     
-    # Add nodes
-    workflow.add_node("generate_sql", generate_sql)
-    workflow.add_node("execute_sql", execute_sql)
-    workflow.add_node("recover_sql", recover_sql)
-    workflow.add_node("generate_response", generate_response)
+    # Add nodes; invoke() runs the sync implementations, ainvoke() the async ones
+    # Each node is timed and traced; see instrumentation.py
+    for name, func, afunc in [("generate_sql", generate_sql, agenerate_sql),
+                              ("validate_sql", validate_sql, avalidate_sql),
+                              ("execute_sql", execute_sql, aexecute_sql),
+                              ("recover_sql", recover_sql, arecover_sql),
+                              ("generate_response", generate_response, agenerate_response)]:
+        workflow.add_node(name, RunnableLambda(instrument_node(name, func), afunc=instrument_node(name, afunc)))
     
     # Create flow
-    workflow.add_edge("generate_sql", "execute_sql")
+    workflow.add_edge("generate_sql", "validate_sql")
+
+    # Valid (or locally repaired) SQL is executed, invalid SQL recovered
+    workflow.add_conditional_edges(
+        "validate_sql",
+        route_after_validation,
+        {
+            "execute_sql": "execute_sql",
+            "recover_sql": "recover_sql",
+            END: END
+        }
+    )
     
     # Add conditional edges from execute_sql based on error and attempts
     workflow.add_conditional_edges(
@@ -332,7 +739,7 @@ def create_workflow() -> StateGraph:
         "recover_sql",
         route_after_recovery,
         {
-            "execute_sql": "execute_sql",
+            "validate_sql": "validate_sql",
             END: END
         }
     )
@@ -344,21 +751,89 @@ def create_workflow() -> StateGraph:
     
     return workflow.compile()
 
-if __name__ == "__main__":
-    # Initialize app
-    app = create_workflow()
-    
-    # Initial state
-    config = {
-        "question": "What are the top 5 most rented movies in each category, including their rental count and average rating?",
+_workflow = None
+_workflow_lock = threading.Lock()
+
+def get_workflow():
+    """Return the process-wide compiled workflow, compiling it on first use.
+
+    The compiled graph keeps no per-run state, so the same instance can be
+    invoked concurrently from threads and asyncio tasks.
+    """
+    global _workflow
+    if _workflow is None:
+        with _workflow_lock:
+            if _workflow is None:
+                _workflow = create_workflow()
+    return _workflow
+
+def initial_state(question: str) -> QueryState:
+    """Workflow input for one question"""
+    return {
+        "messages": [],
+        "question": question,
         "sql_query": "",
         "error": None,
         "context": {},
         "execution_history": [],
-        "messages": [],
         "query_result": None,
-        "response": None
+        "response": None,
+        "recovery_attempts": 0
     }
+
+async def arun_batch(questions: List[str], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+    """
+    Answer many questions concurrently on the shared compiled workflow.
+
+    At most max_concurrency questions are in flight; within them LLM calls and
+    query executions are further capped by llm_limit and db_limit. A failing
+    question doesn't affect the others.
+
+    Returns:
+        List[Dict[str, Any]]: One result per question, in input order, with the
+            SQL, answer, row count, error and seconds taken ('elapsed') and
+            seconds after the batch started that it began ('started').
+    """
+    workflow = get_workflow()
+    gate = asyncio.Semaphore(max_concurrency)
+    batch_start = time.perf_counter()
+
+    async def answer(question: str) -> Dict[str, Any]:
+        async with gate:
+            start = time.perf_counter()
+            try:
+                final_state = await workflow.ainvoke(initial_state(question))
+                result = {
+                    "question": question,
+                    "sql_query": final_state.get("sql_query"),
+                    "answer": final_state.get("response"),
+                    "row_count": len(final_state.get("query_result") or []),
+                    "error": final_state.get("error")
+                }
+            except Exception as e:
+                result = {"question": question, "sql_query": None, "answer": None, "row_count": 0, "error": str(e)}
+            result["started"] = start - batch_start
+            result["elapsed"] = time.perf_counter() - start
+            return result
+
+    return await asyncio.gather(*(answer(q) for q in questions))
+
+def run_batch(questions: List[str], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+    """Blocking variant of arun_batch for scripts and nightly jobs"""
+    async def run() -> List[Dict[str, Any]]:
+        try:
+            return await arun_batch(questions, max_concurrency)
+        finally:
+            # The asyncpg pool belongs to this call's event loop, which asyncio.run closes
+            await async_db_pool.close()
+    return asyncio.run(run())
+
+if __name__ == "__main__":
+    # Initialize app
+    app = get_workflow()
+    
+    # Initial state
+    config = initial_state("What are the top 5 most rented movies in each category, including their rental count and average rating?")
     
     # Run workflow
     final_state = app.invoke(config)
@@ -374,7 +849,7 @@ if __name__ == "__main__":
         print("\nQuery Results:")
         results = final_state.get("query_result", [])
         if results:
-            print(json.dumps(results, indent=2))
+            print(json.dumps(results.to_dicts(), indent=2))
         else:
             print("No results found")
     print("\nGenerated Response:")  
@@ -387,6 +862,7 @@ if __name__ == "__main__":
         else:
             print(f"Output: {entry['output']}")
         print(f"Timestamp: {entry['timestamp']}")
+        print(f"Duration: {entry.get('duration', 0.0):.3f}s")
         
     print("\nSystem Messages:")
     for message in final_state.get("messages", []):
@@ -1,166 +1,291 @@
 from typing import Dict, List, Any, Optional, Tuple
-import re
+from concurrent.futures import ThreadPoolExecutor
+import time
 from typing import List, Tuple, Dict
 import configparser
-import psycopg2
-from fuzzywuzzy import fuzz, process
+from psycopg2 import sql
+from db_pool import ConnectionPool, get_pool
+from value_index import ValueIndex, DEFAULT_THRESHOLD, MAX_MATCHES, estimate_nbytes
+from value_cache import ValueCache, DEFAULT_MAX_BYTES, DEFAULT_WARM_UP_WORKERS
+from db_inspector import DVDRentalInspector
+from sql_tokens import Token, tokenize, table_aliases, qualified_name, identifier, string_value
+from sql_templates import parameterize
 
 config_file = "database/database.ini"
 env = 'local'
 
+# Similar values ranked inside Postgres; `%` and `<%` are served by GIN trigram indexes.
+# Table and column are filled in as quoted identifiers (psycopg2.sql.Identifier)
+PG_TRGM_SEARCH_QUERY = sql.SQL("""
+    SELECT value, round(100 * greatest(similarity(value, %(value)s), word_similarity(%(value)s, value)))::int AS score
+    FROM (
+        SELECT DISTINCT {column}::text AS value
+        FROM {table}
+        WHERE {column} %% %(value)s OR %(value)s <%% {column}
+    ) candidates
+    ORDER BY score DESC, value
+    LIMIT %(limit)s
+""")
+
 class ValuePatternExtractor:
-    def __init__(self, columns_to_check: List[Tuple[str, str]],db_config: Dict[str, str]):
+    # 'python' loads each column's distinct values into an in-process ValueIndex;
+    # 'pg_trgm' leaves the values in the database and ranks them with similarity()
+    BACKENDS = ("python", "pg_trgm")
+
+    def __init__(self, columns_to_check: List[Tuple[str, str]],db_config: Dict[str, str], pool: Optional[ConnectionPool] = None,
+                 backend: str = "python", cache_settings: Optional[Dict[str, Any]] = None, max_workers: int = 1):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}, got '{backend}'")
         self.columns_to_check = columns_to_check
         self.db_config = db_config  # New parameter for database connection
-        self.cache = {}  # Cache for column values
-        self.patterns = self._generate_patterns()
+        self.pool = pool or get_pool(db_config)  # Shared connection pool
+        self.backend = backend
+        self.max_workers = max_workers  # Columns looked up concurrently during recovery
+        # Column values as fuzzy lookup indexes, bounded by TTL and memory budget
+        self.cache = ValueCache(self._fetch_column_values, **(cache_settings or {}))
+        self._column_tables = self._index_columns()
+
+    def _fetch_column_values(self, column_name: str, table_name: str) -> List[str]:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL").format(
+                column=sql.Identifier(column_name), table=sql.Identifier(table_name)))
+            return [str(row[0]) for row in cur.fetchall()]
 
     def get_column_values(self, column_name: str, table_name: str) -> List[str]:
-        """Get all unique values for a specific column with caching."""
-        cache_key = f"{table_name}.{column_name}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        """Get all unique values for a specific column (upper-cased) with caching."""
+        return list(self.get_value_index(column_name, table_name).values)
 
+    def get_value_index(self, column_name: str, table_name: str) -> ValueIndex:
+        """Get the fuzzy lookup index over a column's unique values from the bounded cache."""
         try:
-            conn = psycopg2.connect(**self.db_config)
-            cur = conn.cursor()
-            cur.execute(f"SELECT DISTINCT {column_name} FROM {table_name} WHERE {column_name} IS NOT NULL")
-            values = [str(row[0]) for row in cur.fetchall()]
-            cur.close()
-            conn.close()
-            self.cache[cache_key] = values
-            return values
+            return self.cache.get(column_name, table_name)
         except Exception as e:
             print(f"Error fetching values for {column_name}: {str(e)}")
+            return ValueIndex([])
+
+    def warm_up(self, background: bool = True, max_workers: int = DEFAULT_WARM_UP_WORKERS):
+        """
+        Pre-load the values of every checked column in parallel so the first
+        failed query doesn't pay for the DISTINCT scans. No-op for the pg_trgm backend.
+        """
+        if self.backend != "python":
+            return None
+        if background:
+            return self.cache.start_warm_up(self.columns_to_check, max_workers)
+        self.cache.warm_up(self.columns_to_check, max_workers)
+        return None
+
+    def search_pg_trgm(self, value: str, column_name: str, table_name: str,
+                       threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, int]]:
+        """
+        Find similar values with pg_trgm without copying the column into the app.
+
+        Values are scored 0-100 by the better of similarity() and word_similarity(),
+        the latter standing in for partial matching of fragments such as LIKE '%Comed%'.
+        Needs the pg_trgm extension; see create_trigram_indexes().
+        """
+        if not value:
+            return []
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                # Transaction-local thresholds for the indexable % and <% operators
+                cur.execute(
+                    "SELECT set_config('pg_trgm.similarity_threshold', %(limit)s, true), "
+                    "set_config('pg_trgm.word_similarity_threshold', %(limit)s, true)",
+                    {"limit": str(threshold / 100)}
+                )
+                cur.execute(
+                    PG_TRGM_SEARCH_QUERY.format(column=sql.Identifier(column_name), table=sql.Identifier(table_name)),
+                    {"value": value, "limit": MAX_MATCHES}
+                )
+                return [(row[0], row[1]) for row in cur.fetchall()]
+        except Exception as e:
+            print(f"Error searching values for {column_name} with pg_trgm: {str(e)}")
             return []
 
+    def create_trigram_indexes(self):
+        """Create the pg_trgm extension and a GIN trigram index on every checked column."""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                for table, column in self.columns_to_check:
+                    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} USING gin ({column} gin_trgm_ops)").format(
+                        index=sql.Identifier(f"{table}_{column}_trgm_idx"), table=sql.Identifier(table),
+                        column=sql.Identifier(column)))
+                    print(f"Trigram index ready on {table}.{column}")
+            conn.commit()
+
     def find_similar_values(self, value: str, possible_values: List[str], threshold: float = 50) -> List[Tuple[str, int]]:
         """Find similar values using fuzzy matching with fuzzywuzzy."""
         if not value or not possible_values:
             return []
+        return ValueIndex(possible_values).search(value, threshold)
 
-        # Normalize input value and possible values
-        value = value.upper()
-        possible_values = [str(v).upper() for v in possible_values]
-
-        # Try exact token matching first
-        value_tokens = set(value.split())
-        exact_matches = []
-        for pv in possible_values:
-            pv_tokens = set(pv.split())
-            if value_tokens.intersection(pv_tokens):
-                score = fuzz.token_sort_ratio(value, pv)
-                if score >= threshold:
-                    exact_matches.append((pv, score))
-
-        if exact_matches:
-            return sorted(exact_matches, key=lambda x: x[1], reverse=True)
-
-        # Use multiple fuzzy matching strategies
-        matches = []
-        for pv in possible_values:
-            # Try different fuzzy matching algorithms
-            ratio = fuzz.ratio(value, pv)
-            partial_ratio = fuzz.partial_ratio(value, pv)
-            token_sort = fuzz.token_sort_ratio(value, pv)
-            token_set = fuzz.token_set_ratio(value, pv)
-            
-            # Take the highest score
-            best_score = max(ratio, partial_ratio, token_sort, token_set)
-            if best_score >= threshold:
-                matches.append((pv, best_score))
-
-        return sorted(matches, key=lambda x: x[1], reverse=True)[:5]
-
-    def _generate_patterns(self) -> List[Tuple[str, str, str, str]]:
-        # Templates
-        EQUALITY_PATTERN = r"(?:{col}|{table}\.{col})\s*=\s*'([^']*)'"
-        LIKE_PATTERN = r"(?:{col}|{table}\.{col})\s+LIKE\s+'%([^%]+)%'"
-        ILIKE_PATTERN = r"(?:{col}|{table}\.{col})\s+ILIKE\s+'%([^%]+)%'"
-
-        CONTEXT_TEMPLATE_EQ = r"(?i)(?:where|and)\s+(?:\w+\.)?{col}\s*=\s*'[^']*'"
-        CONTEXT_TEMPLATE_LIKE = r"(?i)(?:where|and)\s+(?:\w+\.)?{col}\s+LIKE\s+'%[^%]+%'"
-        CONTEXT_TEMPLATE_ILIKE = r"(?i)(?:where|and)\s+(?:\w+\.)?{col}\s+ILIKE\s+'%[^%]+%'"
-
-        generated_patterns = []
-
+    def _index_columns(self) -> Dict[str, List[str]]:
+        """Checked tables by column name, so each column reference is resolved with one lookup."""
+        column_tables: Dict[str, List[str]] = {}
         for table, column in self.columns_to_check:
-            # For equality
-            eq_pattern = EQUALITY_PATTERN.format(table=table, col=column)
-            eq_context = CONTEXT_TEMPLATE_EQ.format(col=column)
-            generated_patterns.append((eq_pattern, table, column, eq_context))
-
-            # For LIKE
-            like_pattern = LIKE_PATTERN.format(table=table, col=column)
-            like_context = CONTEXT_TEMPLATE_LIKE.format(col=column)
-            generated_patterns.append((like_pattern, table, column, like_context))
+            column_tables.setdefault(column.lower(), []).append(table.lower())
+        return column_tables
 
-            # For ILIKE
-            ilike_pattern = ILIKE_PATTERN.format(table=table, col=column)
-            ilike_context = CONTEXT_TEMPLATE_ILIKE.format(col=column)
-            generated_patterns.append((ilike_pattern, table, column, ilike_context))
-
-        return generated_patterns
+    @staticmethod
+    def _comparison_values(tokens: List[Token], i: int) -> Tuple[List[str], int]:
+        """
+        String literals compared with the column reference ending before tokens[i]
+        by =, LIKE, ILIKE or IN (...), and the index just past the comparison.
+        LIKE patterns are kept only for the '%value%' / 'value%' / '%value' forms.
+        """
+        n = len(tokens)
+        if i + 1 >= n:
+            return [], i
+        op, operand = tokens[i], tokens[i + 1]
+        if op.text == "=" and operand.kind == "string":
+            return [string_value(operand)], i + 2
+        if op.is_word("like", "ilike") and operand.kind == "string":
+            value = string_value(operand).strip("%")
+            return ([value] if value and "%" not in value else []), i + 2
+        if op.is_word("in") and operand.text == "(":
+            values, j = [], i + 2
+            while j + 1 < n and tokens[j].kind == "string" and tokens[j + 1].text in (",", ")"):
+                values.append(string_value(tokens[j]))
+                j += 2
+                if tokens[j - 1].text == ")":
+                    return values, j
+        return [], i
 
     def extract_value_patterns(self, query: str) -> List[Tuple[str, str, str, str]]:
+        """
+        Literal comparisons against checked columns as (value, table, column, context).
+
+        The query is tokenized once and scanned left to right, so the cost is linear
+        in its length regardless of how many columns are checked. Qualified references
+        are resolved through the query's table aliases; a bare column name is attributed
+        to the checked tables in the FROM clause having it, or to every checked table
+        having it when none is.
+        """
+        tokens = tokenize(query)
+        aliases = table_aliases(tokens)
+        from_tables = set(aliases.values())
         found_patterns = []
-        for pattern, table, column, context_pattern in self.patterns:
-            matches = re.finditer(pattern, query, re.IGNORECASE)
-            for match in matches:
-                context_match = re.search(context_pattern, query, re.IGNORECASE)
-                if context_match:
-                    context = context_match.group(0)
+        i, n = 0, len(tokens)
+        while i < n:
+            if identifier(tokens[i]) is None:
+                i += 1
+                continue
+            parts, j = qualified_name(tokens, i)
+            tables = self._column_tables.get(parts[-1])
+            values, end = self._comparison_values(tokens, j) if tables else ([], j)
+            if not values:
+                i = j
+                continue
+
+            if len(parts) > 1:
+                table = aliases.get(parts[-2], parts[-2])
+                tables = [table] if table in tables else []
+            else:
+                tables = [t for t in tables if t in from_tables] or tables
+
+            # Context runs from the WHERE/AND/... introducing the comparison to its end
+            start = tokens[i - 1].start if i > 0 and tokens[i - 1].is_word("where", "and", "or", "on", "having") else tokens[i].start
+            context = query[start:tokens[end - 1].end]
+            for table in tables:
+                for value in values:
                     # (extracted_value, table, column, context)
-                    found_patterns.append((match.group(1), table, column, context))
+                    found_patterns.append((value, table, parts[-1], context))
+            i = end
         return found_patterns
 
-    def analyze_query_and_suggest(self, failed_query: str) -> Dict[str, List[Tuple[str, int]]]:
-        """Analyze failed query and suggest similar values with confidence scores."""
+    def _suggest_for(self, value: str, table: str, column: str) -> Tuple[List[Tuple[str, int]], Dict[str, float]]:
+        """Similar values for one extracted literal, with the time spent loading and matching."""
+        start = time.perf_counter()
+        if self.backend == "pg_trgm":
+            # Fetching and matching are a single round trip
+            similar = self.search_pg_trgm(value, column, table)
+            return similar, {'fetch': 0.0, 'match': time.perf_counter() - start}
+        index = self.get_value_index(column, table)
+        fetched = time.perf_counter()
+        similar = index.search(value)
+        return similar, {'fetch': fetched - start, 'match': time.perf_counter() - fetched}
+
+    def analyze_query_and_suggest(self, failed_query: str, max_workers: Optional[int] = None) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Analyze failed query and suggest similar values with confidence scores.
+
+        Parameters:
+            failed_query (str): Query that returned no rows.
+            max_workers (int): Columns looked up concurrently; defaults to the extractor's setting.
+                With several columns the lookup takes as long as the slowest one, not their sum.
+        """
         suggestions = {}
         
         # Extract values and their context from the query
         extracted_patterns = self.extract_value_patterns(failed_query)
-        
-        for value, table, column, context in extracted_patterns:
-            possible_values = self.get_column_values(column, table)
-            similar = self.find_similar_values(value, possible_values)
-            
-            if similar:
-                key = f"{table}.{column}"
-                suggestions[key] = {
-                    'matches': similar,
-                    'context': context,
-                    'original': value
-                }
+        max_workers = max_workers or self.max_workers
+
+        if max_workers > 1 and len(extracted_patterns) > 1:
+            # Loading and scoring release the GIL (psycopg2, rapidfuzz), so threads overlap them
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(extracted_patterns))) as pool:
+                results = list(pool.map(lambda p: self._suggest_for(p[0], p[1], p[2]), extracted_patterns))
+        else:
+            results = [self._suggest_for(value, table, column) for value, table, column, _ in extracted_patterns]
+
+        for (value, table, column, context), (similar, timing) in zip(extracted_patterns, results):
+            # Every searched column is kept, so its time is reported even when nothing matched
+            key = f"{table}.{column}"
+            if key in suggestions and suggestions[key]['original'] != value:
+                # Several literals for one column, e.g. an IN list
+                key = f"{key}[{sum(k.startswith(key) for k in suggestions)}]"
+            suggestions[key] = {
+                'matches': similar,  # Empty when no value is similar enough
+                'context': context,
+                'original': value,
+                'table': table,
+                'column': column,
+                'timing': timing  # Seconds spent loading the column's values and matching
+            }
         
         return suggestions
 
+    @staticmethod
+    def _swap(literal: str, original: str, replacement: str) -> Optional[str]:
+        """The literal with original replaced; LIKE patterns keep their leading/trailing wildcards."""
+        if literal == original:
+            return replacement
+        if "%" in literal and literal.strip("%") == original:
+            return literal[:len(literal) - len(literal.lstrip("%"))] + replacement + literal[len(literal.rstrip("%")):]
+        return None
+
     def generate_recovery_query(self, failed_query: str, suggestions: Dict[str, Any]) -> str:
-        """Generate a new query using suggestions."""
+        """
+        Generate a new query using suggestions.
+
+        Only the compared literals of the query's template (see sql_templates)
+        are swapped, never text elsewhere in it, and only where they are compared
+        with the column the suggestion is for; the recovered query has the same
+        template as the failed one, so it reuses its prepared statement.
+        """
         if not suggestions:
             return failed_query
 
-        recovered_query = failed_query
+        template = parameterize(failed_query)
+        aliases = table_aliases(tokenize(failed_query))
+        values = {}
         for column_key, suggestion_data in suggestions.items():
             if suggestion_data['matches']:
                 best_match, score = suggestion_data['matches'][0]
                 original = suggestion_data['original']
-                context = suggestion_data['context']
-                
-                # Replace in the specific context rather than globally
-                recovered_query = recovered_query.replace(
-                    f"'{original}'",
-                    f"'{best_match}'"
-                )
-                
-                # If using LIKE, adjust the pattern
-                recovered_query = re.sub(
-                    rf"LIKE\s+'%{re.escape(original)}%'",
-                    f"LIKE '%{best_match}%'",
-                    recovered_query,
-                    flags=re.IGNORECASE)
+                for i, (param, column) in enumerate(zip(template.params, template.columns)):
+                    # Only literals compared with the suggestion's own column, e.g. not last_name = 'Jon'
+                    # when the suggestion is for first_name
+                    if i in values or not isinstance(param, str) or not column or column[-1] != suggestion_data['column']:
+                        continue
+                    if len(column) > 1 and aliases.get(column[-2], column[-2]) != suggestion_data['table']:
+                        continue
+                    swapped = self._swap(param, original, best_match)
+                    if swapped is not None:
+                        values[i] = swapped
 
-        return recovered_query
+        return template.substitute(values).sql if values else failed_query
 
     def recover_query(self, failed_query: str) -> Tuple[str, Dict[str, Any]]:
         """Main method to recover from query errors."""
@@ -170,6 +295,62 @@ class ValuePatternExtractor:
             return recovered_query, suggestions
         return failed_query, {}
 
+TEXT_TYPES = ("text", "character", "varchar", "char", "bpchar", "citext")
+SENSITIVE_COLUMNS = ("password", "hash", "token", "secret")
+
+
+def is_text_type(type_name: str) -> bool:
+    """Whether a column type is a scalar text type; arrays such as text[] are not."""
+    type_name = type_name.lower().strip()
+    return not type_name.endswith("]") and type_name.startswith(TEXT_TYPES)
+
+
+def discover_columns_to_check(inspector: DVDRentalInspector, max_bytes: int = DEFAULT_MAX_BYTES,
+                              max_avg_width: int = 64, min_distinct: int = 2) -> List[Tuple[str, str]]:
+    """
+    Choose columns for value recovery from the schema and pg_stats.
+
+    Candidates are text columns that hold short lookup values rather than free
+    text (avg_width <= max_avg_width), have at least min_distinct values, are
+    not foreign keys (their values live in the referenced table) and don't look
+    sensitive. They are ranked by the estimated size of their value index,
+    cardinality times width, and taken cheapest first while they fit in max_bytes.
+
+    Parameters:
+        inspector (DVDRentalInspector): Source of the schema and column statistics.
+        max_bytes (int): Memory budget, normally the value cache's max_bytes.
+        max_avg_width (int): Widest average value, in bytes, worth matching.
+        min_distinct (int): Fewest distinct values worth matching.
+
+    Returns:
+        List[Tuple[str, str]]: (table, column) pairs for ValuePatternExtractor.
+    """
+    schema = inspector.load_schema()
+    stats = inspector.get_column_stats()
+    candidates = []
+    for table, info in schema.items():
+        foreign = {c for fk in info['foreign_keys'] for c in fk['constrained_columns']}
+        for col in info['columns']:
+            column_stats = stats.get(table, {}).get(col['name'])
+            if (column_stats is None or col['name'] in foreign
+                    or not is_text_type(col['type'])
+                    or any(word in col['name'].lower() for word in SENSITIVE_COLUMNS)
+                    or column_stats['avg_width'] > max_avg_width
+                    or column_stats['n_distinct'] < min_distinct):
+                continue
+            size = estimate_nbytes(column_stats['n_distinct'], column_stats['avg_width'])
+            candidates.append((size, -column_stats['n_distinct'], table, col['name']))
+
+    columns, used = [], 0
+    for size, _, table, column in sorted(candidates):
+        if used + size > max_bytes:
+            continue
+        columns.append((table, column))
+        used += size
+    print(f"Discovered {len(columns)} of {len(candidates)} candidate columns for value recovery "
+          f"(~{used / 1024 / 1024:.1f} MB of {max_bytes / 1024 / 1024:.1f} MB)")
+    return columns
+
 # Example usage:
 if __name__ == "__main__":
     columns_to_check = [
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, FrozenSet
+import pickle
+import re
+import threading
+import zlib
+from result_set import ResultSet
+from sql_tokens import tokenize, table_references
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+# Statements that write, and functions whose result changes between identical calls
+_NON_CACHEABLE = re.compile(
+    r"\b(insert|update|delete|merge|truncate|create|alter|drop|grant|revoke|copy|call|do|"
+    r"now|random|nextval|setval|clock_timestamp|statement_timestamp|timeofday|"
+    r"current_date|current_time|current_timestamp|localtime|localtimestamp|for\s+update)\b"
+)
+_CTE_NAME = re.compile(r"(?:\bwith(?:\s+recursive)?|,)\s*(\w+)\s+as\s*\(")
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+|[^'\"\s/-]+|[-/]", re.S)
+
+CHANGE_COUNTERS_QUERY = """
+    SELECT relname, n_tup_ins + n_tup_upd + n_tup_del
+    FROM pg_stat_user_tables
+    WHERE relname = ANY(%s)
+"""
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Canonical form of a query for use as a cache key: comments removed, whitespace
+    collapsed, unquoted text lower-cased and any trailing semicolon dropped.
+    String literals and quoted identifiers are kept verbatim.
+    """
+    parts = []
+    for token in _TOKEN.findall(sql):
+        if token.startswith("--") or token.startswith("/*") or token.isspace():
+            parts.append(" ")
+        elif token[0] in "'\"":
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+    return " ".join("".join(parts).split()).rstrip("; ")
+
+
+def _strip_literals(canonical_sql: str) -> str:
+    return re.sub(r"'(?:[^']|'')*'", "''", canonical_sql)
+
+
+def table_names(canonical_sql: str) -> FrozenSet[str]:
+    """
+    Tables in the FROM lists and JOIN clauses of a canonical query, excluding
+    its own CTEs and set-returning functions.
+    """
+    ctes = set(_CTE_NAME.findall(_strip_literals(canonical_sql)))
+    tokens = tokenize(canonical_sql)
+    tables = set()
+    for ref in table_references(tokens):
+        if ref.end < len(tokens) and tokens[ref.end].text == "(":
+            continue  # FROM generate_series(...)
+        if ref.table not in ctes:
+            tables.add(ref.table)
+    return frozenset(tables)
+
+
+def referenced_tables(canonical_sql: str) -> Optional[FrozenSet[str]]:
+    """
+    Tables a read-only canonical query reads from, or None if the query is not
+    safe to cache (writes, volatile functions, or no table references).
+    """
+    text = _strip_literals(canonical_sql)
+    if not re.match(r"(select|with)\b", text) or _NON_CACHEABLE.search(text):
+        return None
+    return table_names(canonical_sql) or None
+
+
+def fetch_change_counters(conn, tables: FrozenSet[str]) -> Dict[str, int]:
+    """Per-table insert/update/delete counters from pg_stat_user_tables."""
+    with conn.cursor() as cur:
+        cur.execute(CHANGE_COUNTERS_QUERY, (list(tables),))
+        return {relname: changes for relname, changes in cur.fetchall()}
+
+
+async def afetch_change_counters(conn, tables: FrozenSet[str]) -> Dict[str, int]:
+    """Async variant of fetch_change_counters for asyncpg connections."""
+    rows = await conn.fetch(CHANGE_COUNTERS_QUERY.replace("%s", "$1::text[]"), list(tables))
+    return {row[0]: row[1] for row in rows}
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of query results keyed by canonical SQL.
+
+    Each entry remembers the pg_stat_user_tables change counters of the tables
+    its query reads; it is served only while those counters are unchanged.
+    Results are stored as compressed ResultSet pickles, so column names are
+    held once per entry and numeric columns as packed arrays.
+
+    Note that the statistics collector publishes counters at transaction end
+    (and may lag by up to a second under load), and TRUNCATE is not counted.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entry_bytes: int = DEFAULT_MAX_ENTRY_BYTES,
+                 enabled: bool = True):
+        """
+        Parameters:
+            max_bytes (int): Total budget for stored (compressed) results.
+            max_entry_bytes (int): Results larger than this are never cached.
+            enabled (bool): When False every lookup misses and nothing is stored.
+        """
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, Dict[str, int]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    @staticmethod
+    def _counters_valid(tables: FrozenSet[str], counters: Dict[str, int]) -> bool:
+        # Views and unknown relations have no counters, so they cannot be validated
+        return all(table in counters for table in tables)
+
+    def get(self, canonical_sql: str, tables: FrozenSet[str], counters: Dict[str, int]) -> Optional[ResultSet]:
+        """Cached result for the query if none of its tables changed since it was stored."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(canonical_sql)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            payload, stored_counters = entry
+            if stored_counters != {t: counters.get(t) for t in tables}:
+                self._remove(canonical_sql)
+                self.stats["invalidations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(canonical_sql)
+            self.stats["hits"] += 1
+        return pickle.loads(zlib.decompress(payload))
+
+    def put(self, canonical_sql: str, tables: FrozenSet[str], counters: Dict[str, int], results: ResultSet):
+        """Store a result read while the tables had the given change counters."""
+        if not self.enabled or not results or not self._counters_valid(tables, counters):
+            return
+        payload = zlib.compress(pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL))
+        if len(payload) > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._remove(canonical_sql)
+            self._entries[canonical_sql] = (payload, {t: counters[t] for t in tables})
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,127 @@
+from collections import Counter
+from typing import Any, Dict, List
+import json
+import numpy as np
+from result_set import ResultSet
+
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_TOP_K = 5
+CHARS_PER_TOKEN = 4  # Rough average for JSON-ish English text with cl100k/o200k tokenizers
+HEAD_ROWS = 5  # Leading rows always sampled: results are often ordered by relevance
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; close enough for budgeting without loading a tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _number(value: float) -> Any:
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+def column_stats(result: ResultSet, top_k: int = DEFAULT_TOP_K) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-column summary: NULL and distinct counts, min/max/mean/sum for numeric
+    columns (computed on the NumPy arrays) and the most frequent values otherwise.
+    """
+    stats = {}
+    for name in result.columns:
+        data = result.column_array(name)
+        if isinstance(data, np.ndarray) and data.dtype != np.bool_:
+            nulls = result.null_mask(name)
+            values = data if nulls is None else data[~nulls]
+            summary = {"type": "number", "nulls": len(data) - len(values)}
+            if len(values):
+                summary.update({
+                    "min": _number(values.min()),
+                    "max": _number(values.max()),
+                    "mean": _number(values.mean()),
+                    "sum": _number(values.sum()),
+                    "distinct": int(len(np.unique(values)))
+                })
+        else:
+            counts = Counter(v for v in result.column(name) if v is not None)
+            summary = {
+                "type": "boolean" if isinstance(data, np.ndarray) else "text",
+                "nulls": len(result) - sum(counts.values()),
+                "distinct": len(counts),
+                "top": [[value, count] for value, count in counts.most_common(top_k)]
+            }
+        stats[name] = summary
+    return stats
+
+
+def sample_indices(n: int, k: int) -> List[int]:
+    """The first rows, then rows spread evenly over the rest, always including the last."""
+    if n <= k:
+        return list(range(n))
+    head = min(HEAD_ROWS, k)
+    rest = np.linspace(head, n - 1, k - head).round().astype(int).tolist() if k > head else []
+    return sorted(set(range(head)) | set(rest))
+
+
+def _fit_stats(digest: Dict[str, Any], token_budget: int) -> str:
+    """
+    The digest as JSON, its column statistics cut down until it fits the budget:
+    first the most frequent values of text columns, then whole columns from the last.
+    """
+    text = json.dumps(digest, default=str)
+    if estimate_tokens(text) <= token_budget:
+        return text
+    columns = digest["columns"]
+    for summary in columns.values():
+        summary.pop("top", None)
+    text = json.dumps(digest, default=str)
+    names = list(columns)
+    while estimate_tokens(text) > token_budget and names:
+        del columns[names.pop()]
+        digest["columns_without_stats"] = digest.get("columns_without_stats", 0) + 1
+        text = json.dumps(digest, default=str)
+    return text
+
+
+def digest_result(result: ResultSet, token_budget: int = DEFAULT_TOKEN_BUDGET, truncated: bool = False,
+                  top_k: int = DEFAULT_TOP_K) -> str:
+    """
+    Text describing a query result for the response prompt, within token_budget.
+
+    Results that fit are passed as all their rows, in the same indented JSON
+    the prompt always used. Larger ones become a digest: the row count,
+    column statistics (cut down when they alone exceed the budget) and as
+    many sampled rows as the budget allows.
+
+    Parameters:
+        result (ResultSet): The query result.
+        token_budget (int): Estimated tokens the text may take.
+        truncated (bool): The result was cut at the row cap, so row counts are lower bounds.
+        top_k (int): Most frequent values listed per text column.
+    """
+    # Indented JSON costs several tokens per row, so larger results can't fit whole
+    if len(result) * len(result.columns) <= token_budget:
+        text = json.dumps(result.to_dicts(), indent=2, default=str)
+        if estimate_tokens(text) <= token_budget and not truncated:
+            return text
+
+    digest = {
+        "row_count": f"more than {len(result)} (only the first {len(result)} were fetched)" if truncated else len(result),
+        "columns": column_stats(result, top_k)
+    }
+    text = _fit_stats(digest, token_budget)
+    rows = result.rows()
+    if not rows:
+        return text
+    # Size the sample from the cost of the first rows, then halve it until it fits
+    head = [dict(zip(result.columns, row)) for row in rows[:HEAD_ROWS]]
+    tokens_per_row = estimate_tokens(json.dumps(head, default=str)) / len(head)
+    k = min(len(rows), int((token_budget - estimate_tokens(text)) / tokens_per_row))
+    while k > 0:
+        indices = sample_indices(len(rows), k)
+        sample = [dict(zip(result.columns, rows[i])) for i in indices]
+        digest["sample_rows"] = sample
+        digest["note"] = f"sample_rows shows {len(sample)} of the {len(result)} rows; use the column statistics for totals and ranges."
+        candidate = json.dumps(digest, default=str)
+        if estimate_tokens(candidate) <= token_budget:
+            return candidate
+        k //= 2
+    return text
@@ -0,0 +1,150 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import sys
+import numpy as np
+
+try:
+    import pyarrow as pa
+    _HAS_PYARROW = True
+except ImportError:  # to_arrow() is unavailable
+    _HAS_PYARROW = False
+
+
+def _typed_column(values: Sequence[Any]) -> Tuple[Any, Optional[np.ndarray]]:
+    """
+    A column as a NumPy array when its non-NULL values are all bool, all int or
+    all numbers, with a NULL mask if it has NULLs; otherwise the values as a tuple.
+    """
+    kinds = {type(v) for v in values if v is not None}
+    if kinds == {bool}:
+        dtype, fill = np.bool_, False
+    elif kinds == {int}:
+        dtype, fill = np.int64, 0
+    elif kinds and kinds <= {int, float}:
+        dtype, fill = np.float64, 0.0
+    else:
+        return tuple(values), None
+    nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    has_nulls = bool(nulls.any())
+    try:
+        array = np.array([fill if v is None else v for v in values] if has_nulls else values, dtype=dtype)
+    except OverflowError:  # Integers beyond int64
+        return tuple(values), None
+    return array, nulls if has_nulls else None
+
+
+class ResultSet:
+    """
+    A query result held column-wise: column names once, numeric and boolean
+    columns as NumPy arrays (with a NULL mask when needed) and other columns
+    as tuples. Rows are only materialized as dicts on request, e.g. at the
+    API boundary, and pickle compactly for the result cache.
+    """
+    __slots__ = ("columns", "_data", "_nulls", "_length")
+
+    def __init__(self, columns: List[str], rows: Sequence[Tuple[Any, ...]]):
+        """
+        Parameters:
+            columns: Column names in result order.
+            rows: Result rows as tuples, as returned by stream_query.
+        """
+        self.columns = list(columns)
+        self._length = len(rows)
+        self._data: List[Any] = []
+        self._nulls: List[Optional[np.ndarray]] = []
+        for values in (zip(*rows) if rows else [() for _ in self.columns]):
+            data, nulls = _typed_column(values)
+            self._data.append(data)
+            self._nulls.append(nulls)
+
+    @classmethod
+    def empty(cls) -> "ResultSet":
+        return cls([], [])
+
+    def __len__(self) -> int:
+        return self._length
+
+    def head(self, n: int) -> "ResultSet":
+        """The first n rows, sliced column-wise without converting the rest."""
+        head = ResultSet.__new__(ResultSet)
+        head.__setstate__((self.columns, [data[:n] for data in self._data],
+                           [nulls[:n] if nulls is not None else None for nulls in self._nulls],
+                           min(n, self._length)))
+        return head
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def column(self, name: str) -> List[Any]:
+        """Values of one column as Python objects, NULLs as None."""
+        i = self.columns.index(name)
+        return self._column_values(i)
+
+    def column_array(self, name: str):
+        """One column as stored: a NumPy array for numeric and boolean columns, otherwise a tuple."""
+        return self._data[self.columns.index(name)]
+
+    def null_mask(self, name: str) -> Optional[np.ndarray]:
+        """NULL mask of a NumPy-backed column, or None when it has no NULLs."""
+        return self._nulls[self.columns.index(name)]
+
+    def _column_values(self, i: int) -> List[Any]:
+        data, nulls = self._data[i], self._nulls[i]
+        values = data.tolist() if isinstance(data, np.ndarray) else list(data)
+        if nulls is not None:
+            for j in np.flatnonzero(nulls).tolist():
+                values[j] = None
+        return values
+
+    def rows(self) -> List[Tuple[Any, ...]]:
+        """Rows as tuples of Python objects."""
+        if not self.columns:
+            return []
+        return list(zip(*(self._column_values(i) for i in range(len(self.columns)))))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Rows as dicts, built one at a time."""
+        for row in self.rows():
+            yield dict(zip(self.columns, row))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """All rows as dicts: the list-of-dicts shape query results had before."""
+        return list(self)
+
+    def to_json(self, **kwargs) -> str:
+        """Compact JSON {"columns": [...], "rows": [[...], ...]} with column names written once."""
+        return json.dumps({"columns": self.columns, "rows": self.rows()}, **kwargs)
+
+    def to_arrow(self):
+        """The result as a pyarrow Table; needs pyarrow."""
+        if not _HAS_PYARROW:
+            raise ImportError("pyarrow is required for ResultSet.to_arrow()")
+        arrays = []
+        for i, data in enumerate(self._data):
+            if isinstance(data, np.ndarray):
+                arrays.append(pa.array(data, mask=self._nulls[i]))
+            else:
+                arrays.append(pa.array(list(data)))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the column data."""
+        size = 0
+        for data, nulls in zip(self._data, self._nulls):
+            if isinstance(data, np.ndarray):
+                size += data.nbytes
+            else:
+                size += sys.getsizeof(data) + sum(sys.getsizeof(v) for v in data)
+            if nulls is not None:
+                size += nulls.nbytes
+        return size
+
+    def __getstate__(self):
+        return self.columns, self._data, self._nulls, self._length
+
+    def __setstate__(self, state):
+        self.columns, self._data, self._nulls, self._length = state
+
+    def __repr__(self) -> str:
+        return f"ResultSet({len(self)} rows, columns={self.columns})"
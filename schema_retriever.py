@@ -0,0 +1,193 @@
+from typing import Callable, Dict, List, Any, Optional, Iterable, Set
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+import numpy as np
+
+DEFAULT_TOP_K = 5
+DEFAULT_LEXICAL_WEIGHT = 0.4
+
+index_file = "database/schema_index.json"
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split text and snake_case identifiers into crude singular lower-case terms."""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _table_document(table_name: str, table: Dict[str, Any]) -> str:
+    """Text describing a table for both the lexical and the embedding index."""
+    parts = [table_name, " ".join(col['name'] for col in table['columns'])]
+    if table.get('comment'):
+        parts.append(table['comment'])
+    parts.extend(col['comment'] for col in table['columns'] if col.get('comment'))
+    return ". ".join(parts)
+
+
+class SchemaRetriever:
+    """
+    Picks the tables relevant to a question so prompts carry only part of the schema.
+
+    Tables are scored by a blend of BM25 over their names, column names and
+    comments and cosine similarity between the question and table embeddings.
+    The top_k tables are then expanded along foreign keys: the tables they
+    reference, plus link tables that reference two or more selected tables
+    (e.g. film_category between film and category).
+    """
+    def __init__(self, schema: Dict[str, Dict[str, Any]], table_embeddings: Optional[Dict[str, List[float]]] = None,
+                 top_k: int = DEFAULT_TOP_K, lexical_weight: float = DEFAULT_LEXICAL_WEIGHT):
+        """
+        Parameters:
+            schema: Structured schema from DVDRentalInspector.get_schema().
+            table_embeddings: Embedding of each table document; None for lexical-only retrieval.
+            top_k (int): Number of tables selected before foreign-key expansion.
+            lexical_weight (float): Weight of the BM25 score against embedding similarity.
+        """
+        self.schema = schema
+        self.top_k = top_k
+        self.lexical_weight = lexical_weight
+        self.tables = list(schema)
+        self._documents = [Counter(_tokenize(_table_document(t, schema[t]))) for t in self.tables]
+        self._doc_lengths = np.array([sum(d.values()) for d in self._documents], dtype=np.float32)
+        doc_freq = Counter(term for doc in self._documents for term in doc)
+        n = len(self.tables)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+        self._embeddings = None
+        if table_embeddings:
+            matrix = np.array([table_embeddings[t] for t in self.tables], dtype=np.float32)
+            self._embeddings = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    @classmethod
+    def build(cls, schema: Dict[str, Dict[str, Any]], embed_documents_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+              **kwargs) -> "SchemaRetriever":
+        """
+        Build the index, embedding every table document in one batch call.
+        If embedding fails the index is lexical-only.
+        """
+        embeddings = None
+        if embed_documents_fn is not None:
+            documents = [_table_document(t, schema[t]) for t in schema]
+            try:
+                embeddings = dict(zip(schema, embed_documents_fn(documents)))
+            except Exception as e:
+                print(f"Error embedding schema, using lexical retrieval only: {str(e)}")
+        return cls(schema, embeddings, **kwargs)
+
+    def save(self, fingerprint: str, path: str = index_file):
+        """Persist the table embeddings next to the schema fingerprint they were built for."""
+        index = {
+            "fingerprint": fingerprint,
+            "created": datetime.now().isoformat(),
+            "table_embeddings": None if self._embeddings is None else {
+                t: self._embeddings[i].tolist() for i, t in enumerate(self.tables)
+            }
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_or_build(cls, schema: Dict[str, Dict[str, Any]], fingerprint: str,
+                      embed_documents_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                      path: str = index_file, **kwargs) -> "SchemaRetriever":
+        """Load the persisted index if it matches the schema fingerprint, otherwise rebuild and save it."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                index = json.load(f)
+            embeddings = index["table_embeddings"]
+            if index["fingerprint"] == fingerprint and (embeddings is None or set(embeddings) == set(schema)):
+                return cls(schema, embeddings, **kwargs)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        retriever = cls.build(schema, embed_documents_fn, **kwargs)
+        if embed_documents_fn is not None and retriever._embeddings is None:
+            return retriever  # Embedding failed; don't persist a degraded index
+        try:
+            retriever.save(fingerprint, path)
+        except OSError as e:
+            print(f"Error writing schema index: {str(e)}")
+        return retriever
+
+    def _bm25(self, question: str, k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+        terms = _tokenize(question)
+        avg_length = float(self._doc_lengths.mean()) if len(self._doc_lengths) else 1.0
+        scores = np.zeros(len(self.tables), dtype=np.float32)
+        for i, doc in enumerate(self._documents):
+            norm = k1 * (1 - b + b * self._doc_lengths[i] / avg_length)
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    scores[i] += self._idf[term] * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def score(self, question: str, question_embedding: Optional[List[float]] = None) -> Dict[str, float]:
+        """Relevance of every table to the question, in [0, 1]."""
+        lexical = self._bm25(question)
+        if lexical.max() > 0:
+            lexical = lexical / lexical.max()
+        if self._embeddings is None or question_embedding is None:
+            return dict(zip(self.tables, lexical.tolist()))
+        query = np.array(question_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        semantic = self._embeddings @ query
+        # Rescale so the best table scores 1 and the worst 0
+        spread = semantic.max() - semantic.min()
+        semantic = (semantic - semantic.min()) / spread if spread > 0 else np.zeros_like(semantic)
+        combined = self.lexical_weight * lexical + (1 - self.lexical_weight) * semantic
+        return dict(zip(self.tables, combined.tolist()))
+
+    def expand(self, tables: Iterable[str]) -> List[str]:
+        """Add tables referenced by the selection and link tables joining two or more selected tables."""
+        selected: Set[str] = {t for t in tables if t in self.schema}
+        expanded = set(selected)
+        for table in selected:
+            for fk in self.schema[table]['foreign_keys']:
+                expanded.add(fk['referred_table'])
+        for table, info in self.schema.items():
+            referred = {fk['referred_table'] for fk in info['foreign_keys']}
+            if len(referred & selected) >= 2:
+                expanded.add(table)
+        # Keep the schema's own ordering so prompts are stable
+        return [t for t in self.tables if t in expanded]
+
+    def retrieve(self, question: str, question_embedding: Optional[List[float]] = None,
+                 extra_tables: Iterable[str] = ()) -> List[str]:
+        """
+        Tables relevant to the question, FK-expanded, always including extra_tables.
+        When no table matches at all (no embedding and no term in common), every
+        table is returned, as when retrieval fails, rather than the first top_k.
+        """
+        scores = self.score(question, question_embedding)
+        if not scores or max(scores.values()) <= 0:
+            return list(self.tables)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self.top_k]
+        return self.expand(list(ranked) + list(extra_tables))
+
+    def subset(self, tables: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """The part of the schema covering the given tables."""
+        wanted = set(tables)
+        return {t: self.schema[t] for t in self.tables if t in wanted}
+
+
+if __name__ == "__main__":
+    # Build the index offline from the inspector output
+    from langchain_openai import OpenAIEmbeddings
+    from db_inspector import DVDRentalInspector
+
+    inspector = DVDRentalInspector()
+    retriever = SchemaRetriever.build(
+        inspector.load_schema(),
+        OpenAIEmbeddings(model="text-embedding-3-small").embed_documents
+    )
+    retriever.save(inspector.get_schema_fingerprint())
+    print(f"Indexed {len(retriever.tables)} tables into {index_file}")
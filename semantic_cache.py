@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Awaitable, List, Optional
+import asyncio
+import re
+import threading
+import time
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL = 3600.0
+DEFAULT_SCHEMA_CHECK_INTERVAL = 60.0
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    sql: str
+    embedding: Optional[np.ndarray]
+    created: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class CacheLookup:
+    sql: Optional[str]  # None on a miss
+    embedding: Optional[List[float]]  # Embedding of the asked question, reused by store()
+    match: Optional[str] = None  # 'exact' or 'semantic'
+    similarity: float = 0.0
+
+
+class SemanticSQLCache:
+    """
+    Cache of validated SQL keyed by normalized question text and its embedding.
+
+    Questions are first matched on their normalized text; otherwise the cached
+    question with the highest cosine similarity is served if it clears the
+    threshold. Entries are evicted LRU beyond max_entries and expire after ttl
+    seconds. The whole cache is dropped when the schema fingerprint changes.
+    """
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]] = None,
+                 aembed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                 schema_fingerprint_fn: Optional[Callable[[], str]] = None,
+                 similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL,
+                 schema_check_interval: float = DEFAULT_SCHEMA_CHECK_INTERVAL, enabled: bool = True):
+        """
+        Parameters:
+            embed_fn: Returns the embedding of a question; None disables semantic matching.
+            aembed_fn: Async counterpart of embed_fn used by alookup().
+            schema_fingerprint_fn: Returns a fingerprint of the database schema.
+            similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+            max_entries (int): LRU capacity.
+            ttl (float): Seconds an entry stays valid.
+            schema_check_interval (float): Seconds between schema fingerprint checks.
+            enabled (bool): When False every lookup misses and nothing is stored.
+        """
+        self.embed_fn = embed_fn
+        self.aembed_fn = aembed_fn
+        self.schema_fingerprint_fn = schema_fingerprint_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.schema_check_interval = schema_check_interval
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._schema_fingerprint: Optional[str] = None
+        self._schema_checked_at = float("-inf")
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Lower-case, drop punctuation and collapse whitespace."""
+        question = re.sub(r"[^\w\s]", " ", question.lower())
+        return " ".join(question.split())
+
+    def _schema_check_due(self) -> bool:
+        return (self.schema_fingerprint_fn is not None
+                and time.monotonic() - self._schema_checked_at >= self.schema_check_interval)
+
+    def _check_schema(self):
+        if not self._schema_check_due():
+            return
+        self._schema_checked_at = time.monotonic()
+        try:
+            fingerprint = self.schema_fingerprint_fn()
+        except Exception as e:
+            print(f"Error fetching schema fingerprint: {str(e)}")
+            return
+        with self._lock:
+            if self._schema_fingerprint is not None and fingerprint != self._schema_fingerprint:
+                self._entries.clear()
+                self.stats["invalidations"] += 1
+            self._schema_fingerprint = fingerprint
+
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def _match_exact(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry, time.monotonic()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry
+
+    def _match_semantic(self, embedding: Optional[List[float]]) -> CacheLookup:
+        if embedding is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return CacheLookup(sql=None, embedding=None)
+
+        query = np.array(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if self._is_expired(e, now)]:
+                del self._entries[key]
+            candidates = [(k, e) for k, e in self._entries.items() if e.embedding is not None]
+            if candidates:
+                matrix = np.stack([e.embedding for _, e in candidates])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.stats["semantic_hits"] += 1
+                    return CacheLookup(sql=entry.sql, embedding=embedding, match="semantic",
+                                       similarity=float(scores[best]))
+            self.stats["misses"] += 1
+        return CacheLookup(sql=None, embedding=embedding)
+
+    def _embed_error(self, e: Exception):
+        print(f"Error embedding question, falling back to exact matching: {str(e)}")
+
+    def lookup(self, question: str) -> CacheLookup:
+        """Return cached SQL for the question or a near-duplicate of it."""
+        if not self.enabled:
+            return CacheLookup(sql=None, embedding=None)
+        self._check_schema()
+        entry = self._match_exact(self.normalize(question))
+        if entry is not None:
+            return CacheLookup(sql=entry.sql, embedding=None, match="exact", similarity=1.0)
+        embedding = None
+        if self.embed_fn is not None:
+            try:
+                embedding = self.embed_fn(question)
+            except Exception as e:
+                self._embed_error(e)
+        return self._match_semantic(embedding)
+
+    async def alookup(self, question: str) -> CacheLookup:
+        """Async variant of lookup."""
+        if not self.enabled:
+            return CacheLookup(sql=None, embedding=None)
+        if self._schema_check_due():
+            # The fingerprint is a blocking catalog query; keep it off the event loop
+            await asyncio.to_thread(self._check_schema)
+        entry = self._match_exact(self.normalize(question))
+        if entry is not None:
+            return CacheLookup(sql=entry.sql, embedding=None, match="exact", similarity=1.0)
+        embedding = None
+        if self.aembed_fn is not None:
+            try:
+                embedding = await self.aembed_fn(question)
+            except Exception as e:
+                self._embed_error(e)
+        return self._match_semantic(embedding)
+
+    def store(self, question: str, sql: str, embedding: Optional[List[float]] = None):
+        """Cache SQL that executed successfully for a question."""
+        if not self.enabled:
+            return
+        vector = None
+        if embedding is not None:
+            vector = np.array(embedding, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        key = self.normalize(question)
+        with self._lock:
+            existing = self._entries.get(key)
+            if vector is None and existing is not None:
+                vector = existing.embedding  # Exact-match hits carry no fresh embedding
+            entry = CacheEntry(question=question, sql=sql, embedding=vector)
+            if existing is not None and existing.sql == sql:
+                entry.created = existing.created  # Hits re-store the entry; its TTL still runs from the first store
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,13 +1,38 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, Tuple
+from langchain_core.messages import AIMessageChunk
+from typing import Optional, AsyncIterator, List
+import json
+import time
 import uvicorn
-from main import create_workflow
+from main import (get_workflow, initial_state, arun_batch, get_schema_info, get_schema_retriever,
+                  db_pool, async_db_pool, sql_cache, result_cache, extractor, value_cache_warm_up, responder,
+                  llm_limit, db_limit, cost_guard, statement_cache, get_sql_validator)
+from instrumentation import metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile the graph once at startup; every request reuses it
+    get_workflow()
+    db_pool.warm_up()
+    if value_cache_warm_up:
+        extractor.warm_up(background=True)
+    get_schema_info()
+    get_schema_retriever()
+    get_sql_validator()
+    yield
+    await async_db_pool.close()
+
+# Rows sent in the 'result' event of /sql/stream
+stream_preview_rows = 5
 
 app = FastAPI(
     title="SQL Query API",
     description="API for converting natural language questions to SQL and getting answers",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 class Question(BaseModel):
@@ -18,27 +43,101 @@ class Answer(BaseModel):
     sql_query: str
     answer: str
 
+class BatchRequest(BaseModel):
+    questions: List[str]
+    max_concurrency: int = 8
+
+class BatchAnswer(BaseModel):
+    question: str
+    sql_query: Optional[str]
+    answer: Optional[str]
+    row_count: int
+    error: Optional[str]
+    started: float
+    elapsed: float
+
+class BatchResponse(BaseModel):
+    results: List[BatchAnswer]
+    elapsed: float
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _stream_events(question: str) -> AsyncIterator[str]:
+    """
+    Server-sent events for one question, taken from the graph's astream:
+    node updates give the SQL, execution results and recoveries as soon as each
+    node finishes; LLM message chunks from generate_response give the answer tokens.
+    """
+    workflow = get_workflow()
+    final = {"question": question, "sql_query": "", "answer": None}
+    streamed_tokens = False
+    try:
+        async for mode, chunk in workflow.astream(initial_state(question), stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message, metadata = chunk
+                # Only the chat model's chunks: messages a node returns, such as its error, are emitted here too
+                if metadata.get("langgraph_node") == "generate_response" and isinstance(message, AIMessageChunk) \
+                        and message.content:
+                    streamed_tokens = True
+                    yield _sse("token", {"text": message.content})
+                continue
+
+            for node, update in chunk.items():
+                if node in ("generate_sql", "recover_sql") and update.get("sql_query"):
+                    final["sql_query"] = update["sql_query"]
+                    yield _sse("sql", {"sql_query": update["sql_query"], "recovered": node == "recover_sql"})
+                elif node == "validate_sql" and update:
+                    if update.get("error"):
+                        yield _sse("sql_error", {"error": update["error"]})
+                    elif update.get("sql_query") != final["sql_query"]:
+                        # Repaired locally
+                        final["sql_query"] = update["sql_query"]
+                        yield _sse("sql", {"sql_query": update["sql_query"], "recovered": False, "repaired": True})
+                elif node == "execute_sql":
+                    result = update.get("query_result")
+                    if update.get("error"):
+                        yield _sse("sql_error", {"error": update["error"]})
+                    elif result is not None:
+                        yield _sse("result", {
+                            "row_count": len(result),
+                            "truncated": update.get("result_truncated", False),
+                            "columns": result.columns,
+                            "preview": result.head(stream_preview_rows).to_dicts()
+                        })
+                elif node == "generate_response":
+                    if update.get("error"):
+                        yield _sse("error", {"detail": update["error"]})
+                        continue
+                    final["answer"] = update.get("response")
+                    if not streamed_tokens and final["answer"]:
+                        # Answered locally or without token streaming
+                        yield _sse("token", {"text": final["answer"]})
+        yield _sse("answer", final)
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+
+@app.post("/sql/stream")
+async def sql_stream(question: Question):
+    """
+    Like /sql, but streams text/event-stream events: 'sql' when the query is
+    generated (or recovered), 'result' with the row count and a preview once
+    it runs, 'token' chunks of the answer, then a final 'answer' event.
+    """
+    return StreamingResponse(
+        _stream_events(question.text),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/sql", response_model=Answer)
 async def sql(question: Question):
     try:
-        # Initialize the workflow
-        workflow = create_workflow()
-        
-        # Create initial state
-        initial_state = {
-            "messages": [],
-            "question": question.text,
-            "sql_query": "",
-            "error": None,
-            "context": {},
-            "execution_history": [],
-            "query_result": None,
-            "response": None,
-            "recovery_attempts": 0
-        }
+        # Shared compiled workflow
+        workflow = get_workflow()
         
-        # Run the workflow
-        final_state = workflow.invoke(initial_state)
+        # Run the workflow without blocking the event loop
+        final_state = await workflow.ainvoke(initial_state(question.text))
         
         return {
             "question": question.text,
@@ -48,9 +147,39 @@ async def sql(question: Question):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/sql/batch", response_model=BatchResponse)
+async def sql_batch(batch: BatchRequest):
+    """
+    Answer a list of questions concurrently. Each question gets its own result
+    and timings; failures are reported per question rather than failing the batch.
+    """
+    if batch.max_concurrency < 1:
+        raise HTTPException(status_code=422, detail="max_concurrency must be at least 1")
+    start = time.perf_counter()
+    results = await arun_batch(batch.questions, batch.max_concurrency)
+    return {"results": results, "elapsed": time.perf_counter() - start}
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "db_pool": db_pool.stats(),
+        "async_db_pool": async_db_pool.stats(),
+        "sql_cache": {**sql_cache.stats, "entries": len(sql_cache)},
+        "result_cache": {**result_cache.stats, "entries": len(result_cache), "bytes": result_cache.size_bytes},
+        "value_cache": {**extractor.cache.stats, "entries": len(extractor.cache), "bytes": extractor.cache.size_bytes},
+        "responder": {**responder.stats, "policy": responder.policy},
+        "llm_limit": {**llm_limit.stats, "limit": llm_limit.limit},
+        "db_limit": {**db_limit.stats, "limit": db_limit.limit},
+        "cost_guard": {**cost_guard.stats, "policy": cost_guard.policy},
+        "statement_cache": {**statement_cache.stats, "entries": len(statement_cache)},
+        "sql_validator": get_sql_validator().stats
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Per-node latency, token, database and serialization metrics for Prometheus to scrape"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run("sql_endpoint:app", host="0.0.0.0", port=8001, reload=True)
@@ -0,0 +1,237 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import re
+import time
+import uuid
+from sql_templates import StatementCache, StatementInfo, parameterize
+
+DEFAULT_MAX_ROWS = 10000
+DEFAULT_FETCH_SIZE = 1000
+
+# Statements that can back a server-side cursor (DECLARE ... CURSOR FOR)
+_CURSOR_STATEMENT = re.compile(r"\s*\(?\s*(select|with|values|table)\b", re.IGNORECASE)
+# Transaction-local, so the timeout ends with the query's transaction
+STATEMENT_TIMEOUT_QUERY = "SELECT set_config('statement_timeout', %s, true)"
+READ_ONLY_QUERY = "SET TRANSACTION READ ONLY"
+
+
+def is_cursor_statement(sql: str) -> bool:
+    """Whether sql is a SELECT-like statement: it returns rows and can be EXPLAINed without side effects."""
+    return bool(_CURSOR_STATEMENT.match(sql))
+
+
+def _isoformat(value) -> str:
+    return value.isoformat()
+
+
+# Result types that json.dumps can't serialize, by PostgreSQL type OID
+CONVERTERS = {
+    1700: float,  # numeric
+    1082: _isoformat,  # date
+    1083: _isoformat,  # time
+    1266: _isoformat,  # timetz
+    1114: _isoformat,  # timestamp
+    1184: _isoformat,  # timestamptz
+    1186: str,  # interval
+    2950: str,  # uuid
+}
+
+Rows = List[Tuple[Any, ...]]
+
+
+def column_converters(type_oids: Iterable[int]) -> List[Tuple[int, Callable]]:
+    """(column position, converter) for the result columns that need converting."""
+    return [(i, CONVERTERS[oid]) for i, oid in enumerate(type_oids) if oid in CONVERTERS]
+
+
+def convert_rows(rows: Iterable[Tuple[Any, ...]], converters: List[Tuple[int, Callable]]) -> Rows:
+    """Apply the converters column by column to a batch of rows; NULLs are left alone."""
+    rows = [tuple(row) for row in rows]
+    if not converters or not rows:
+        return rows
+    columns = list(zip(*rows))
+    for i, convert in converters:
+        columns[i] = [None if v is None else convert(v) for v in columns[i]]
+    return list(zip(*columns))
+
+
+def _batch_size(fetched: int, max_rows: Optional[int], fetch_size: int) -> int:
+    # One row past the cap tells whether the result was truncated
+    return fetch_size if max_rows is None else min(fetch_size, max_rows + 1 - fetched)
+
+
+def _capped(rows: Rows, max_rows: Optional[int]) -> Tuple[Rows, bool]:
+    if max_rows is not None and len(rows) > max_rows:
+        return rows[:max_rows], True
+    return rows, False
+
+
+def _add_timings(timings: Optional[Dict[str, float]], execute: float, fetch: float):
+    if timings is not None:
+        timings["execute"] = timings.get("execute", 0.0) + execute
+        timings["fetch"] = timings.get("fetch", 0.0) + fetch
+
+
+def _cursor_name() -> str:
+    return f"text_sql_{uuid.uuid4().hex}"
+
+
+def stream_query(conn, sql: str, max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+                 fetch_size: int = DEFAULT_FETCH_SIZE,
+                 timings: Optional[Dict[str, float]] = None,
+                 statement_timeout_ms: Optional[int] = None) -> Tuple[List[str], Rows, bool]:
+    """
+    Run a query on a psycopg2 connection and fetch at most max_rows rows.
+
+    SELECT-like statements run through a named (server-side) cursor, so rows
+    past the cap never leave the database; rows are fetched fetch_size at a
+    time and converted with per-column converters picked once from the
+    cursor description.
+
+    Parameters:
+        timings (dict): When given, seconds spent executing the statement and
+            fetching its rows are added to its 'execute' and 'fetch' keys. A
+            server-side cursor does most of the work of the query on its first
+            fetch, so that is counted as fetch time.
+        statement_timeout_ms (int): Server-side statement_timeout for SELECT-like
+            statements, local to the connection's current transaction.
+
+    The statement runs in a read-only transaction; the caller rolls it back.
+
+    Returns:
+        Tuple[List[str], Rows, bool]: Column names, rows as tuples, and whether
+            the result was cut at max_rows.
+    """
+    name = _cursor_name() if _CURSOR_STATEMENT.match(sql) else None
+    with conn.cursor() as cur:
+        # The pool rolls the connection back when it is returned; read-only makes sure nothing gets that far
+        cur.execute(READ_ONLY_QUERY)
+        if name is not None and statement_timeout_ms:
+            cur.execute(STATEMENT_TIMEOUT_QUERY, (str(int(statement_timeout_ms)),))
+    with conn.cursor(name=name) as cur:
+        if name is not None:
+            cur.itersize = fetch_size
+        start = time.perf_counter()
+        cur.execute(sql)
+        executed = time.perf_counter()
+        rows: Rows = []
+        converters = None
+        while True:
+            size = _batch_size(len(rows), max_rows, fetch_size)
+            if size <= 0:
+                break
+            if name is None and cur.description is None:
+                _add_timings(timings, executed - start, 0.0)
+                return [], [], False  # Statement without a result set
+            batch = cur.fetchmany(size)
+            if converters is None:
+                # A named cursor has no description until its first fetch
+                converters = column_converters(column.type_code for column in cur.description)
+            rows.extend(convert_rows(batch, converters))
+            if len(batch) < size:
+                break
+        columns = [column.name for column in cur.description] if cur.description else []
+    _add_timings(timings, executed - start, time.perf_counter() - executed)
+    rows, truncated = _capped(rows, max_rows)
+    return columns, rows, truncated
+
+
+async def _described(conn, text: str, statements: StatementCache):
+    """
+    Description of a query text from the cache, or prepared and cached, with
+    the PreparedStatement when it was just prepared. A cached text runs through
+    the connection's own statement cache, as conn.prepare() bypasses it.
+    """
+    info = statements.get(conn, text)
+    if info is not None:
+        return info, None
+    stmt = await conn.prepare(text)
+    info = StatementInfo.of(stmt)
+    statements.put(conn, text, info)
+    return info, stmt
+
+
+async def _describe(conn, sql: str, statements: Optional[StatementCache]):
+    """
+    The query to run, its arguments, its description and the PreparedStatement
+    to run it with, or None to run it through the connection's statement cache.
+    """
+    if statements is None:
+        stmt = await conn.prepare(sql)
+        return sql, [], StatementInfo.of(stmt), stmt
+    if not statements.parameterize:
+        info, stmt = await _described(conn, sql, statements)
+        return sql, [], info, stmt
+    template = parameterize(sql)
+    try:
+        # Describing the template tells the parameter types
+        info, stmt = await _described(conn, template.text, statements)
+    except Exception:
+        if not template.params:
+            raise  # The query itself is wrong
+        # Valid with its literals but not as a template, e.g. one string compared with
+        # columns of two types; a query that is wrong either way fails below with its own error
+        statements.count_unparameterized()
+        info, stmt = await _described(conn, sql, statements)
+        return sql, [], info, stmt
+    args = statements.bind(template, info)
+    if args is None:
+        info, stmt = await _described(conn, sql, statements)
+        return sql, [], info, stmt
+    return template.text, args, info, stmt
+
+
+async def astream_query(conn, sql: str, max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+                        fetch_size: int = DEFAULT_FETCH_SIZE,
+                        timings: Optional[Dict[str, float]] = None,
+                        statement_timeout_ms: Optional[int] = None,
+                        statements: Optional[StatementCache] = None) -> Tuple[List[str], Rows, bool]:
+    """
+    Async variant of stream_query for asyncpg connections.
+
+    Parameters:
+        statements (StatementCache): When given, the query runs as a template
+            with its compared literals as parameters (see sql_templates), so a
+            query shape seen before on the connection reuses its prepared statement;
+            with its parameterize setting off, only the same literal query does.
+            Without it the query is prepared on every run.
+    """
+    start = time.perf_counter()
+    query, args, info, stmt = await _describe(conn, sql, statements)
+    columns = list(info.columns)
+    converters = column_converters(info.column_types)
+    # Generated SQL never commits: asyncpg would autocommit a bare fetch, and
+    # leaving a transaction block commits it, so the transaction is read-only
+    # and always rolled back, as psycopg2's connection is when it goes back to the pool
+    transaction = conn.transaction(readonly=True)
+    await transaction.start()
+    try:
+        if not _CURSOR_STATEMENT.match(sql):
+            executed = time.perf_counter()
+            fetched = await (stmt.fetch(*args) if stmt is not None else conn.fetch(query, *args))
+            rows, truncated = _capped(convert_rows(fetched, converters), max_rows)
+            # Without a cursor execution and transfer are one round trip, counted as fetch
+            _add_timings(timings, executed - start, time.perf_counter() - executed)
+            return columns, rows, truncated
+
+        rows: Rows = []
+        if statement_timeout_ms:
+            await conn.execute(STATEMENT_TIMEOUT_QUERY.replace("%s", "$1"), str(int(statement_timeout_ms)))
+        cursor = await (stmt.cursor(*args) if stmt is not None else conn.cursor(query, *args))
+        executed = time.perf_counter()
+        while True:
+            size = _batch_size(len(rows), max_rows, fetch_size)
+            if size <= 0:
+                break
+            batch = await cursor.fetch(size)
+            rows.extend(convert_rows(batch, converters))
+            if len(batch) < size:
+                break
+    except Exception:
+        if statements is not None:
+            statements.discard(conn, query)  # The description may be stale, e.g. after a schema change
+        raise
+    finally:
+        await transaction.rollback()
+    _add_timings(timings, executed - start, time.perf_counter() - executed)
+    rows, truncated = _capped(rows, max_rows)
+    return columns, rows, truncated
@@ -0,0 +1,333 @@
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import datetime
+import threading
+import uuid
+from sql_tokens import Token, identifier, tokenize, string_value, quote_string
+
+DEFAULT_STATEMENT_CACHE_SIZE = 100  # Templates per connection; asyncpg's own statement cache holds as many
+DEFAULT_POOL_CONNECTIONS = 20  # Connections the default total bound leaves room for, two pools of db_pool's default size
+
+COMPARISON_OPERATORS = ("=", "<>", "!=", "<", ">", "<=", ">=")
+INT4_RANGE = (-2**31, 2**31 - 1)
+INT8_RANGE = (-2**63, 2**63 - 1)
+
+
+class QueryTemplate(NamedTuple):
+    sql: str  # The query as written, literals included
+    text: str  # The query with $1, $2... in place of the parameterized literals
+    params: List[Any]  # Values of $1, $2...: str for string literals, int or Decimal for numbers
+    literals: List[List[Token]]  # Tokens in sql of each parameter; a value compared twice with one expression has one parameter
+    columns: List[List[str]]  # Qualified name of the column each parameter is compared with, [] for other expressions
+
+    def substitute(self, values: Dict[int, Any]) -> "QueryTemplate":
+        """
+        The template with some parameters replaced, by position in params.
+        Only the literal tokens change, so the new query has the same text.
+        """
+        edits = sorted(((token, values[i]) for i in values for token in self.literals[i]),
+                       key=lambda edit: edit[0].start, reverse=True)
+        sql = self.sql
+        for token, value in edits:
+            sql = sql[:token.start] + format_literal(value) + sql[token.end:]
+        return parameterize(sql)
+
+
+def format_literal(value: Any) -> str:
+    """A SQL literal for a parameter value."""
+    return quote_string(value) if isinstance(value, str) else str(value)
+
+
+def _number_param(token: Token):
+    """Value and cast for a numeric literal; the cast keeps the type Postgres gives the literal itself."""
+    if "." in token.text or "e" in token.lower:
+        return Decimal(token.text), "numeric"
+    value = int(token.text)
+    if INT4_RANGE[0] <= value <= INT4_RANGE[1]:
+        return value, "integer"
+    if INT8_RANGE[0] <= value <= INT8_RANGE[1]:
+        return value, "bigint"
+    return Decimal(value), "numeric"
+
+
+def _is_literal(tokens: List[Token], i: int) -> bool:
+    """Whether tokens[i] is a whole operand on its own: a literal not followed by an operator, '.', '(' or '['."""
+    if tokens[i].kind not in ("string", "number"):
+        return False
+    after = tokens[i + 1] if i + 1 < len(tokens) else None
+    # '2005-05-24'::date is fine, 'a' || name is not: the parameter's type would come from ||
+    return after is None or after.text == "::" or (after.kind != "op" and after.text not in (".", "(", "["))
+
+
+def _in_list(tokens: List[Token], open_paren: int) -> Optional[List[int]]:
+    """Indexes of the literals of IN (lit, lit, ...) opening at open_paren, or None if it holds anything else."""
+    items, j = [], open_paren + 1
+    while j + 1 < len(tokens) and _is_literal(tokens, j) and tokens[j + 1].text in (",", ")"):
+        items.append(j)
+        j += 2
+        if tokens[j - 1].text == ")":
+            return items
+    return None
+
+
+def _operand_end(tokens: List[Token], op: int) -> int:
+    """Index just past the left-hand side of the comparison operator at op, before any NOT."""
+    return op - 1 if op > 0 and tokens[op - 1].is_word("not") else op
+
+
+def comparison_literals(tokens: List[Token]) -> List[Tuple[int, int]]:
+    """
+    Indexes of the literals that are compared with something: the right-hand
+    side of =, <>, <, >, <=, >=, [NOT] LIKE/ILIKE, IN (...) lists of literals
+    and BETWEEN ... AND .... Postgres infers a parameter's type from the other
+    side of the comparison, which is what it does for the literal too; literals
+    anywhere else (select lists, function arguments, LIMIT) are left in place.
+    Each literal comes with the index just past the expression it is compared with.
+    """
+    found: List[Tuple[int, int]] = []
+    i, n = 0, len(tokens)
+    while i < n - 1:
+        token = tokens[i]
+        if token.text in COMPARISON_OPERATORS or token.is_word("like", "ilike"):
+            if _is_literal(tokens, i + 1):
+                found.append((i + 1, _operand_end(tokens, i)))
+            i += 2
+            continue
+        if token.is_word("in") and tokens[i + 1].text == "(":
+            items = _in_list(tokens, i + 1)
+            if items:
+                found.extend((item, _operand_end(tokens, i)) for item in items)
+                i = items[-1] + 2
+                continue
+        if token.is_word("between") and i + 3 < n and tokens[i + 2].is_word("and") \
+                and _is_literal(tokens, i + 1) and _is_literal(tokens, i + 3):
+            found.extend(((i + 1, _operand_end(tokens, i)), (i + 3, _operand_end(tokens, i))))
+            i += 4
+            continue
+        i += 1
+    return found
+
+
+def compared_expression(tokens: List[Token], end: int) -> Tuple[Tuple[str, ...], List[str]]:
+    """
+    The expression ending just before tokens[end] that a literal is compared
+    with, as its token texts, and its qualified name when it is a plain column
+    reference (film.title, title) or [] otherwise. The expression is taken to
+    be names, parenthesized groups with their function name, '.' and '::'
+    casts, e.g. f.title, lower(title) or rental_date::date.
+    """
+    start, k = end, end - 1
+    while k >= 0:
+        if tokens[k].text == ")":
+            depth = 0
+            while k >= 0:
+                depth += {"(": -1, ")": 1}.get(tokens[k].text, 0)
+                if depth == 0:
+                    break
+                k -= 1
+            if k > 0 and identifier(tokens[k - 1]) is not None:
+                k -= 1  # Function name
+        elif identifier(tokens[k]) is None or tokens[k].lower in ("and", "or", "not", "where", "when", "on", "having"):
+            break
+        start = k
+        if k > 0 and tokens[k - 1].text in (".", "::"):
+            k -= 2
+        else:
+            break
+    expression = tokens[max(start, 0):end]
+    if expression and all(identifier(t) is not None if j % 2 == 0 else t.text == "."
+                          for j, t in enumerate(expression)):
+        return tuple(t.lower for t in expression), [identifier(t) for t in expression[::2]]
+    return tuple(t.lower for t in expression), []
+
+
+def parameterize(sql: str) -> QueryTemplate:
+    """
+    Split a query into a template and its literal values, so queries that
+    differ only in the values they compare against share one prepared
+    statement. String literals become untyped parameters, as the literals are
+    untyped; numbers keep their type with a cast ($1::integer, $2::numeric).
+    Identical literals compared with the same expression share a parameter, so
+    an expression repeated in GROUP BY (CASE WHEN length > 100 ...) is still the
+    same expression; a value compared with two different columns gets one
+    parameter per column, so either can be substituted on its own. A query
+    that already has placeholders is returned as is.
+    """
+    tokens = tokenize(sql)
+    if any(token.kind == "param" for token in tokens):
+        return QueryTemplate(sql, sql, [], [], [])
+    pieces, params, literals, columns, placeholders = [], [], [], [], []
+    index: Dict[tuple, int] = {}  # (compared expression, kind, literal text) -> parameter position
+    last = 0
+    for i, operand_end in comparison_literals(tokens):
+        token = tokens[i]
+        expression, column = compared_expression(tokens, operand_end)
+        # A literal compared with nothing recognizable gets a parameter of its own
+        key = (expression, token.kind, token.text) if expression else (i,)
+        if key not in index:
+            index[key] = len(params)
+            placeholder = f"${len(params) + 1}"
+            if token.kind == "string":
+                params.append(string_value(token))
+            else:
+                value, cast = _number_param(token)
+                params.append(value)
+                placeholder += f"::{cast}"
+            placeholders.append(placeholder)
+            literals.append([])
+            columns.append(column)
+        literals[index[key]].append(token)
+        pieces.append(sql[last:token.start] + placeholders[index[key]])
+        last = token.end
+    return QueryTemplate(sql, "".join(pieces) + sql[last:], params, literals, columns)
+
+
+# How a string parameter is passed for the type Postgres inferred for it, by type OID.
+# Text types take the string itself; types missing here make the query run unparameterized.
+PARAM_PARSERS: Dict[int, Callable[[str], Any]] = {
+    25: str, 1043: str, 1042: str, 19: str, 18: str, 705: str,  # text, varchar, bpchar, name, char, unknown
+    21: int, 23: int, 20: int,  # int2, int4, int8
+    700: float, 701: float,  # float4, float8
+    1700: Decimal,  # numeric
+    1082: datetime.date.fromisoformat,  # date
+    1083: datetime.time.fromisoformat,  # time
+    1114: datetime.datetime.fromisoformat,  # timestamp; timestamptz depends on the session time zone
+    2950: uuid.UUID,  # uuid
+}
+
+
+def bind_params(params: Sequence[Any], type_oids: Sequence[int]) -> Optional[List[Any]]:
+    """
+    Parameter values converted for their inferred types, or None when a
+    string can't be passed as the type Postgres inferred for it (the driver
+    sends most types in binary, so '2005-05-24' has to become a date).
+    """
+    bound = []
+    for value, oid in zip(params, type_oids):
+        if isinstance(value, str):
+            parse = PARAM_PARSERS.get(oid)
+            if parse is None:
+                return None
+            try:
+                value = parse(value)
+            except (ValueError, InvalidOperation):
+                return None
+        bound.append(value)
+    return bound
+
+
+class StatementInfo(NamedTuple):
+    columns: List[str]
+    column_types: List[int]  # Result column type OIDs
+    param_types: List[int]  # Parameter type OIDs, as inferred by Postgres
+
+    @classmethod
+    def of(cls, stmt) -> "StatementInfo":
+        """Description of an asyncpg PreparedStatement."""
+        attributes = stmt.get_attributes()
+        return cls([a.name for a in attributes], [a.type.oid for a in attributes],
+                   [p.oid for p in stmt.get_parameters()])
+
+
+class StatementCache:
+    """
+    Templates prepared on each connection, with their descriptions, least
+    recently used first, keyed by the connection's server process id.
+
+    The prepared statements themselves live in asyncpg's per-connection
+    statement cache, which is keyed by query text and survives the
+    connection going back to the pool: a template found here for a
+    connection runs without Postgres parsing and analysing it again, and
+    after a few runs with a generic plan, without planning it either.
+    A connection's entries are dropped when it is closed, e.g. when the pool
+    recycles it, and the total across connections is bounded as well.
+    """
+    def __init__(self, max_size: int = DEFAULT_STATEMENT_CACHE_SIZE, parameterize: bool = True,
+                 max_entries: Optional[int] = None):
+        """
+        Parameters:
+            max_size (int): Templates kept per connection; at most asyncpg's statement_cache_size.
+            parameterize (bool): When False queries run with their literals, so only
+                a query repeated with the same values reuses its statement.
+            max_entries (int): Templates kept across all connections; defaults to
+                max_size for each of DEFAULT_POOL_CONNECTIONS connections.
+        """
+        self.max_size = max_size
+        self.parameterize = parameterize
+        self.max_entries = max_entries or max_size * DEFAULT_POOL_CONNECTIONS
+        self._connections: Dict[int, OrderedDict] = {}
+        self._order: "OrderedDict[Tuple[int, str], None]" = OrderedDict()  # Every entry, least recently used first
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "unparameterized": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, conn, text: str) -> Optional[StatementInfo]:
+        pid = conn.get_server_pid()
+        with self._lock:
+            statements = self._connections.get(pid)
+            info = statements.get(text) if statements is not None else None
+            if info is None:
+                self.stats["misses"] += 1
+                return None
+            statements.move_to_end(text)
+            self._order.move_to_end((pid, text))
+            self.stats["hits"] += 1
+            return info
+
+    def put(self, conn, text: str, info: StatementInfo):
+        pid = conn.get_server_pid()
+        with self._lock:
+            statements = self._connections.get(pid)
+            if statements is None:
+                statements = self._connections[pid] = OrderedDict()
+                # Called with the underlying connection, which outlives each pool checkout
+                conn.add_termination_listener(lambda _: self._forget(pid))
+            statements[text] = info
+            statements.move_to_end(text)
+            self._order[(pid, text)] = None
+            self._order.move_to_end((pid, text))
+            while len(statements) > self.max_size:
+                self._order.pop((pid, statements.popitem(last=False)[0]))
+                self.stats["evictions"] += 1
+            while len(self._order) > self.max_entries:
+                oldest, oldest_text = self._order.popitem(last=False)[0]
+                # The connection's dict stays, even empty, while its listener is registered
+                self._connections[oldest].pop(oldest_text)
+                self.stats["evictions"] += 1
+
+    def _forget(self, pid: int):
+        """Drop the entries of a closed connection."""
+        with self._lock:
+            for text in self._connections.pop(pid, {}):
+                self._order.pop((pid, text), None)
+
+    def bind(self, template: QueryTemplate, info: StatementInfo) -> Optional[List[Any]]:
+        """The template's parameters for its statement, or None if the query has to run with its literals."""
+        args = bind_params(template.params, info.param_types)
+        if args is None:
+            self.count_unparameterized()
+        return args
+
+    def count_unparameterized(self):
+        """Count a query that ran with its literals instead of as its template."""
+        self._count("unparameterized")
+
+    def discard(self, conn, text: str):
+        pid = conn.get_server_pid()
+        with self._lock:
+            if self._connections.get(pid, {}).pop(text, None) is not None:
+                self._order.pop((pid, text), None)
+
+    def clear(self):
+        with self._lock:
+            for statements in self._connections.values():
+                statements.clear()
+            self._order.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._order)
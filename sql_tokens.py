@@ -0,0 +1,150 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import re
+
+# One alternation for the whole lexer, so a query is tokenized in a single pass
+_TOKEN = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<param>\$\d+|%\([^)]+\)s|%s)
+  | (?P<op>::|<>|!=|>=|<=|\|\||[-+*/%<>=~!^&|#@])
+  | (?P<punct>[(),.;\[\]:])
+  | (?P<other>.)
+""", re.S | re.X)
+
+# Words that end a table reference, so they are never taken for an alias
+CLAUSE_KEYWORDS = frozenset("""
+    where join inner left right full outer cross natural on using group order by limit offset having
+    union intersect except window fetch for returning lateral as select from with and or not set values
+""".split())
+
+
+class Token(NamedTuple):
+    kind: str  # string, quoted, word, number, param, op, punct or other
+    text: str
+    start: int
+    end: int
+
+    @property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    def is_word(self, *words: str) -> bool:
+        return self.kind == "word" and self.text.lower() in words
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Tokens of a query with their offsets; whitespace and comments are dropped."""
+    return [Token(m.lastgroup, m.group(), m.start(), m.end())
+            for m in _TOKEN.finditer(sql) if m.lastgroup not in ("space", "comment")]
+
+
+def string_value(token: Token) -> str:
+    """The text of a string literal token, unquoted and unescaped."""
+    return token.text[1:-1].replace("''", "'")
+
+
+def quote_string(value: str) -> str:
+    """A string literal for the value."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def identifier(token: Token) -> Optional[str]:
+    """Name of an identifier token: lower-cased when bare, verbatim when quoted."""
+    if token.kind == "word":
+        return token.text.lower()
+    if token.kind == "quoted":
+        return token.text[1:-1].replace('""', '"')
+    return None
+
+
+def qualified_name(tokens: List[Token], i: int) -> Tuple[List[str], int]:
+    """Parts of a dotted name starting at tokens[i] and the index just past it."""
+    parts = []
+    while i < len(tokens):
+        name = identifier(tokens[i])
+        if name is None:
+            break
+        parts.append(name)
+        if i + 2 < len(tokens) and tokens[i + 1].text == "." and identifier(tokens[i + 2]) is not None:
+            i += 2
+        else:
+            i += 1
+            break
+    return parts, i
+
+
+class TableReference(NamedTuple):
+    parts: List[str]  # Qualified name, e.g. ['public', 'film']
+    alias: Optional[str]
+    start: int  # Index of the name's first token
+    end: int  # Index just past the name (before any alias)
+
+    @property
+    def table(self) -> str:
+        return self.parts[-1]
+
+
+def table_references(tokens: List[Token]) -> List[TableReference]:
+    """
+    Tables named in FROM lists and JOIN clauses anywhere in the query, with
+    their aliases. Subqueries are skipped; function calls are included (the
+    token after the name is '('). FROM inside function syntax such as
+    EXTRACT(YEAR FROM ...) or TRIM(... FROM ...) is not a table reference.
+    """
+    # Token after the '(' enclosing each token, None at the top level
+    first_in_group: List[Optional[Token]] = []
+    stack: List[int] = []
+    for j, token in enumerate(tokens):
+        first_in_group.append(tokens[stack[-1] + 1] if stack else None)
+        if token.text == "(":
+            stack.append(j)
+        elif token.text == ")" and stack:
+            stack.pop()
+
+    references: List[TableReference] = []
+    i, n = 0, len(tokens)
+    while i < n:
+        if not tokens[i].is_word("from", "join"):
+            i += 1
+            continue
+        enclosing = first_in_group[i]
+        if enclosing is not None and not enclosing.is_word("select", "with", "values"):
+            i += 1
+            continue
+        i += 1
+        while i < n:
+            if tokens[i].is_word("lateral", "only"):
+                i += 1
+            parts, j = qualified_name(tokens, i)
+            if not parts or parts[-1] in CLAUSE_KEYWORDS:
+                break  # Subquery, function call or empty FROM
+            start, end, alias = i, j, None
+            if j < n and tokens[j].is_word("as"):
+                j += 1
+            if j < n and identifier(tokens[j]) is not None and tokens[j].lower not in CLAUSE_KEYWORDS:
+                alias = identifier(tokens[j])
+                j += 1
+            references.append(TableReference(parts, alias, start, end))
+            i = j
+            if i < n and tokens[i].text == ",":
+                i += 1  # Next table of a FROM list
+                continue
+            break
+    return references
+
+
+def table_aliases(tokens: List[Token]) -> Dict[str, str]:
+    """
+    Map of every name a table is referred to by (its alias and its own name)
+    to the table, from FROM lists and JOIN clauses anywhere in the query.
+    """
+    aliases: Dict[str, str] = {}
+    for reference in table_references(tokens):
+        aliases.setdefault(reference.table, reference.table)
+        if reference.alias is not None:
+            aliases[reference.alias] = reference.table
+    return aliases
@@ -0,0 +1,227 @@
+from collections import defaultdict
+from difflib import get_close_matches
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+import re
+import threading
+from sql_tokens import Token, tokenize, identifier, table_references, CLAUSE_KEYWORDS
+from sql_execution import is_cursor_statement
+
+try:
+    import sqlglot
+    from sqlglot.errors import ParseError, TokenError
+    _HAS_SQLGLOT = True
+except ImportError:  # Syntax is checked with the lexer only
+    _HAS_SQLGLOT = False
+
+# Markdown fences with any language tag, e.g. ```postgresql
+_FENCE = re.compile(r"```[A-Za-z]*")
+# Start of the query when the model wrote something before it
+_QUERY_START = re.compile(r"(?im)^\s*(select|with)\b")
+
+
+class ValidationResult(NamedTuple):
+    sql: str  # The query after repairs
+    errors: List[str]  # Problems that need the LLM; empty when the query looks valid
+    repairs: List[str]  # What was fixed locally
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+def _hint(name: str, candidates) -> str:
+    matches = get_close_matches(name, list(candidates), n=3, cutoff=0.6)
+    return f" (did you mean {', '.join(matches)}?)" if matches else ""
+
+
+def _derived_names(tokens: List[Token]) -> Set[str]:
+    """CTE names and aliases of subqueries and expressions, whose columns aren't in the schema."""
+    names = set()
+    for i, token in enumerate(tokens):
+        name = identifier(token)
+        # name AS (   -- a CTE
+        if name is not None and i + 2 < len(tokens) and tokens[i + 1].is_word("as") and tokens[i + 2].text == "(":
+            names.add(name)
+        # ) [AS] name  -- a subquery alias (expression aliases are collected too, harmlessly)
+        if token.text == ")":
+            j = i + 1
+            if j < len(tokens) and tokens[j].is_word("as"):
+                j += 1
+            if j < len(tokens) and identifier(tokens[j]) is not None and tokens[j].lower not in CLAUSE_KEYWORDS:
+                names.add(identifier(tokens[j]))
+    return names
+
+
+class SQLValidator:
+    """
+    Checks generated SQL against the schema before it is sent to the
+    database, and repairs what needs no LLM.
+
+    Repairs: markdown fences with any language tag and text before the query,
+    and column qualifiers that name the wrong table when exactly one table in
+    the query has the column (also a table's name used where it was aliased,
+    and aliases that were never defined).
+
+    Errors: unbalanced parentheses, unterminated literals, several
+    statements, unknown tables and views, unknown qualified columns and, when sqlglot
+    is installed, anything its PostgreSQL parser rejects.
+
+    Unqualified columns aren't checked: output aliases and correlated
+    references make them ambiguous without full name resolution. Only
+    SELECT-like statements are checked.
+    """
+    def __init__(self, schema: Dict[str, Dict[str, Any]], views: Optional[Dict[str, List[str]]] = None):
+        """
+        Parameters:
+            schema (Dict[str, Dict[str, Any]]): Structured schema from DVDRentalInspector.load_schema().
+            views (Dict[str, List[str]]): Columns of views and materialized views, from
+                DVDRentalInspector.get_view_columns(); queries may use them like tables.
+        """
+        self.columns = {table: {column["name"] for column in info.get("columns", [])}
+                        for table, info in schema.items()}
+        for view, columns in (views or {}).items():
+            self.columns.setdefault(view, set(columns))
+        self._lock = threading.Lock()
+        self.stats = {"validated": 0, "repaired": 0, "rejected": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    @staticmethod
+    def strip_markup(sql: str, repairs: List[str]) -> str:
+        """The query without markdown fences, wrapping backticks or text before it."""
+        cleaned = _FENCE.sub("", sql).strip().strip("`").strip()
+        if cleaned != sql.strip():
+            repairs.append("removed markdown fences")
+        if not is_cursor_statement(cleaned):
+            match = _QUERY_START.search(cleaned)
+            if match:
+                cleaned = cleaned[match.start():].strip()
+                repairs.append("removed text before the query")
+        return cleaned
+
+    @staticmethod
+    def syntax_errors(sql: str, tokens: List[Token]) -> List[str]:
+        errors = []
+        depth = 0
+        for token in tokens:
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                depth -= 1
+                if depth < 0:
+                    errors.append(f"syntax error: unmatched ')' at position {token.start}")
+                    break
+        if depth > 0:
+            errors.append(f"syntax error: {depth} unclosed '('")
+        for token in tokens:
+            if token.kind == "other" and token.text in "'\"":
+                kind = "string literal" if token.text == "'" else "quoted identifier"
+                errors.append(f"syntax error: unterminated {kind} at position {token.start}")
+                break
+        for i, token in enumerate(tokens[:-1]):
+            if token.text == ";" and any(t.text != ";" for t in tokens[i + 1:]):
+                errors.append("several statements; only one query can be run")
+                break
+        if not errors and _HAS_SQLGLOT:
+            try:
+                sqlglot.parse_one(sql, read="postgres")
+            except (ParseError, TokenError) as e:
+                errors.append(f"syntax error: {str(e).splitlines()[0]}")
+        return errors
+
+    def _reference_errors(self, tokens: List[Token], edits: Dict[int, str], repairs: List[str]) -> List[str]:
+        errors = []
+        references = table_references(tokens)
+        derived = _derived_names(tokens)
+        # Every name each table is reachable by in some scope; an alias reused across scopes maps to several
+        bindings: Dict[str, Set[str]] = defaultdict(set)
+        aliases_of: Dict[str, Set[str]] = defaultdict(set)
+        unaliased: Set[str] = set()
+        name_spans = set()
+        for ref in references:
+            name_spans.update(range(ref.start, ref.end))
+            if (ref.end < len(tokens) and tokens[ref.end].text == "(") or (len(ref.parts) > 1 and ref.parts[0] != "public") \
+                    or (len(ref.parts) == 1 and ref.table.startswith("pg_")):
+                # Set-returning function or a table outside the schema (pg_catalog is always on the
+                # search path, so pg_stat_user_tables needs no qualifier): left to the database
+                derived.update(name for name in (ref.table, ref.alias) if name)
+                continue
+            if ref.table not in self.columns and ref.table not in derived:
+                errors.append(f'relation "{ref.table}" does not exist{_hint(ref.table, self.columns)}')
+                continue
+            if ref.alias is None:
+                unaliased.add(ref.table)
+                bindings[ref.table].add(ref.table)
+            else:
+                bindings[ref.alias].add(ref.table)
+                aliases_of[ref.table].add(ref.alias)
+
+        in_query = {table for tables in bindings.values() for table in tables if table in self.columns}
+
+        def names_for(table: str) -> Set[str]:
+            return aliases_of[table] | ({table} if table in unaliased else set())
+
+        for i in range(len(tokens) - 2):
+            if i in name_spans or tokens[i + 1].text != "." or (i > 0 and tokens[i - 1].text == "."):
+                continue
+            qualifier, column = identifier(tokens[i]), identifier(tokens[i + 2])
+            if qualifier is None or column is None or (i + 3 < len(tokens) and tokens[i + 3].text in (".", "(")):
+                continue  # a.*, schema.function(...) or a three-part name
+
+            tables = bindings.get(qualifier)
+            if tables is None and qualifier in aliases_of and len(aliases_of[qualifier]) == 1:
+                # Table name used where the table was given an alias
+                alias = next(iter(aliases_of[qualifier]))
+                edits[i] = alias
+                repairs.append(f"{qualifier}.{column} -> {alias}.{column}")
+                qualifier, tables = alias, bindings[alias]
+            if tables is not None and (len(tables) > 1 or not tables <= self.columns.keys()):
+                continue  # Scoped differently in different parts of the query, or a CTE/subquery
+            if tables is None and qualifier in derived:
+                continue
+            if tables is not None and column in self.columns[next(iter(tables))]:
+                continue
+
+            # Wrong or undefined qualifier: fixable when exactly one table in the query has the column
+            owners = [table for table in in_query if column in self.columns[table]]
+            target = names_for(owners[0]) if len(owners) == 1 else set()
+            if len(target) == 1:
+                name = next(iter(target))
+                edits[i] = name
+                repairs.append(f"{qualifier}.{column} -> {name}.{column}")
+            elif tables is None:
+                errors.append(f'missing FROM-clause entry for table "{qualifier}" (in {qualifier}.{column})')
+            else:
+                table = next(iter(tables))
+                errors.append(f'column {qualifier}.{column} does not exist: table {table} has no column '
+                              f'"{column}"{_hint(column, self.columns[table])}')
+        return errors
+
+    def validate(self, sql: str) -> ValidationResult:
+        """Repair what can be repaired locally and report what can't."""
+        repairs: List[str] = []
+        sql = self.strip_markup(sql, repairs)
+        if not sql:
+            self._count("rejected")
+            return ValidationResult(sql, ["empty query"], repairs)
+        if not is_cursor_statement(sql):
+            return ValidationResult(sql, [], repairs)
+
+        tokens = tokenize(sql)
+        errors = self.syntax_errors(sql, tokens)
+        edits: Dict[int, str] = {}
+        if not errors:
+            errors = self._reference_errors(tokens, edits, repairs)
+        if edits:
+            # Apply right to left so earlier offsets stay valid
+            for i in sorted(edits, reverse=True):
+                sql = sql[:tokens[i].start] + edits[i] + sql[tokens[i].end:]
+
+        self._count("validated")
+        if errors:
+            self._count("rejected")
+        elif repairs:
+            self._count("repaired")
+        return ValidationResult(sql, errors, repairs)
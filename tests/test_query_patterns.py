@@ -0,0 +1,49 @@
+from query_patterns import ValuePatternExtractor, discover_columns_to_check
+
+
+class FakeInspector:
+    def load_schema(self):
+        return {"film": {
+            "foreign_keys": [],
+            "columns": [
+                {"name": "title", "type": "text"},
+                {"name": "special_features", "type": "text[]"},
+                {"name": "tags", "type": "character varying[]"},
+                {"name": "rating", "type": "character varying(10)"},
+            ],
+        }}
+
+    def get_column_stats(self):
+        stats = {"n_distinct": 5, "avg_width": 20}
+        return {"film": {name: stats for name in ("title", "special_features", "tags", "rating")}}
+
+
+def test_array_columns_are_not_value_recovery_candidates():
+    columns = discover_columns_to_check(FakeInspector())
+    assert sorted(columns) == [("film", "rating"), ("film", "title")]
+
+
+class FakeExtractor(ValuePatternExtractor):
+    VALUES = {("customer", "first_name"): ["JOHN", "JANE"], ("customer", "last_name"): ["JOHNSON", "SMITH"],
+              ("film", "title"): ["ALIEN CENTER"], ("film", "description"): ["A THOUGHTFUL DRAMA"]}
+
+    def __init__(self):
+        super().__init__(list(self.VALUES), {}, pool=object())
+
+    def _fetch_column_values(self, column_name, table_name):
+        return self.VALUES[(table_name, column_name)]
+
+
+def test_recovery_binds_each_suggestion_to_its_column():
+    query, _ = FakeExtractor().recover_query(
+        "SELECT * FROM customer c WHERE c.first_name = 'Jon' OR c.last_name = 'Jon'")
+    assert query == "SELECT * FROM customer c WHERE c.first_name = 'JOHN' OR c.last_name = 'JOHNSON'"
+
+
+def test_recovery_leaves_other_columns_with_the_same_literal():
+    extractor = FakeExtractor()
+    suggestions = {"film.title": {"matches": [("ALIEN CENTER", 91)], "original": "ALIEN CENTR",
+                                  "table": "film", "column": "title"}}
+    query = extractor.generate_recovery_query(
+        "SELECT * FROM film WHERE title = 'ALIEN CENTR' OR description = 'ALIEN CENTR'", suggestions)
+    assert query == "SELECT * FROM film WHERE title = 'ALIEN CENTER' OR description = 'ALIEN CENTR'"
@@ -0,0 +1,27 @@
+from result_cache import canonicalize_sql, referenced_tables, table_names
+
+
+def tables(sql):
+    return table_names(canonicalize_sql(sql))
+
+
+def test_comma_joined_from_list_names_every_table():
+    sql = ("SELECT f.title FROM film f, film_category fc, category c "
+           "WHERE f.film_id = fc.film_id AND fc.category_id = c.category_id")
+    assert tables(sql) == {"film", "film_category", "category"}
+
+
+def test_from_inside_extract_is_not_a_table():
+    sql = "SELECT EXTRACT(YEAR FROM rental_date) AS year, count(*) FROM rental GROUP BY 1"
+    assert tables(sql) == {"rental"}
+    assert referenced_tables(canonicalize_sql(sql)) == {"rental"}
+
+
+def test_lateral_is_not_a_table():
+    sql = "SELECT f.title, x.n FROM film f, LATERAL (SELECT count(*) AS n FROM inventory i WHERE i.film_id = f.film_id) x"
+    assert tables(sql) == {"film", "inventory"}
+
+
+def test_ctes_and_functions_are_excluded():
+    sql = "WITH recent AS (SELECT * FROM rental) SELECT * FROM recent JOIN generate_series(1, 3) g ON true"
+    assert tables(sql) == {"rental"}
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+from sql_execution import astream_query
+from sql_templates import StatementCache, StatementInfo, parameterize
+
+
+def test_repeated_expression_shares_its_parameter():
+    sql = ("SELECT CASE WHEN length > 100 THEN 'long' ELSE 'short' END AS kind, count(*) FROM film "
+           "GROUP BY CASE WHEN length > 100 THEN 'long' ELSE 'short' END")
+    template = parameterize(sql)
+    assert template.params == [100]
+    assert template.text.count("$1::integer") == 2
+    assert "$2" not in template.text
+
+
+def test_repeated_numeric_comparison_shares_its_parameter():
+    template = parameterize("SELECT rental_rate > 2.99 AS pricey, count(*) FROM film GROUP BY rental_rate > 2.99")
+    assert template.text == "SELECT rental_rate > $1::numeric AS pricey, count(*) FROM film GROUP BY rental_rate > $1::numeric"
+
+
+def test_literal_compared_with_two_columns_has_a_parameter_per_column():
+    template = parameterize("SELECT * FROM film WHERE title = 'ALIEN CENR' OR description = 'ALIEN CENR'")
+    assert template.text == "SELECT * FROM film WHERE title = $1 OR description = $2"
+    assert template.columns == [["title"], ["description"]]
+    assert template.substitute({0: "ALIEN CENTER"}).sql == \
+        "SELECT * FROM film WHERE title = 'ALIEN CENTER' OR description = 'ALIEN CENR'"
+
+
+class FakeStatement:
+    def __init__(self, sql):
+        self.sql = sql
+
+    def get_attributes(self):
+        return [SimpleNamespace(name="count", type=SimpleNamespace(oid=20))]
+
+    def get_parameters(self):
+        return []
+
+    async def cursor(self, *args):
+        return self
+
+    async def fetch(self, *args):
+        return [(1,)]
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def start(self):
+        self.conn.transactions.append("start")
+
+    async def commit(self):
+        self.conn.transactions.append("commit")
+
+    async def rollback(self):
+        self.conn.transactions.append("rollback")
+
+
+class FakeConnection:
+    """Prepares only queries without parameters, like a template Postgres can't type."""
+    def __init__(self, pid=1):
+        self.pid = pid
+        self.listeners = []
+        self.prepared = []
+        self.transactions = []
+        self.readonly = []
+
+    def get_server_pid(self):
+        return self.pid
+
+    def add_termination_listener(self, callback):
+        self.listeners.append(callback)
+
+    def close(self):
+        for callback in self.listeners:
+            callback(self)
+
+    async def prepare(self, sql):
+        self.prepared.append(sql)
+        if "$1" in sql:
+            raise RuntimeError("operator does not exist: integer = text")
+        return FakeStatement(sql)
+
+    async def cursor(self, sql, *args):
+        return FakeStatement(sql)
+
+    def transaction(self, readonly=False):
+        self.readonly.append(readonly)
+        return FakeTransaction(self)
+
+
+def test_template_that_fails_to_prepare_runs_with_its_literals():
+    conn, statements = FakeConnection(), StatementCache()
+    sql = "SELECT count(*) FROM film WHERE title = '1' OR film_id = '1'"
+    columns, rows, truncated = asyncio.run(astream_query(conn, sql, statements=statements))
+    assert (columns, rows, truncated) == (["count"], [(1,)], False)
+    assert conn.prepared == [parameterize(sql).text, sql]
+    assert statements.stats["unparameterized"] == 1
+    assert len(statements) == 1  # The literal query, run through the connection's own statement cache
+
+
+def test_generated_query_runs_read_only_and_is_rolled_back():
+    conn = FakeConnection()
+    asyncio.run(astream_query(conn, "WITH d AS (DELETE FROM rental RETURNING *) SELECT count(*) FROM d"))
+    asyncio.run(astream_query(conn, "DELETE FROM rental"))
+    assert conn.readonly == [True, True]
+    assert conn.transactions == ["start", "rollback"] * 2
+
+
+def test_closed_connection_drops_its_statements():
+    statements = StatementCache()
+    first, second = FakeConnection(1), FakeConnection(2)
+    for conn in (first, second, first):
+        asyncio.run(astream_query(conn, "SELECT count(*) FROM film", statements=statements))
+    assert len(statements) == 2 and statements.stats["hits"] == 1
+    assert len(first.listeners) == 1
+    first.close()
+    assert len(statements) == 1
+    assert statements.get(first, "SELECT count(*) FROM film") is None
+
+
+def test_statements_are_bounded_across_connections():
+    statements = StatementCache(max_size=2, max_entries=3)
+    info = StatementInfo([], [], [])
+    for pid in range(1, 4):
+        for text in ("a", "b", "c"):
+            statements.put(FakeConnection(pid), text, info)
+    assert len(statements) == 3
+    assert statements.stats["evictions"] == 6
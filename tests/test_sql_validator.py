@@ -0,0 +1,17 @@
+from sql_validator import SQLValidator
+
+SCHEMA = {"film": {"columns": [{"name": "film_id"}, {"name": "title"}]}}
+VIEWS = {"film_list": ["fid", "title", "category"]}
+
+
+def test_views_are_known_relations():
+    validator = SQLValidator(SCHEMA, VIEWS)
+    assert validator.validate("SELECT * FROM film_list").valid
+    assert validator.validate("SELECT fl.title FROM film_list fl WHERE fl.category = 'Action'").valid
+    assert validator.validate("SELECT fl.rating FROM film_list fl").errors
+
+
+def test_system_catalogs_are_left_to_the_database():
+    validator = SQLValidator(SCHEMA)
+    assert validator.validate("SELECT relname, n_live_tup FROM pg_stat_user_tables").valid
+    assert validator.validate("SELECT * FROM flim").errors
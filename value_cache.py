@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Iterable, Optional, Tuple
+import threading
+import time
+from value_index import ValueIndex
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL = 3600.0
+DEFAULT_WARM_UP_WORKERS = 4
+
+
+@dataclass
+class CachedColumn:
+    index: ValueIndex
+    nbytes: int
+    ttl: float
+    loaded: float = field(default_factory=time.monotonic)
+
+
+class ValueCache:
+    """
+    Memory-bounded cache of per-column value indexes for fuzzy value recovery.
+
+    Each column's distinct values are loaded once and kept as a ValueIndex
+    (interned, deduplicated, upper-cased). Entries expire after their column's
+    TTL and are evicted least recently used once the total estimated size
+    exceeds max_bytes. Concurrent misses on the same column share one load.
+    """
+    def __init__(self, loader: Callable[[str, str], List[str]], max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL, column_ttls: Optional[Dict[str, float]] = None):
+        """
+        Parameters:
+            loader: Returns the distinct values of (column_name, table_name).
+            max_bytes (int): Budget for the estimated size of all cached indexes.
+            ttl (float): Seconds a column's values stay valid.
+            column_ttls: Per-column TTL overrides keyed by 'table.column'.
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.column_ttls = dict(column_ttls or {})
+        self._entries: "OrderedDict[str, CachedColumn]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0, "oversized": 0, "load_time_total": 0.0}
+
+    @staticmethod
+    def key(column_name: str, table_name: str) -> str:
+        return f"{table_name}.{column_name}"
+
+    def _lookup(self, key: str) -> Optional[ValueIndex]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.loaded > entry.ttl:
+                self._remove(key)
+                self.stats["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry.index
+
+    def get(self, column_name: str, table_name: str) -> ValueIndex:
+        """Index over the column's values, loading it on a miss or after expiry. Loader errors propagate."""
+        key = self.key(column_name, table_name)
+        index = self._lookup(key)
+        if index is not None:
+            return index
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            index = self._lookup(key)  # Loaded by another thread while we waited
+            if index is not None:
+                return index
+            start = time.perf_counter()
+            index = ValueIndex(self.loader(column_name, table_name))
+            with self._lock:
+                self.stats["misses"] += 1
+                self.stats["load_time_total"] += time.perf_counter() - start
+            self._store(key, index)
+            return index
+
+    def _store(self, key: str, index: ValueIndex):
+        nbytes = index.nbytes
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                self.stats["oversized"] += 1  # Served to this caller but never kept
+                return
+            self._entries[key] = CachedColumn(index=index, nbytes=nbytes, ttl=self.column_ttls.get(key, self.ttl))
+            self._size += nbytes
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.nbytes
+
+    def warm_up(self, columns: Iterable[Tuple[str, str]], max_workers: int = DEFAULT_WARM_UP_WORKERS):
+        """Load the given (table, column) pairs in parallel; failures are reported and skipped."""
+        def load(table_column: Tuple[str, str]):
+            table, column = table_column
+            try:
+                self.get(column, table)
+            except Exception as e:
+                print(f"Error warming up values for {table}.{column}: {str(e)}")
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="value-cache-warm-up") as pool:
+            list(pool.map(load, columns))
+
+    def start_warm_up(self, columns: Iterable[Tuple[str, str]], max_workers: int = DEFAULT_WARM_UP_WORKERS) -> threading.Thread:
+        """Run warm_up in a daemon thread so startup doesn't wait for it."""
+        thread = threading.Thread(target=self.warm_up, args=(list(columns), max_workers),
+                                  name="value-cache-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, column_name: str, table_name: str):
+        with self._lock:
+            self._remove(self.key(column_name, table_name))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+import sys
+import numpy as np
+
+from fuzzywuzzy import fuzz
+
+try:
+    from rapidfuzz import fuzz as rfuzz, process, utils
+    _HAS_RAPIDFUZZ = True
+except ImportError:  # Score with fuzzywuzzy alone
+    _HAS_RAPIDFUZZ = False
+
+DEFAULT_THRESHOLD = 50
+MAX_MATCHES = 5
+BRUTE_FORCE_LIMIT = 5000  # Below this, score every value; above, prune with trigrams first
+TRIGRAM_CANDIDATES = 256
+
+
+def estimate_nbytes(count: float, avg_width: float, brute_force_limit: int = BRUTE_FORCE_LIMIT) -> int:
+    """Rough ValueIndex.nbytes for a column of count distinct values averaging avg_width bytes."""
+    per_value = 200 + avg_width  # String object, array slots and word postings
+    if count > brute_force_limit:
+        per_value += 4 * (avg_width + 2)  # Trigram postings
+    return int(count * per_value)
+
+
+def _trigrams(value: str) -> List[str]:
+    padded = f"  {value} "
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class ValueIndex:
+    """
+    Index over the distinct values of one column for fuzzy lookups.
+
+    Values are upper-cased, deduplicated and interned once at build time, so
+    lookups never re-normalize them and equal values across columns share memory. Lookups follow the
+    same rules as ValuePatternExtractor.find_similar_values always has:
+    values sharing a whole word with the search value are ranked by
+    token_sort_ratio and all of those above the threshold are returned; otherwise
+    the best of ratio/partial_ratio/token_sort_ratio/token_set_ratio is used and
+    the top 5 above the threshold are returned.
+
+    Candidate generation is sublinear: a word -> values inverted index serves the
+    shared-word rule, and for large columns a trigram inverted index narrows the
+    fuzzy rule to the values sharing the most trigrams with the search value.
+    Candidates are scored in batch with rapidfuzz when it is installed, with
+    fuzzywuzzy's scores reproduced exactly.
+    """
+    def __init__(self, values: Iterable[str], brute_force_limit: int = BRUTE_FORCE_LIMIT,
+                 trigram_candidates: int = TRIGRAM_CANDIDATES):
+        """
+        Parameters:
+            values: The column's values.
+            brute_force_limit (int): Columns up to this size are scored exhaustively.
+            trigram_candidates (int): Values kept after trigram pruning on larger columns.
+        """
+        self.values: List[str] = list(dict.fromkeys(sys.intern(str(v).upper()) for v in values))
+        self._values_array = np.array(self.values, dtype=object)
+        self.brute_force_limit = brute_force_limit
+        self.trigram_candidates = trigram_candidates
+
+        words: Dict[str, List[int]] = defaultdict(list)
+        for i, value in enumerate(self.values):
+            for word in set(value.split()):
+                words[word].append(i)
+        self._words = {word: np.array(ids, dtype=np.int32) for word, ids in words.items()}
+
+        self._trigrams: Dict[str, np.ndarray] = {}
+        self._trigram_counts = np.empty(0, dtype=np.int32)
+        if len(self.values) > brute_force_limit:
+            postings: Dict[str, List[int]] = defaultdict(list)
+            counts = np.empty(len(self.values), dtype=np.int32)
+            for i, value in enumerate(self.values):
+                grams = _trigrams(value)
+                counts[i] = len(grams)
+                for gram in grams:
+                    postings[gram].append(i)
+            self._trigrams = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+            self._trigram_counts = counts
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the index: the strings, the value arrays and the postings."""
+        size = sum(sys.getsizeof(v) for v in self.values)
+        size += sys.getsizeof(self.values) + self._values_array.nbytes + self._trigram_counts.nbytes
+        for postings in (self._words, self._trigrams):
+            size += sys.getsizeof(postings) + sum(sys.getsizeof(k) + a.nbytes for k, a in postings.items())
+        return size
+
+    def _scores(self, scorer: str, value: str, ids: np.ndarray) -> np.ndarray:
+        """Scores of the given values against the search value, rounded like fuzzywuzzy's."""
+        candidates = self._values_array[ids].tolist()
+        if not _HAS_RAPIDFUZZ:
+            return np.array([getattr(fuzz, scorer)(value, c) for c in candidates], dtype=np.float32)
+        # fuzzywuzzy pre-processes strings for the token scorers only
+        processor = utils.default_process if scorer.startswith("token") else None
+        scores = process.cdist([value], candidates, scorer=getattr(rfuzz, scorer), processor=processor, workers=-1)[0]
+        return np.rint(scores).astype(np.float32)
+
+    def _ranked(self, ids: np.ndarray, scores: np.ndarray, threshold: float, limit=None) -> List[Tuple[str, int]]:
+        keep = scores >= threshold
+        ids, scores = ids[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [(self.values[ids[i]], int(scores[i])) for i in order]
+
+    def _best_fuzzy(self, value: str, ids: np.ndarray, threshold: float) -> np.ndarray:
+        """
+        max(ratio, partial_ratio, token_sort_ratio, token_set_ratio) for the candidates
+        that can reach the top matches; the rest are left at their lower bound.
+
+        rapidfuzz's partial_ratio searches every alignment, so it bounds fuzzywuzzy's
+        heuristic partial_ratio from above. Candidates are visited best bound first
+        and the exact fuzzywuzzy partial_ratio is only computed until no remaining
+        bound can beat the current top matches.
+        """
+        best = self._scores("ratio", value, ids)
+        for scorer in ("token_sort_ratio", "token_set_ratio"):
+            np.maximum(best, self._scores(scorer, value, ids), out=best)
+        if not _HAS_RAPIDFUZZ:
+            return np.maximum(best, self._scores("partial_ratio", value, ids))
+
+        partial_bound = np.ceil(process.cdist([value], self._values_array[ids].tolist(), scorer=rfuzz.partial_ratio,
+                                              workers=-1)[0]).astype(np.float32)
+        bound = np.maximum(best, partial_bound)
+        top: List[float] = []
+        for i in np.argsort(-bound, kind="stable"):
+            if bound[i] < threshold or (len(top) >= MAX_MATCHES and bound[i] < top[MAX_MATCHES - 1]):
+                break
+            if partial_bound[i] > best[i]:
+                best[i] = max(best[i], fuzz.partial_ratio(value, self.values[ids[i]]))
+            if best[i] >= threshold:
+                top = sorted(top + [best[i]], reverse=True)[:MAX_MATCHES]
+        return best
+
+    def _fuzzy_candidates(self, value: str) -> np.ndarray:
+        if not self._trigrams:
+            return np.arange(len(self.values), dtype=np.int32)
+        grams = _trigrams(value)
+        postings = [self._trigrams[g] for g in grams if g in self._trigrams]
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+        ids, shared = np.unique(np.concatenate(postings), return_counts=True)
+        if len(ids) > self.trigram_candidates:
+            # Share of the shorter string's trigrams found in the other, mirroring
+            # partial_ratio's alignment of the shorter string inside the longer one
+            overlap = shared / np.minimum(self._trigram_counts[ids], len(grams))
+            top = np.lexsort((-shared, -overlap))[:self.trigram_candidates]
+            ids = np.sort(ids[top])  # Ties keep column order, as in a full scan
+        return ids
+
+    def search(self, value: str, threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Values similar to the given one as (value, score) pairs, best first."""
+        if not value or not self.values:
+            return []
+        value = value.upper()
+
+        # Try exact token matching first
+        shared = [self._words[w] for w in set(value.split()) if w in self._words]
+        if shared:
+            ids = np.unique(np.concatenate(shared))
+            matches = self._ranked(ids, self._scores("token_sort_ratio", value, ids), threshold)
+            if matches:
+                return matches
+
+        # Use multiple fuzzy matching strategies, taking the highest score
+        ids = self._fuzzy_candidates(value)
+        if len(ids) == 0:
+            return []
+        return self._ranked(ids, self._best_fuzzy(value, ids, threshold), threshold, limit=MAX_MATCHES)